@@ -4,7 +4,9 @@ import os
 from datetime import datetime, timedelta
 
 import boto3
-from PIL import Image
+from common.asset_cache import AssetCache
+from common.compositing import composite
+from common.image_encoder import encode_image, resolve_profile
 
 logger = logging.getLogger(__name__)
 formatter = logging.Formatter(
@@ -21,8 +23,12 @@ ORIGINAL_IMAGE_BUCKET_NAME = os.environ["ORIGINAL_IMAGE_BUCKET_NAME"]
 BOUQUET_BUCKET_NAME = os.environ["BOUQUET_BUCKET_NAME"]
 GENERATIVE_AI_TABLE_NAME = os.environ["GENERATIVE_AI_TABLE_NAME"]
 BOUQUET_TABLE_NAME = os.environ["BOUQUET_TABLE_NAME"]
+# 出力先のキー（.png）と bouquet_get がPNGを前提とするため、PNGのプロファイルに限る
+IMAGE_ENCODER_PROFILE = resolve_profile(formats=("PNG",))
 
 bouquet_table = dynamodb.Table(BOUQUET_TABLE_NAME)
+# 包み紙と花の元画像はウォームコンテナ間で使い回す
+asset_cache = AssetCache(s3_client=s3)
 
 
 class DecideFlowerPos:
@@ -809,19 +815,18 @@ class MkBouquet(DecideFlowerPos):
         """
 
         self.set_bouquet_parts()
-        bouquet = self.flower_images[0]
         flower_position = self.flowers_pattern_matching()
 
         if not flower_position:
             logger.info("Error: No matching position pattern found.")
             return None
 
-        for i, pos in enumerate(flower_position):
-            x, y = pos
-            flower_image = self.flower_images[i + 1]
-            bouquet.paste(flower_image, (x, y), flower_image)
-
-        return bouquet
+        # 包み紙を土台に、花を配置位置の順に合成
+        layers = [
+            (flower_image, (x, y))
+            for flower_image, (x, y) in zip(self.flower_images[1:], flower_position)
+        ]
+        return composite(layers, base=self.flower_images[0])
 
     def set_bouquet_parts(self):
         """
@@ -853,11 +858,9 @@ class MkBouquet(DecideFlowerPos):
             key (str): S3バケット内の画像キー
 
         Returns:
-            Image: ロードされた画像
+            Image: ロードされた画像（キャッシュと共有されるため変更しないこと）
         """
-        obj = s3.get_object(Bucket=ORIGINAL_IMAGE_BUCKET_NAME, Key=key)
-        img = Image.open(obj["Body"]).convert("RGBA")
-        return img
+        return asset_cache.get_image(ORIGINAL_IMAGE_BUCKET_NAME, key)
 
 
 def get_week_dates(date):
@@ -977,15 +980,17 @@ def lambda_handler(event, context):
 
 def save_bouquet_to_s3(bouquet_image, key):
     """
-    花束の画像を一時保存し、S3バケットにアップロードする。
+    花束の画像を環境変数 IMAGE_ENCODER_PROFILE のPNGプロファイルでエンコードし、
+    S3バケットにアップロードする。
 
     Args:
         bouquet_image (Image): 作成された花束の画像
         key (str): S3バケット内の保存キー
     """
-    temp_file_path = f"/tmp/{key.split('/')[-1]}"
-    bouquet_image.save(temp_file_path, format="PNG")
-    s3.upload_file(temp_file_path, BOUQUET_BUCKET_NAME, key)
+    body, content_type = encode_image(bouquet_image, IMAGE_ENCODER_PROFILE)
+    s3.put_object(
+        Bucket=BOUQUET_BUCKET_NAME, Key=key, Body=body, ContentType=content_type
+    )
 
 
 def create_response(status_code, body):
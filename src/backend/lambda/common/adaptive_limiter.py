@@ -0,0 +1,127 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from common.circuit_breaker import is_degradation
+from common.metrics import put_metrics
+
+logger = logging.getLogger(__name__)
+
+# 同時実行数の上限の初期値
+DEFAULT_INITIAL_LIMIT = 4
+# 同時実行数の上限の最大値
+DEFAULT_MAX_LIMIT = 16
+# 失敗または遅延した場合に上限に掛ける係数
+DECREASE_FACTOR = 0.5
+# 空きを待つ上限（秒）
+DEFAULT_ACQUIRE_TIMEOUT_SECONDS = 5.0
+
+
+class ConcurrencyLimitExceededError(Exception):
+    """同時実行数の上限に空きがなかったことを表す例外"""
+
+
+class AdaptiveLimiter:
+    """
+    外部APIへの同時リクエスト数を AIMD（加算増加・乗算減少）で調整するリミッター。
+
+    応答が目標の時間内に成功するたびに上限を少しずつ増やし（1周ごとに+1）、
+    失敗するか目標の時間を超えた場合は上限を半分にする。
+    上限はコンテナ内のスレッド間で共有し、上限が減った場合はメトリクスとして出力する。
+
+    Attributes:
+        name (str): ログとメトリクスに出力する外部APIの名前
+        limit (float): 現在の同時実行数の上限
+        min_limit (int): 同時実行数の上限の最小値
+        max_limit (int): 同時実行数の上限の最大値
+        latency_target (float): 成功とみなす応答時間の上限（秒）
+        acquire_timeout (float): 空きを待つ上限（秒）
+    """
+
+    def __init__(
+        self,
+        name,
+        latency_target,
+        initial_limit=DEFAULT_INITIAL_LIMIT,
+        min_limit=1,
+        max_limit=DEFAULT_MAX_LIMIT,
+        acquire_timeout=DEFAULT_ACQUIRE_TIMEOUT_SECONDS,
+    ):
+        """
+        AdaptiveLimiterの初期化メソッド。
+
+        Args:
+            name (str): ログとメトリクスに出力する外部APIの名前
+            latency_target (float): 成功とみなす応答時間の上限（秒）
+            initial_limit (int): 同時実行数の上限の初期値
+            min_limit (int): 同時実行数の上限の最小値
+            max_limit (int): 同時実行数の上限の最大値
+            acquire_timeout (float): 空きを待つ上限（秒）
+        """
+        self.name = name
+        self.latency_target = latency_target
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.acquire_timeout = acquire_timeout
+        self._in_flight = 0
+        self._condition = threading.Condition()
+
+    @property
+    def in_flight(self):
+        """実行中のリクエスト数"""
+        return self._in_flight
+
+    @contextmanager
+    def slot(self):
+        """
+        同時実行数の上限の空きを取得して外部APIの呼び出しを囲み、結果で上限を調整する。
+
+        Raises:
+            ConcurrencyLimitExceededError: 空きを待つ上限までに空かなかった場合
+        """
+        self._acquire()
+        start = time.monotonic()
+        try:
+            yield
+        except Exception as e:
+            self._release(succeeded=not is_degradation(e), latency=0.0)
+            raise
+        self._release(succeeded=True, latency=time.monotonic() - start)
+
+    def _acquire(self):
+        deadline = time.monotonic() + self.acquire_timeout
+        with self._condition:
+            while self._in_flight >= int(self.limit):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    put_metrics(
+                        {"ConcurrencyLimitRejected": 1},
+                        dimensions={"Client": self.name},
+                    )
+                    raise ConcurrencyLimitExceededError(
+                        f"{self.name} concurrency limit {int(self.limit)} reached"
+                    )
+                self._condition.wait(remaining)
+            self._in_flight += 1
+
+    def _release(self, succeeded, latency):
+        with self._condition:
+            self._in_flight -= 1
+            previous = int(self.limit)
+            if succeeded and latency <= self.latency_target:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            else:
+                self.limit = max(self.min_limit, self.limit * DECREASE_FACTOR)
+            decreased = int(self.limit) < previous
+            self._condition.notify_all()
+        if decreased:
+            logger.warning(
+                f"{self.name} concurrency limit lowered to {int(self.limit)}"
+            )
+            put_metrics(
+                {"ConcurrencyLimit": int(self.limit)},
+                dimensions={"Client": self.name},
+                unit="None",
+            )
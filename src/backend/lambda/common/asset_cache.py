@@ -0,0 +1,175 @@
+import logging
+import os
+import random
+import threading
+import time
+from collections import OrderedDict
+
+from PIL import Image
+
+from common import aws
+from common.compositing import alpha_bbox
+
+logger = logging.getLogger(__name__)
+
+# プレフィックス一覧の有効期間（秒）
+DEFAULT_LISTING_TTL_SECONDS = 300
+# デコード済み画像キャッシュの上限（バイト）
+DEFAULT_MAX_IMAGE_BYTES = 32 * 1024 * 1024
+
+
+class AssetCache:
+    """
+    S3上の静的な画像アセットをウォームコンテナ間で再利用するためのキャッシュ。
+
+    プレフィックスのPNGキー一覧をTTL付きで保持し、デコード済みのRGBA画像を
+    メモリ上限付きのLRUで保持する。キャッシュした画像は共有されるため、
+    呼び出し側で変更してはならない（変更する場合は copy() すること）。
+
+    Attributes:
+        listing_ttl (float): キー一覧の有効期間（秒）
+        max_image_bytes (int): 画像キャッシュの上限（バイト）
+    """
+
+    def __init__(self, s3_client=None, listing_ttl=None, max_image_bytes=None):
+        """
+        AssetCacheの初期化メソッド。
+
+        Args:
+            s3_client (object): 使用するS3クライアント。未指定の場合は初回利用時に生成する。
+            listing_ttl (float): キー一覧の有効期間（秒）。未指定の場合は環境変数から取得する。
+            max_image_bytes (int): 画像キャッシュの上限（バイト）。未指定の場合は環境変数から取得する。
+        """
+        self._s3 = s3_client
+        self.listing_ttl = (
+            listing_ttl
+            if listing_ttl is not None
+            else float(
+                os.environ.get("ASSET_LISTING_TTL_SECONDS", DEFAULT_LISTING_TTL_SECONDS)
+            )
+        )
+        self.max_image_bytes = (
+            max_image_bytes
+            if max_image_bytes is not None
+            else int(os.environ.get("ASSET_CACHE_MAX_BYTES", DEFAULT_MAX_IMAGE_BYTES))
+        )
+        self._listings = {}
+        self._images = OrderedDict()
+        self._image_bytes = 0
+        self._lock = threading.Lock()
+
+    @property
+    def s3(self):
+        """S3クライアントを返す。未生成の場合はここで生成する。"""
+        if self._s3 is None:
+            self._s3 = aws.client("s3")
+        return self._s3
+
+    def list_png_keys(self, bucket_name, prefix):
+        """
+        指定プレフィックス配下のPNGキー一覧を返す。TTL内であればS3を呼び出さない。
+
+        Args:
+            bucket_name (str): バケット名
+            prefix (str): プレフィックス
+
+        Returns:
+            list: PNGファイルのキー一覧
+
+        Raises:
+            ValueError: プレフィックス配下にPNG画像が存在しない場合
+        """
+        now = time.monotonic()
+        with self._lock:
+            cached = self._listings.get((bucket_name, prefix))
+        if cached and now - cached[0] < self.listing_ttl:
+            return cached[1]
+
+        response = self.s3.list_objects_v2(Bucket=bucket_name, Prefix=prefix)
+        if "Contents" not in response:
+            raise ValueError(
+                f"Error: No images found under prefix {prefix} in bucket {bucket_name}"
+            )
+
+        # PNGファイルのみをフィルタ
+        png_keys = [
+            obj["Key"] for obj in response["Contents"] if obj["Key"].endswith(".png")
+        ]
+        if not png_keys:
+            raise ValueError(
+                f"Error: No PNG images found under prefix {prefix} in bucket {bucket_name}"
+            )
+
+        with self._lock:
+            self._listings[(bucket_name, prefix)] = (now, png_keys)
+        return png_keys
+
+    def get_image(self, bucket_name, key):
+        """
+        指定キーの画像をRGBAとして返す。キャッシュに無い場合のみS3から取得してデコードする。
+
+        Args:
+            bucket_name (str): バケット名
+            key (str): 画像のキー
+
+        Returns:
+            Image: RGBAのPILイメージオブジェクト（共有されるため変更しないこと）
+        """
+        cache_key = (bucket_name, key)
+        with self._lock:
+            img = self._images.get(cache_key)
+            if img is not None:
+                self._images.move_to_end(cache_key)
+                return img
+
+        resp = self.s3.get_object(Bucket=bucket_name, Key=key)
+        img = Image.open(resp["Body"]).convert("RGBA")
+        # 合成時に透明な余白を処理しないよう、不透明な領域をデコード時に求めておく
+        alpha_bbox(img)
+        self._store_image(cache_key, img)
+        return img
+
+    def load_random_image(self, bucket_name, prefix):
+        """
+        指定プレフィックス配下からランダムに1つのPNG画像を選択してロードする。
+
+        Args:
+            bucket_name (str): バケット名
+            prefix (str): プレフィックス
+
+        Returns:
+            Image: RGBAのPILイメージオブジェクト（共有されるため変更しないこと）
+        """
+        chosen_key = random.choice(self.list_png_keys(bucket_name, prefix))
+        return self.get_image(bucket_name, chosen_key)
+
+    def clear(self):
+        """キャッシュをすべて破棄する。"""
+        with self._lock:
+            self._listings.clear()
+            self._images.clear()
+            self._image_bytes = 0
+
+    def _store_image(self, cache_key, img):
+        """
+        画像をLRUに登録し、上限を超えた分を古い順に破棄する。
+        上限より大きい画像はキャッシュしない。
+        """
+        size = _image_nbytes(img)
+        if size > self.max_image_bytes:
+            logger.info(f"Image too large to cache: {cache_key[1]} ({size} bytes)")
+            return
+
+        with self._lock:
+            if cache_key in self._images:
+                return
+            self._images[cache_key] = img
+            self._image_bytes += size
+            while self._image_bytes > self.max_image_bytes:
+                _, evicted = self._images.popitem(last=False)
+                self._image_bytes -= _image_nbytes(evicted)
+
+
+def _image_nbytes(img):
+    """デコード済み画像のおおよそのメモリ使用量（バイト）を返す。"""
+    return img.width * img.height * len(img.getbands())
@@ -0,0 +1,39 @@
+import threading
+
+import boto3
+
+# boto3のデフォルトセッションはスレッドセーフではないため、
+# 複数スレッドからクライアントを生成する場合はこのロックで直列化する
+_lock = threading.Lock()
+
+
+def client(service_name, **kwargs):
+    """
+    スレッドセーフにboto3クライアントを生成する。
+
+    Args:
+        service_name (str): サービス名（例: 's3'）
+        **kwargs: boto3.client に渡す追加の引数
+
+    Returns:
+        object: boto3クライアント
+    """
+    with _lock:
+        return boto3.client(service_name, **kwargs)
+
+
+def resource(service_name, **kwargs):
+    """
+    スレッドセーフにboto3リソースを生成する。
+
+    生成したリソースはスレッドセーフではないため、スレッド間で共有しないこと。
+
+    Args:
+        service_name (str): サービス名（例: 'dynamodb'）
+        **kwargs: boto3.resource に渡す追加の引数
+
+    Returns:
+        object: boto3リソース
+    """
+    with _lock:
+        return boto3.resource(service_name, **kwargs)
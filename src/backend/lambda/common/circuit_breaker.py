@@ -0,0 +1,290 @@
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from botocore.exceptions import ClientError
+
+from common import aws
+from common.metrics import put_metrics
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "CLOSED"
+OPEN = "OPEN"
+HALF_OPEN = "HALF_OPEN"
+
+# 回路を開く連続失敗回数
+DEFAULT_FAILURE_THRESHOLD = 5
+# 回路を開いてから試しに呼び出すまでの時間（秒）
+DEFAULT_COOLDOWN_SECONDS = 30
+# 共有の状態を読み直す間隔（秒）。呼び出しごとにDynamoDBを読まないようにする
+DEFAULT_REFRESH_SECONDS = 5
+
+
+class CircuitOpenError(Exception):
+    """回路が開いているため外部APIを呼び出さなかったことを表す例外"""
+
+
+def is_degradation(error):
+    """
+    例外が外部APIの障害によるものかどうかを返す。
+
+    リクエストの誤り（429以外の4xx）は障害とみなさない。
+
+    Args:
+        error (Exception): 外部APIの呼び出しで発生した例外
+
+    Returns:
+        bool: 障害によるものの場合は True
+    """
+    # requests の HTTPError は response.status_code、urllib の HTTPError は code を持つ
+    response = getattr(error, "response", None)
+    status = getattr(response, "status_code", None) or getattr(error, "code", None)
+    if isinstance(status, int) and 400 <= status < 500 and status != 429:
+        return False
+    return True
+
+
+class CircuitBreaker:
+    """
+    外部APIの障害中に呼び出しを止めるサーキットブレーカー。
+
+    状態はDynamoDBの1つのアイテムに保存し、すべてのコンテナで共有する。
+    連続失敗回数が閾値に達すると回路を開き（OPEN）、呼び出しをすぐに失敗させる。
+    待ち時間の経過後は1つのコンテナだけが条件付き書き込みで HALF_OPEN に遷移して試しに呼び出し、
+    成功すれば閉じ（CLOSED）、失敗すれば再び開く。状態の遷移はメトリクスとして出力する。
+    DynamoDBの読み書きに失敗した場合は呼び出しを止めない。テーブル名が未設定の場合は無効となる。
+
+    Attributes:
+        name (str): ログとメトリクスに出力する外部APIの名前
+        table_name (str): 状態を保存するテーブル名
+        failure_threshold (int): 回路を開く連続失敗回数
+        cooldown_seconds (float): 回路を開いてから試しに呼び出すまでの時間（秒）
+        refresh_seconds (float): 共有の状態を読み直す間隔（秒）
+    """
+
+    def __init__(
+        self,
+        name,
+        table_name,
+        failure_threshold=None,
+        cooldown_seconds=None,
+        refresh_seconds=None,
+        dynamodb=None,
+    ):
+        """
+        CircuitBreakerの初期化メソッド。
+
+        Args:
+            name (str): ログとメトリクスに出力する外部APIの名前
+            table_name (str): 状態を保存するテーブル名
+            failure_threshold (int): 回路を開く連続失敗回数。未指定の場合は環境変数から取得する。
+            cooldown_seconds (float): 試しに呼び出すまでの時間（秒）。未指定の場合は環境変数から取得する。
+            refresh_seconds (float): 状態を読み直す間隔（秒）。未指定の場合は環境変数から取得する。
+            dynamodb (object): 使用するDynamoDBリソース。未指定の場合は初回利用時に生成する。
+        """
+        self.name = name
+        self.table_name = table_name
+        self.failure_threshold = int(
+            failure_threshold
+            if failure_threshold is not None
+            else os.environ.get("CIRCUIT_FAILURE_THRESHOLD", DEFAULT_FAILURE_THRESHOLD)
+        )
+        self.cooldown_seconds = float(
+            cooldown_seconds
+            if cooldown_seconds is not None
+            else os.environ.get("CIRCUIT_COOLDOWN_SECONDS", DEFAULT_COOLDOWN_SECONDS)
+        )
+        self.refresh_seconds = float(
+            refresh_seconds
+            if refresh_seconds is not None
+            else os.environ.get("CIRCUIT_REFRESH_SECONDS", DEFAULT_REFRESH_SECONDS)
+        )
+        self._dynamodb = dynamodb
+        self._state = None
+        self._fetched_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        """状態を保存するテーブルが設定されているかどうか"""
+        return bool(self.table_name)
+
+    @property
+    def table(self):
+        """状態を保存するテーブルを返す。"""
+        if self._dynamodb is None:
+            self._dynamodb = aws.resource("dynamodb")
+        return self._dynamodb.Table(self.table_name)
+
+    @property
+    def key(self):
+        return {"name": f"circuit#{self.name}"}
+
+    @property
+    def state(self):
+        """コンテナが把握している回路の状態"""
+        return self._get_state()["state"]
+
+    @contextmanager
+    def guard(self):
+        """
+        外部APIの呼び出しを囲み、結果を回路の状態に反映する。
+
+        Raises:
+            CircuitOpenError: 回路が開いている場合
+        """
+        if not self.enabled:
+            yield
+            return
+        if not self.allow():
+            put_metrics({"CircuitRejected": 1}, dimensions={"Client": self.name})
+            raise CircuitOpenError(f"{self.name} circuit is open")
+        try:
+            yield
+        except Exception as e:
+            if is_degradation(e):
+                self.record_failure()
+            else:
+                self.record_success()
+            raise
+        self.record_success()
+
+    def allow(self):
+        """
+        外部APIを呼び出してよいかどうかを返す。
+
+        Returns:
+            bool: 回路が閉じているか、このコンテナが試しに呼び出す場合は True
+        """
+        state = self._get_state()
+        if state["state"] == CLOSED:
+            return True
+        elapsed = time.time() * 1000 - state["changed_at"]
+        if elapsed < self.cooldown_seconds * 1000:
+            return False
+        # 待ち時間が経過した回路（または応答のない試しの呼び出し）を最初に遷移させたコンテナだけが呼び出す
+        return self._transition(state, HALF_OPEN)
+
+    def record_success(self):
+        """呼び出しの成功を記録し、回路を閉じて連続失敗回数を0に戻す"""
+        state = self._get_state()
+        if state["state"] != CLOSED:
+            self._transition(state, CLOSED)
+            return
+        if state["failures"] == 0:
+            return
+        try:
+            self.table.update_item(
+                Key=self.key,
+                UpdateExpression="SET failures = :zero",
+                ConditionExpression="attribute_not_exists(#state) OR #state = :closed",
+                ExpressionAttributeNames={"#state": "state"},
+                ExpressionAttributeValues={":zero": 0, ":closed": CLOSED},
+            )
+            self._set_state({**state, "failures": 0})
+        except Exception as e:
+            self._handle_error(e)
+
+    def record_failure(self):
+        """呼び出しの失敗を記録し、連続失敗回数が閾値に達した場合は回路を開く"""
+        state = self._get_state()
+        if state["state"] == HALF_OPEN:
+            # 試しの呼び出しが失敗したため再び開く
+            self._transition(state, OPEN)
+            return
+        try:
+            item = self.table.update_item(
+                Key=self.key,
+                UpdateExpression="ADD failures :one",
+                ExpressionAttributeValues={":one": 1},
+                ReturnValues="ALL_NEW",
+            )["Attributes"]
+        except Exception as e:
+            self._handle_error(e)
+            return
+        state = self._set_state(_to_state(item))
+        if state["state"] == CLOSED and state["failures"] >= self.failure_threshold:
+            self._transition(state, OPEN)
+
+    def _transition(self, seen, new_state):
+        """
+        見た時点の状態から変わっていない場合だけ状態を遷移させる。
+
+        Returns:
+            bool: 遷移させた場合は True
+        """
+        now = int(time.time() * 1000)
+        condition = "#state = :seen AND changed_at = :changed_at"
+        if seen["state"] == CLOSED and seen["changed_at"] == 0:
+            # 一度も遷移していない場合は状態の属性がない
+            condition = f"attribute_not_exists(#state) OR ({condition})"
+        try:
+            self.table.update_item(
+                Key=self.key,
+                UpdateExpression="SET #state = :new, changed_at = :now, failures = :zero",
+                ConditionExpression=condition,
+                ExpressionAttributeNames={"#state": "state"},
+                ExpressionAttributeValues={
+                    ":new": new_state,
+                    ":now": now,
+                    ":zero": 0,
+                    ":seen": seen["state"],
+                    ":changed_at": seen["changed_at"],
+                },
+            )
+        except ClientError as e:
+            if e.response["Error"]["Code"] == "ConditionalCheckFailedException":
+                # 他のコンテナが先に遷移させたため、状態を読み直す
+                self._fetched_at = None
+                return False
+            self._handle_error(e)
+            return new_state == HALF_OPEN
+        except Exception as e:
+            self._handle_error(e)
+            return new_state == HALF_OPEN
+
+        self._set_state({"state": new_state, "changed_at": now, "failures": 0})
+        logger.warning(f"{self.name} circuit: {seen['state']} -> {new_state}")
+        put_metrics(
+            {"CircuitStateTransition": 1},
+            dimensions={"Client": self.name, "State": new_state},
+        )
+        return True
+
+    def _get_state(self):
+        """コンテナが把握している状態を返す。一定時間ごとにDynamoDBから読み直す"""
+        with self._lock:
+            if (
+                self._state is not None
+                and self._fetched_at is not None
+                and time.monotonic() - self._fetched_at < self.refresh_seconds
+            ):
+                return self._state
+        try:
+            item = self.table.get_item(Key=self.key).get("Item", {})
+        except Exception as e:
+            self._handle_error(e)
+            return self._state or _to_state({})
+        return self._set_state(_to_state(item))
+
+    def _set_state(self, state):
+        with self._lock:
+            self._state = state
+            self._fetched_at = time.monotonic()
+        return state
+
+    def _handle_error(self, error):
+        # 状態を共有できない場合も外部APIの呼び出しは止めない
+        logger.warning(f"Failed to access {self.name} circuit state: {error}")
+
+
+def _to_state(item):
+    """DynamoDBのアイテムを状態の辞書に変換する"""
+    return {
+        "state": item.get("state", CLOSED),
+        "changed_at": int(item.get("changed_at", 0)),
+        "failures": int(item.get("failures", 0)),
+    }
@@ -0,0 +1,73 @@
+from PIL import Image
+
+# 不透明な領域の外接矩形を保持する Image.info のキー
+ALPHA_BBOX_KEY = "alpha_bbox"
+
+
+def alpha_bbox(image):
+    """
+    画像の不透明な（アルファ値が0でない）領域の外接矩形を返す。
+
+    計算結果は画像の info に保持するため、同じ画像では一度だけ計算する。
+    キャッシュして使い回す画像はデコード時に計算しておくとよい。
+
+    Args:
+        image (Image): RGBAのPILイメージオブジェクト
+
+    Returns:
+        tuple: (left, top, right, bottom)。完全に透明な場合は None。
+    """
+    if ALPHA_BBOX_KEY not in image.info:
+        image.info[ALPHA_BBOX_KEY] = image.getchannel("A").getbbox()
+    return image.info[ALPHA_BBOX_KEY]
+
+
+def composite(layers, size=None, base=None):
+    """
+    画像のレイヤーを下から順に1枚のキャンバスへ合成する。
+
+    各レイヤーは自身のアルファ値をマスクとして貼り付ける（Image.paste と同じ結果になる）。
+    レイヤーの不透明な領域とキャンバスが重なる部分だけを処理するため、
+    処理時間は透明な余白やキャンバスの大きさではなく見える画素数に比例する。
+
+    Args:
+        layers (list): (画像（RGBA）, (x, y)) のリスト。先頭が最も下のレイヤー。
+        size (tuple): キャンバスのサイズ。base を指定しない場合は必須。
+        base (Image): 最下層の画像（RGBA）。指定した場合はそのコピーをキャンバスとする。
+
+    Returns:
+        Image: 合成した画像（RGBA）
+    """
+    if base is not None:
+        # 元の画像はキャッシュと共有されている場合があるため変更しない
+        canvas = base.copy()
+        # 合成後は不透明な領域が変わるため、コピーした外接矩形は破棄する
+        canvas.info.pop(ALPHA_BBOX_KEY, None)
+    else:
+        canvas = Image.new("RGBA", size, (0, 0, 0, 0))
+
+    canvas_width, canvas_height = canvas.size
+    for image, (x, y) in layers:
+        bbox = alpha_bbox(image)
+        if bbox is None:
+            continue
+
+        # 不透明な領域をキャンバスの内側に切り詰める
+        left, top, right, bottom = bbox
+        left = max(left, -x)
+        top = max(top, -y)
+        right = min(right, canvas_width - x)
+        bottom = min(bottom, canvas_height - y)
+        if left >= right or top >= bottom:
+            continue
+
+        if (left, top, right, bottom) != (0, 0, image.width, image.height):
+            image = image.crop((left, top, right, bottom))
+        canvas.paste(image, (x + left, y + top), image)
+
+    return canvas
+
+
+def centered_x(canvas_width, image):
+    """キャンバスの横方向の中央に画像を置くときの x 座標を返す"""
+    return (canvas_width - image.width) // 2
@@ -0,0 +1,191 @@
+import difflib
+import logging
+import os
+import re
+import threading
+import time
+import unicodedata
+
+from common import aws
+from common.metrics import put_metrics
+
+logger = logging.getLogger(__name__)
+
+# 花の画像を置くプレフィックス。single_flowers/ は日記と花瓶、flowers/ は花束の描画で使う
+CATALOG_PREFIXES = ("single_flowers/", "flowers/")
+# カタログを読み直す間隔（秒）
+DEFAULT_CATALOG_TTL_SECONDS = 300
+# 近い花のIDに補正する類似度の下限（0〜1）
+DEFAULT_MATCH_CUTOFF = 0.8
+
+_TOKEN = re.compile(r"[a-z0-9_\-]+")
+
+
+class InvalidFlowerIdError(ValueError):
+    """選択結果がカタログにない花のIDであることを表す例外"""
+
+
+def normalize_flower_id(value):
+    """
+    花のIDの表記揺れ（全角・半角、大文字・小文字、前後の空白や引用符、パスや拡張子）を取り除く。
+
+    Args:
+        value (str): 花のIDの候補
+
+    Returns:
+        str: 正規化した花のID
+    """
+    normalized = unicodedata.normalize("NFKC", value).strip().casefold()
+    normalized = normalized.strip("\"'`「」『』.。 \t\r\n")
+    normalized = normalized.rsplit("/", 1)[-1]
+    if normalized.endswith(".png"):
+        normalized = normalized[: -len(".png")]
+    return normalized
+
+
+class FlowerCatalog:
+    """
+    元画像バケットにある花のIDの一覧（カタログ）。
+
+    single_flowers/ と flowers/ の両方に画像がある花のIDをTTL付きでメモリに保持し、
+    選択結果の花のIDを O(1) で検証する。表記揺れは正規化し、一致しない場合は最も近いIDに補正する。
+    読み直しに失敗した場合は前回のカタログを使い続ける。
+    バケット名が未設定か一度もカタログを読めていない場合は検証できないため、前後の空白だけを取り除く。
+
+    Attributes:
+        bucket_name (str): 元画像バケット名
+        ttl_seconds (float): カタログを読み直す間隔（秒）
+        match_cutoff (float): 近い花のIDに補正する類似度の下限
+    """
+
+    def __init__(
+        self, bucket_name, s3_client=None, ttl_seconds=None, match_cutoff=None
+    ):
+        """
+        FlowerCatalogの初期化メソッド。
+
+        Args:
+            bucket_name (str): 元画像バケット名
+            s3_client (object): 使用するS3クライアント。未指定の場合は初回利用時に生成する。
+            ttl_seconds (float): カタログを読み直す間隔（秒）。未指定の場合は環境変数から取得する。
+            match_cutoff (float): 補正する類似度の下限。未指定の場合は環境変数から取得する。
+        """
+        self.bucket_name = bucket_name
+        self._s3 = s3_client
+        self.ttl_seconds = float(
+            ttl_seconds
+            if ttl_seconds is not None
+            else os.environ.get(
+                "FLOWER_CATALOG_TTL_SECONDS", DEFAULT_CATALOG_TTL_SECONDS
+            )
+        )
+        self.match_cutoff = float(
+            match_cutoff
+            if match_cutoff is not None
+            else os.environ.get("FLOWER_ID_MATCH_CUTOFF", DEFAULT_MATCH_CUTOFF)
+        )
+        # 正規化した花のID -> カタログ上の花のID
+        self._ids = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        """元画像バケットが設定されているかどうか"""
+        return bool(self.bucket_name)
+
+    @property
+    def s3(self):
+        """S3クライアントを返す。未生成の場合はここで生成する。"""
+        if self._s3 is None:
+            self._s3 = aws.client("s3")
+        return self._s3
+
+    @property
+    def flower_ids(self):
+        """カタログにある花のIDの一覧"""
+        return sorted((self._get_ids() or {}).values())
+
+    def resolve(self, value):
+        """
+        選択結果をカタログ上の花のIDに変換する。
+
+        Args:
+            value (str): 選択結果の花のID
+
+        Returns:
+            str: カタログ上の花のID。カタログを使えない場合は前後の空白を除いた値。
+
+        Raises:
+            InvalidFlowerIdError: カタログにも近いIDにも一致しない場合
+        """
+        value = (value or "").strip()
+        ids = self._get_ids() if self.enabled else None
+        if ids is None:
+            if not value:
+                raise InvalidFlowerIdError("Flower ID is empty")
+            return value
+
+        candidate = normalize_flower_id(value)
+        if candidate in ids:
+            return ids[candidate]
+
+        # 説明文などに花のIDが含まれている場合
+        for token in _TOKEN.findall(candidate):
+            if token in ids:
+                return self._corrected(value, ids[token])
+
+        match = difflib.get_close_matches(candidate, ids, n=1, cutoff=self.match_cutoff)
+        if match:
+            return self._corrected(value, ids[match[0]])
+
+        logger.warning(f"Rejected unknown flower_id: {value!r}")
+        put_metrics({"FlowerIdRejected": 1})
+        raise InvalidFlowerIdError(f"Unknown flower_id: {value!r}")
+
+    def _corrected(self, value, flower_id):
+        logger.warning(f"Corrected flower_id {value!r} to {flower_id!r}")
+        put_metrics({"FlowerIdCorrected": 1})
+        return flower_id
+
+    def _get_ids(self):
+        """カタログを返す。TTLを過ぎていれば読み直す"""
+        with self._lock:
+            if (
+                self._ids is not None
+                and time.monotonic() - self._loaded_at < self.ttl_seconds
+            ):
+                return self._ids
+            try:
+                self._ids = self._load()
+            except Exception as e:
+                logger.warning(f"Failed to load flower catalog: {e}")
+            # 失敗した場合もTTLの間は読み直さない
+            self._loaded_at = time.monotonic()
+            return self._ids
+
+    def _load(self):
+        """両方のプレフィックスに画像がある花のIDを読み込む"""
+        names = []
+        for prefix in CATALOG_PREFIXES:
+            keys = set()
+            paginator = self.s3.get_paginator("list_objects_v2")
+            for page in paginator.paginate(Bucket=self.bucket_name, Prefix=prefix):
+                keys.update(
+                    obj["Key"][len(prefix) : -len(".png")]
+                    for obj in page.get("Contents", [])
+                    if obj["Key"].endswith(".png")
+                    and "/" not in obj["Key"][len(prefix) :]
+                )
+            names.append(keys)
+
+        flower_ids = set.intersection(*names)
+        missing = set.union(*names) - flower_ids
+        if missing:
+            logger.warning(
+                f"Flowers missing from one of {CATALOG_PREFIXES}: {sorted(missing)}"
+            )
+        if not flower_ids:
+            raise ValueError("No flowers found in the catalog")
+        logger.info(f"Loaded flower catalog with {len(flower_ids)} flowers")
+        return {normalize_flower_id(flower_id): flower_id for flower_id in flower_ids}
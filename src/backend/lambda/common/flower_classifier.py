@@ -0,0 +1,213 @@
+import json
+import logging
+import math
+import os
+import threading
+from collections import Counter, defaultdict
+from pathlib import Path
+
+from common.selection_cache import normalize_content
+
+logger = logging.getLogger(__name__)
+
+# 学習済みモデルの既定の保存先。共通レイヤーに同梱する
+DEFAULT_MODEL_PATH = Path(__file__).with_name("flower_classifier_model.json")
+# 特徴量に使う文字 n-gram の長さの範囲
+DEFAULT_NGRAM_RANGE = (1, 3)
+# 花ごとに保持する特徴量の数。モデルのサイズと推論時間を抑える
+DEFAULT_MAX_FEATURES_PER_CLASS = 2000
+MODEL_VERSION = 1
+
+
+def char_ngrams(text, ngram_range=DEFAULT_NGRAM_RANGE):
+    """
+    正規化した日記の内容から文字 n-gram の出現回数を数える。
+
+    日本語は単語の区切りがないため、形態素解析の代わりに文字 n-gram を特徴量とする。
+
+    Args:
+        text (str): 日記の内容
+        ngram_range (tuple): n-gram の長さの最小値と最大値
+
+    Returns:
+        Counter: n-gram ごとの出現回数
+    """
+    normalized = normalize_content(text)
+    low, high = ngram_range
+    return Counter(
+        normalized[i : i + n]
+        for n in range(low, high + 1)
+        for i in range(len(normalized) - n + 1)
+    )
+
+
+def _l2_normalize(vector):
+    norm = math.sqrt(sum(v * v for v in vector.values()))
+    if norm == 0:
+        return {}
+    return {k: v / norm for k, v in vector.items()}
+
+
+class FlowerClassifier:
+    """
+    日記の内容から花のIDを選ぶローカルの分類器。
+
+    文字 n-gram の TF-IDF ベクトルと花ごとの重みベクトル（重心）の内積で花を選ぶ線形モデル。
+    外部APIを呼び出さないため、数ミリ秒で結果を返し、オフラインでも利用できる。
+    モデルは過去の (日記の内容, 花のID) の組から scripts/train_flower_classifier.py で学習し、
+    JSON ファイルとして保存する。モデルのファイルがない場合は無効となる。
+
+    Attributes:
+        model_path (Path): 学習済みモデルのファイルパス
+    """
+
+    def __init__(self, model_path=None, model=None):
+        """
+        FlowerClassifierの初期化メソッド。
+
+        Args:
+            model_path (str): 学習済みモデルのファイルパス。未指定の場合は環境変数か既定の保存先を使う。
+            model (dict): 学習済みモデル。指定した場合はファイルから読み込まない。
+        """
+        self.model_path = Path(
+            model_path
+            or os.environ.get("FLOWER_CLASSIFIER_MODEL_PATH")
+            or DEFAULT_MODEL_PATH
+        )
+        self._model = None
+        self._lock = threading.Lock()
+        if model is not None:
+            self._set_model(model)
+
+    @property
+    def enabled(self):
+        """学習済みモデルを利用できるかどうか"""
+        return self._model is not None or self.model_path.is_file()
+
+    @classmethod
+    def train(
+        cls,
+        pairs,
+        ngram_range=DEFAULT_NGRAM_RANGE,
+        max_features_per_class=DEFAULT_MAX_FEATURES_PER_CLASS,
+    ):
+        """
+        (日記の内容, 花のID) の組から分類器を学習する。
+
+        Args:
+            pairs (iterable): (日記の内容, 花のID) のタプル
+            ngram_range (tuple): n-gram の長さの最小値と最大値
+            max_features_per_class (int): 花ごとに保持する特徴量の数
+
+        Returns:
+            FlowerClassifier: 学習した分類器
+
+        Raises:
+            ValueError: 学習データがない場合
+        """
+        documents = [
+            (char_ngrams(content, ngram_range), flower_id)
+            for content, flower_id in pairs
+            if content and flower_id
+        ]
+        if not documents:
+            raise ValueError("No training data")
+
+        document_frequency = Counter()
+        for grams, _ in documents:
+            document_frequency.update(grams.keys())
+        total = len(documents)
+        idf = {
+            gram: math.log((1 + total) / (1 + df)) + 1
+            for gram, df in document_frequency.items()
+        }
+
+        centroids = defaultdict(Counter)
+        class_counts = Counter()
+        for grams, flower_id in documents:
+            centroids[flower_id].update(_tfidf(grams, idf))
+            class_counts[flower_id] += 1
+
+        weights = {}
+        for flower_id, centroid in centroids.items():
+            top = dict(centroid.most_common(max_features_per_class))
+            weights[flower_id] = {k: round(v, 6) for k, v in _l2_normalize(top).items()}
+
+        used = {gram for vector in weights.values() for gram in vector}
+        model = {
+            "version": MODEL_VERSION,
+            "ngram_range": list(ngram_range),
+            "idf": {gram: round(idf[gram], 6) for gram in sorted(used)},
+            "weights": weights,
+            # どの特徴量にも一致しない場合に返す、学習データで最も多い花
+            "default": class_counts.most_common(1)[0][0],
+        }
+        return cls(model=model)
+
+    def save(self, path=None):
+        """
+        学習済みモデルを JSON ファイルに保存する。
+
+        Args:
+            path (str): 保存先のファイルパス。未指定の場合は model_path に保存する。
+        """
+        path = Path(path or self.model_path)
+        path.write_text(json.dumps(self._get_model(), ensure_ascii=False))
+
+    @property
+    def labels(self):
+        """分類器が選ぶことのできる花のIDの一覧"""
+        return sorted(self._get_model()["weights"])
+
+    def predict(self, content):
+        """
+        日記の内容から花のIDを選ぶ。
+
+        Args:
+            content (str): 日記の内容
+
+        Returns:
+            tuple: (花のID, スコア)。スコアはコサイン類似度（0〜1）。
+        """
+        model = self._get_model()
+        vector = _tfidf(char_ngrams(content, tuple(model["ngram_range"])), model["idf"])
+        scores = Counter()
+        for gram, value in vector.items():
+            for flower_id, weight in self._index.get(gram, ()):
+                scores[flower_id] += value * weight
+        if not scores:
+            return model["default"], 0.0
+        flower_id, score = scores.most_common(1)[0]
+        return flower_id, score
+
+    def _get_model(self):
+        """学習済みモデルを返す。初回はファイルから読み込む"""
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    model = json.loads(self.model_path.read_text())
+                    self._set_model(model)
+                    logger.info(
+                        f"Loaded flower classifier with {len(model['weights'])} flowers"
+                    )
+        return self._model
+
+    def _set_model(self, model):
+        # n-gram から (花のID, 重み) を引く転置インデックスを作り、推論を n-gram の数に比例させる
+        index = defaultdict(list)
+        for flower_id, vector in model["weights"].items():
+            for gram, weight in vector.items():
+                index[gram].append((flower_id, weight))
+        self._index = dict(index)
+        self._model = model
+
+
+def _tfidf(grams, idf):
+    """出現回数から対数TFとIDFの積を計算し、L2正規化したベクトルを返す"""
+    return _l2_normalize(
+        {
+            gram: (1 + math.log(count)) * idf[gram]
+            for gram, count in grams.items()
+            if gram in idf
+        }
+    )
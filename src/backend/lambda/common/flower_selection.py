@@ -0,0 +1,540 @@
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+
+import requests
+
+from common import aws
+from common.adaptive_limiter import AdaptiveLimiter, ConcurrencyLimitExceededError
+from common.circuit_breaker import CircuitBreaker, CircuitOpenError
+from common.flower_catalog import FlowerCatalog, InvalidFlowerIdError
+from common.flower_classifier import FlowerClassifier
+from common.hedging import Hedger
+from common.http_client import HttpClient
+from common.idempotency import request_fingerprint
+from common.metrics import put_metrics
+from common.openai_chat import send_chat_request
+from common.prompt_input import prepare_input, record_usage
+from common.rate_limiter import RateLimiter, RateLimitExceededError
+from common.secrets import get_secret
+from common.selection_cache import SelectionCache, content_hash
+from common.single_flight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+DIFY_BASE_URL = "https://api.dify.ai/v1"
+
+# Dify への接続をウォームコンテナ間で使い回すクライアント
+dify_client = HttpClient(
+    "dify",
+    connect_timeout=float(os.environ.get("DIFY_CONNECT_TIMEOUT_SECONDS", 3.05)),
+    read_timeout=float(os.environ.get("DIFY_READ_TIMEOUT_SECONDS", 20)),
+    max_retries=int(os.environ.get("DIFY_MAX_RETRIES", 2)),
+)
+
+# Dify の応答が遅い場合にリクエストをもう1つ送り、全体の待ち時間に上限を設ける
+dify_hedger = Hedger(
+    "dify",
+    budget_seconds=float(os.environ.get("DIFY_BUDGET_SECONDS", 20)),
+    hedge_percentile=float(os.environ.get("DIFY_HEDGE_PERCENTILE", 95)),
+    max_hedges=int(os.environ.get("DIFY_MAX_HEDGES", 1)),
+)
+
+# Dify の障害中は呼び出さずに失敗させるサーキットブレーカー。状態はコンテナ間で共有する
+dify_breaker = CircuitBreaker("dify", os.environ.get("EXTERNAL_API_STATE_TABLE_NAME"))
+
+# Dify への同時リクエスト数を応答に応じて調整するリミッター
+dify_limiter = AdaptiveLimiter(
+    "dify", latency_target=float(os.environ.get("DIFY_LATENCY_TARGET_SECONDS", 10))
+)
+
+# アカウントのレート制限を超えないよう、すべてのコンテナで Dify へのリクエストの速さを揃える
+dify_rate_limiter = RateLimiter(
+    "dify",
+    os.environ.get("EXTERNAL_API_STATE_TABLE_NAME"),
+    rate=float(os.environ.get("DIFY_RATE_LIMIT_PER_SECOND", 5)),
+    capacity=float(os.environ.get("DIFY_RATE_LIMIT_BURST", 10)),
+)
+# レート制限のトークンが補充されるのを待つ上限（秒）
+DEFAULT_RATE_LIMIT_WAIT_SECONDS = 5.0
+
+# 同じ内容の日記の選択結果を使い回すキャッシュ
+selection_cache = SelectionCache(os.environ.get("FLOWER_CACHE_TABLE_NAME"))
+
+# 同じ日記の同時の選択（ダブルタップや再送など）をコンテナ内とコンテナ間で1回にまとめる
+flower_flight = SingleFlight(
+    "flower-selection", os.environ.get("EXTERNAL_API_STATE_TABLE_NAME")
+)
+
+# 選択結果を検証する花のIDの一覧。描画に使う画像がない花のIDは保存しない
+flower_catalog = FlowerCatalog(os.environ.get("ORIGINAL_IMAGE_BUCKET_NAME"))
+
+# Dify を使わずに花を選ぶローカルの分類器
+local_classifier = FlowerClassifier()
+
+# 花の選択方法
+#   dify: Dify のみを使う
+#   local: ローカルの分類器のみを使う
+#   fallback: Dify が応答の待ち時間の上限内に応答しないか失敗した場合にローカルの分類器を使う
+#   shadow: Dify の結果を返し、ローカルの分類器の結果と比較してメトリクスに出力する
+SELECTION_MODES = ("dify", "local", "fallback", "shadow")
+DEFAULT_SELECTION_MODE = "dify"
+# fallback で Dify の応答を待つ上限（秒）
+DEFAULT_DIFY_LATENCY_BUDGET_SECONDS = 5.0
+
+# fallback で Dify の呼び出しを待ち時間の上限付きで実行するスレッドプール
+_dify_executor = ThreadPoolExecutor(max_workers=4)
+
+# 日記の分析方法
+#   separate: 花は FLOWER_SELECTION_MODE の方法で選び、タイトルは title_generate が生成する
+#   combined: OpenAI の1回の呼び出しでタイトルと花を選び、一緒に保存する
+ANALYSIS_MODES = ("separate", "combined")
+DEFAULT_ANALYSIS_MODE = "separate"
+DEFAULT_ANALYSIS_MODEL = "gpt-4o-mini"
+ANALYSIS_SYSTEM_MESSAGE = (
+    "Read the diary and answer in JSON. "
+    "title: a title of 10 words or less based on the contents of the diary. "
+    "flower_id: the id of the flower that best matches the mood of the diary."
+)
+
+
+class FlowerSaveError(Exception):
+    """選択した花のIDをDynamoDBに保存できなかった場合の例外"""
+
+
+def select_and_save_flower(user_id, date, diary_content):
+    """日記の内容に基づいて花を選び、選んだ花のIDを生成AIテーブルに保存します。
+
+    flower_select Lambda と diary_create のプロセス内呼び出しで共通の処理です。
+    同じ日記の選択が同時に呼び出された場合は1回だけ選び、結果を使い回します。
+
+    Args:
+        user_id (str): ユーザーのID。
+        date (str): 日記の日付。
+        diary_content (str): 日記の内容。
+
+    Returns:
+        str: 選択された花のID。
+
+    Raises:
+        ValueError: 花のIDが空かカタログにない場合。
+        FlowerSaveError: DynamoDBへの保存が失敗した場合。
+        Exception: 花の選択が失敗した場合。
+    """
+    # 同じ日記の同時の選択は1回にまとめ、他の呼び出しは結果を使い回して保存する
+    title, flower_id = flower_flight.do(
+        request_fingerprint(user_id, date, content_hash(diary_content)),
+        lambda: select_title_and_flower(diary_content),
+    )
+    if not flower_id:
+        raise ValueError("Flower ID is Empty")
+    logger.info(f"flower_id: {flower_id}")
+
+    try:
+        if title:
+            save_to_dynamodb(
+                user_id, date, flower_id, title, content_hash(diary_content)
+            )
+        else:
+            save_to_dynamodb(user_id, date, flower_id)
+    except Exception as e:
+        raise FlowerSaveError(str(e)) from e
+    logger.info("Flower ID saved successfully to DynamoDB.")
+    return flower_id
+
+
+def select_title_and_flower(diary_content):
+    """DIARY_ANALYSIS_MODE の方法で花を選び、combined の場合はタイトルも生成します。
+
+    Args:
+        diary_content (str): 日記の内容。
+
+    Returns:
+        tuple: (生成されたタイトル。生成しなかった場合は None, 選択された花のID)
+    """
+    if get_analysis_mode() == "combined":
+        return analyze_diary_with_fallback(diary_content)
+    return None, select_flower(diary_content)
+
+
+def get_analysis_mode():
+    """環境変数から日記の分析方法を返します。
+
+    Returns:
+        str: ANALYSIS_MODES のいずれか。
+    """
+    mode = os.environ.get("DIARY_ANALYSIS_MODE", DEFAULT_ANALYSIS_MODE)
+    if mode not in ANALYSIS_MODES:
+        logger.warning(f"Unknown diary analysis mode: {mode}")
+        return DEFAULT_ANALYSIS_MODE
+    return mode
+
+
+def analyze_diary_with_fallback(diary_content):
+    """タイトルと花を1回の呼び出しで選び、失敗した場合は花だけを選びます。
+
+    花だけを選んだ場合、タイトルは title_generate が生成します。
+
+    Args:
+        diary_content (str): 日記の内容。
+
+    Returns:
+        tuple: (タイトル。失敗した場合は None, 選択された花のID)
+    """
+    try:
+        title, flower_id = analyze_diary(diary_content)
+    except Exception as e:
+        logger.warning(f"Combined diary analysis failed: {e}")
+        put_metrics({"DiaryAnalysisFallback": 1})
+        return None, select_flower(diary_content)
+    if selection_cache.enabled:
+        selection_cache.put(diary_content, flower_id)
+    return title, flower_id
+
+
+def analyze_diary(diary_content):
+    """OpenAI を1回呼び出し、日記のタイトルと花を構造化された応答で返します。
+
+    花のIDはカタログにあるIDに制限して選ばせ、選択結果をカタログで検証します。
+    長い日記は分析用のトークン数の上限（ANALYSIS_INPUT_TOKEN_BUDGET）に収めてから送ります。
+
+    Args:
+        diary_content (str): 日記の内容。
+
+    Returns:
+        tuple: (生成されたタイトル, 選択された花のID)
+
+    Raises:
+        InvalidFlowerIdError: 選択結果がカタログにない花のIDの場合。
+        Exception: API呼び出しが失敗した場合や応答が不正な場合。
+    """
+    logger.info("analyze diary")
+    api_key = get_parameter_from_parameter_store("OpenAI_API_KEY")
+
+    flower_id_schema = {"type": "string"}
+    flower_ids = flower_catalog.flower_ids if flower_catalog.enabled else []
+    if flower_ids:
+        flower_id_schema["enum"] = flower_ids
+    request_data = {
+        "model": os.environ.get("OPENAI_ANALYSIS_MODEL", DEFAULT_ANALYSIS_MODEL),
+        "messages": [
+            {"role": "system", "content": ANALYSIS_SYSTEM_MESSAGE},
+            {"role": "user", "content": prepare_input(diary_content, "analysis")},
+        ],
+        "temperature": 0.7,
+        "response_format": {
+            "type": "json_schema",
+            "json_schema": {
+                "name": "diary_analysis",
+                "strict": True,
+                "schema": {
+                    "type": "object",
+                    "properties": {
+                        "title": {"type": "string"},
+                        "flower_id": flower_id_schema,
+                    },
+                    "required": ["title", "flower_id"],
+                    "additionalProperties": False,
+                },
+            },
+        },
+    }
+
+    response_data = json.loads(send_chat_request(api_key, request_data))
+    record_usage("analysis", response_data.get("usage"))
+    result = json.loads(response_data["choices"][0]["message"]["content"])
+    title = result["title"].strip()
+    if not title:
+        raise ValueError("Title is Empty")
+    return title, flower_catalog.resolve(result["flower_id"])
+
+
+def select_flower(diary_content):
+    """日記の内容に基づいて花を選択し、花のIDを返します。
+
+    この関数は次の処理を行います:
+    - 同じ内容の日記の選択結果がキャッシュにあれば、それを返す。
+    - 環境変数 FLOWER_SELECTION_MODE の方法で花を選択。
+    - 選択結果を花のカタログで検証し、表記揺れを補正（カタログにない場合は例外）。
+    - Dify の選択結果をキャッシュに保存（ローカルの分類器の結果は保存しない）。
+
+    学習済みモデルがない場合は、どの方法でも Dify のみを使います。
+
+    Args:
+        diary_content (str): 日記の内容。
+
+    Returns:
+        str: 選択された花のID。
+    """
+    logger.info("select flower")
+    if selection_cache.enabled:
+        flower_id = selection_cache.get(diary_content)
+        if flower_id:
+            try:
+                flower_id = flower_catalog.resolve(flower_id)
+                logger.info("flower selection cache hit")
+                return flower_id
+            except InvalidFlowerIdError:
+                # カタログから削除された花の場合は選択し直す
+                logger.info("cached flower_id is no longer in the catalog")
+
+    mode = get_selection_mode()
+    if mode == "local":
+        return select_flower_locally(diary_content)
+    if mode == "fallback":
+        return select_flower_with_fallback(diary_content)
+
+    flower_id = select_flower_using_dify(diary_content)
+    if mode == "shadow":
+        compare_with_local(diary_content, flower_id)
+    return flower_id
+
+
+def get_selection_mode():
+    """環境変数から花の選択方法を返します。
+
+    Returns:
+        str: SELECTION_MODES のいずれか。
+    """
+    mode = os.environ.get("FLOWER_SELECTION_MODE", DEFAULT_SELECTION_MODE)
+    if mode not in SELECTION_MODES:
+        logger.warning(f"Unknown flower selection mode: {mode}")
+        return DEFAULT_SELECTION_MODE
+    if mode != "dify" and not local_classifier.enabled:
+        logger.warning("Flower classifier model is not available, using Dify only")
+        return "dify"
+    return mode
+
+
+def select_flower_using_dify(diary_content, rate_limit_wait=None):
+    """Dify を呼び出して花を選択し、選択結果をキャッシュに保存します。
+
+    Args:
+        diary_content (str): 日記の内容。
+        rate_limit_wait (float): レート制限のトークンを待つ上限（秒）。
+
+    Returns:
+        str: 選択された花のID。
+    """
+    api_key = get_parameter_from_parameter_store("DIFY_API_KEY")
+    flower_id = select_flower_using_api(
+        api_key, diary_content, rate_limit_wait=rate_limit_wait
+    )
+    if selection_cache.enabled and flower_id:
+        selection_cache.put(diary_content, flower_id)
+    return flower_id
+
+
+def select_flower_locally(diary_content):
+    """ローカルの分類器で花を選択します。
+
+    Args:
+        diary_content (str): 日記の内容。
+
+    Returns:
+        str: 選択された花のID。
+    """
+    flower_id, score = local_classifier.predict(diary_content)
+    logger.info(f"local flower_id: {flower_id} (score: {score:.3f})")
+    return flower_catalog.resolve(flower_id)
+
+
+def select_flower_with_fallback(diary_content):
+    """Dify で花を選択し、待ち時間の上限内に応答しないか失敗した場合はローカルの分類器を使います。
+
+    Dify の回路が開いている場合とレート制限を超えた場合は、Dify を待たずにローカルの分類器を使います。
+
+    上限を超えた Dify の呼び出しは中断せず、完了した場合はその結果がキャッシュに保存されます。
+
+    Args:
+        diary_content (str): 日記の内容。
+
+    Returns:
+        str: 選択された花のID。
+    """
+    budget = float(
+        os.environ.get(
+            "FLOWER_DIFY_LATENCY_BUDGET_SECONDS", DEFAULT_DIFY_LATENCY_BUDGET_SECONDS
+        )
+    )
+    future = _dify_executor.submit(
+        select_flower_using_dify, diary_content, rate_limit_wait=0
+    )
+    try:
+        flower_id = future.result(timeout=budget)
+        if flower_id:
+            return flower_id
+        reason = "empty"
+    except FuturesTimeoutError:
+        reason = "timeout"
+    except CircuitOpenError:
+        reason = "circuit_open"
+    except ConcurrencyLimitExceededError:
+        reason = "concurrency_limit"
+    except RateLimitExceededError:
+        reason = "rate_limited"
+    except InvalidFlowerIdError:
+        reason = "invalid"
+    except Exception as e:
+        logger.warning(f"Dify flower selection failed: {e}")
+        reason = "error"
+
+    logger.warning(f"Falling back to local flower classifier ({reason})")
+    put_metrics({"FlowerSelectionFallback": 1}, dimensions={"Reason": reason})
+    return select_flower_locally(diary_content)
+
+
+def compare_with_local(diary_content, flower_id):
+    """ローカルの分類器の結果を Dify の結果と比較し、一致したかどうかをメトリクスに出力します。
+
+    比較に失敗しても例外は送出しません。
+
+    Args:
+        diary_content (str): 日記の内容。
+        flower_id (str): Dify が選択した花のID。
+    """
+    try:
+        local_flower_id, score = local_classifier.predict(diary_content)
+    except Exception as e:
+        logger.warning(f"Flower classifier failed in shadow mode: {e}")
+        return
+    agreed = local_flower_id == flower_id
+    logger.info(
+        f"shadow flower selection: dify={flower_id} local={local_flower_id} "
+        f"(score: {score:.3f}, agreed: {agreed})"
+    )
+    put_metrics({"FlowerShadowAgreement": int(agreed)})
+
+
+def save_to_dynamodb(user_id, date, flower_id, title=None, fingerprint=None):
+    """選択された花のIDをDynamoDBに保存します。
+
+    タイトルを指定した場合は、タイトルを生成した日記の内容のフィンガープリントと一緒に保存し、
+    title_generate が同じ内容のタイトルを生成し直さないようにします。
+
+    Args:
+        user_id (str): ユーザーのID。
+        date (str): 花を選択する日付。
+        flower_id (str): 保存する選択された花のID。
+        title (str): 保存するタイトル。
+        fingerprint (str): タイトルを生成した日記の内容のフィンガープリント。
+
+    Raises:
+        Exception: DynamoDBへの保存が失敗した場合。
+    """
+    logger.info("save_flower_id_to_dynamodb")
+
+    dynamodb = aws.resource("dynamodb")
+    table_name = os.environ["GENERATIVE_AI_TABLE_NAME"]
+    table = dynamodb.Table(table_name)
+
+    item = {
+        "user_id": user_id,
+        "date": date,
+    }
+
+    update_expression = "set flower_id = :flower"
+    expression_attribute_values = {":flower": flower_id}
+    if title:
+        update_expression += ", title = :title, content_fingerprint = :f"
+        expression_attribute_values.update({":title": title, ":f": fingerprint})
+
+    try:
+        table.update_item(
+            Key=item,
+            UpdateExpression=update_expression,
+            ExpressionAttributeValues=expression_attribute_values,
+        )
+
+    except Exception as e:
+        logger.error(f"Error saving to DynamoDB: {e}")
+        raise
+
+
+def get_parameter_from_parameter_store(parameter_name):
+    """AWS Systems Manager Parameter Storeからパラメータ値を取得します。
+
+    Args:
+        parameter_name (str): 取得するパラメータの名前。
+
+    Returns:
+        str: 指定したパラメータの値。
+
+    Raises:
+        Exception: パラメータの取得に失敗した場合。
+    """
+    logger.info("get_parameter_from_parameter_store")
+    try:
+        # 復号済みの値はウォームコンテナ間でTTL付きでキャッシュされる
+        return get_secret(parameter_name)
+    except Exception as e:
+        raise Exception(f"Failed to get parameter from parameter store: {e}")
+
+
+def select_flower_using_api(api_key, query, rate_limit_wait=None):
+    """指定されたクエリに基づき、外部APIを呼び出して花を選択します。
+
+    長い日記は花の選択用のトークン数の上限（FLOWER_INPUT_TOKEN_BUDGET）に収めてから送ります。
+
+    Args:
+        api_key (str): 認証用のAPIキー。
+        query (str): 花を選択するためのクエリ文字列。
+        rate_limit_wait (float): レート制限のトークンを待つ上限（秒）。0の場合は待たずに失敗させる。
+            未指定の場合は DIFY_RATE_LIMIT_WAIT_SECONDS を使う。
+
+    Returns:
+        str: 選択された花のID。
+
+    Raises:
+        RateLimitExceededError: 待つ上限までにレート制限のトークンを取得できなかった場合。
+        CircuitOpenError: Dify の障害中で呼び出さなかった場合。
+        ConcurrencyLimitExceededError: 同時リクエスト数の上限に空きがなかった場合。
+        InvalidFlowerIdError: 選択結果がカタログにない花のIDの場合。
+        Exception: API呼び出しが失敗またはエラーを返した場合。
+    """
+    logger.info("select flower using api")
+
+    headers = {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"}
+    url = f"{DIFY_BASE_URL}/chat-messages"
+
+    data = {
+        "query": prepare_input(query, "flower"),
+        "inputs": {},
+        "response_mode": "blocking",
+        "user": "user",
+        "auto_generate_name": True,
+    }
+
+    def post(deadline):
+        response = dify_client.post(url, deadline=deadline, headers=headers, json=data)
+        response.raise_for_status()
+        return response
+
+    if rate_limit_wait is None:
+        rate_limit_wait = float(
+            os.environ.get(
+                "DIFY_RATE_LIMIT_WAIT_SECONDS", DEFAULT_RATE_LIMIT_WAIT_SECONDS
+            )
+        )
+    dify_rate_limiter.acquire(deadline=time.monotonic() + rate_limit_wait)
+
+    try:
+        # 障害中は呼び出さずに失敗させ、同時に送るリクエストの数を制限する。
+        # 応答が遅い場合はリクエストをもう1つ送り、先に返った応答を使う
+        with dify_breaker.guard(), dify_limiter.slot():
+            response = dify_hedger.call(post)
+    except requests.exceptions.HTTPError as e:
+        logger.error(f"HTTP error occuerd: {e}")
+        raise Exception("API call failled")
+    except (CircuitOpenError, ConcurrencyLimitExceededError):
+        raise
+    except Exception as e:
+        raise Exception(f"Failed to select flower: {e}")
+
+    response_data = response.json()
+    record_usage("flower", response_data.get("metadata", {}).get("usage"))
+    # 空白や表記揺れを取り除き、カタログにない花のIDは描画の前に弾く
+    return flower_catalog.resolve(response_data["answer"])
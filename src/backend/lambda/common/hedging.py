@@ -0,0 +1,163 @@
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from common.metrics import put_metrics
+
+logger = logging.getLogger(__name__)
+
+# 全体の待ち時間の上限（秒）
+DEFAULT_BUDGET_SECONDS = 20.0
+# 2つ目のリクエストを送るまでの待ち時間を決めるパーセンタイル
+DEFAULT_HEDGE_PERCENTILE = 95.0
+# 計測した応答時間が少ない間に使う、2つ目のリクエストを送るまでの待ち時間（秒）
+DEFAULT_INITIAL_HEDGE_DELAY_SECONDS = 8.0
+# 2つ目のリクエストを送るまでの待ち時間の下限（秒）。速い応答が続いてもリクエストを倍にしない
+DEFAULT_MIN_HEDGE_DELAY_SECONDS = 1.0
+# パーセンタイルの計算に使う直近の応答時間の件数
+LATENCY_WINDOW_SIZE = 200
+# パーセンタイルを使い始めるのに必要な応答時間の件数
+MIN_LATENCY_SAMPLES = 20
+
+# すべての Hedger で共有するスレッドプール
+_executor = ThreadPoolExecutor(max_workers=16)
+
+
+class LatencyBudgetExceededError(TimeoutError):
+    """全体の待ち時間の上限までに応答がなかったことを表す例外"""
+
+
+class Hedger:
+    """
+    外部APIの呼び出しをヘッジし、全体の待ち時間に上限を設ける。
+
+    最初のリクエストが直近の応答時間のパーセンタイルを超えても応答しない場合に
+    同じリクエストをもう1つ送り、先に成功した応答を使う。
+    Python では送信中のHTTPリクエストを中断できないため、遅い方の応答は破棄し、
+    呼び出しには全体の上限の時刻（time.monotonic）を渡してタイムアウトとして使わせる。
+
+    Attributes:
+        name (str): ログとメトリクスに出力する名前
+        budget_seconds (float): 全体の待ち時間の上限（秒）
+        hedge_percentile (float): 2つ目のリクエストを送るまでの待ち時間を決めるパーセンタイル
+        max_hedges (int): 追加で送るリクエストの数。0の場合はヘッジしない
+    """
+
+    def __init__(
+        self,
+        name,
+        budget_seconds=DEFAULT_BUDGET_SECONDS,
+        hedge_percentile=DEFAULT_HEDGE_PERCENTILE,
+        max_hedges=1,
+        initial_hedge_delay=DEFAULT_INITIAL_HEDGE_DELAY_SECONDS,
+        min_hedge_delay=DEFAULT_MIN_HEDGE_DELAY_SECONDS,
+    ):
+        """
+        Hedgerの初期化メソッド。
+
+        Args:
+            name (str): ログとメトリクスに出力する名前
+            budget_seconds (float): 全体の待ち時間の上限（秒）
+            hedge_percentile (float): 2つ目のリクエストを送るまでの待ち時間を決めるパーセンタイル
+            max_hedges (int): 追加で送るリクエストの数。0の場合はヘッジしない
+            initial_hedge_delay (float): 計測した応答時間が少ない間の待ち時間（秒）
+            min_hedge_delay (float): 2つ目のリクエストを送るまでの待ち時間の下限（秒）
+        """
+        self.name = name
+        self.budget_seconds = budget_seconds
+        self.hedge_percentile = hedge_percentile
+        self.max_hedges = max_hedges
+        self.initial_hedge_delay = initial_hedge_delay
+        self.min_hedge_delay = min_hedge_delay
+        self._latencies = deque(maxlen=LATENCY_WINDOW_SIZE)
+        self._lock = threading.Lock()
+
+    def hedge_delay(self):
+        """
+        2つ目のリクエストを送るまでの待ち時間を返す。
+
+        Returns:
+            float: 直近の応答時間のパーセンタイル（秒）。件数が少ない間は初期値。
+        """
+        with self._lock:
+            latencies = sorted(self._latencies)
+        if len(latencies) < MIN_LATENCY_SAMPLES:
+            return self.initial_hedge_delay
+        index = min(
+            len(latencies) - 1, int(len(latencies) * self.hedge_percentile / 100)
+        )
+        return max(self.min_hedge_delay, latencies[index])
+
+    def call(self, fn):
+        """
+        fn をヘッジして呼び出し、先に成功した結果を返す。
+
+        Args:
+            fn (callable): 全体の上限の時刻（time.monotonic）を受け取り、結果を返す関数。
+                上限の時刻までの残り時間をタイムアウトに使うこと。
+
+        Returns:
+            object: 先に成功した fn の結果
+
+        Raises:
+            LatencyBudgetExceededError: 全体の上限までに成功しなかった場合
+            Exception: すべてのリクエストが失敗した場合は最後に失敗したリクエストの例外
+        """
+        start = time.monotonic()
+        deadline = start + self.budget_seconds
+        hedge_at = start + self.hedge_delay()
+        pending = {_executor.submit(self._timed, fn, deadline): 0}
+        sent = 1
+        error = None
+
+        while pending:
+            now = time.monotonic()
+            if now >= deadline:
+                break
+            can_hedge = sent <= self.max_hedges
+            wait_until = min(hedge_at, deadline) if can_hedge else deadline
+            done, _ = wait(
+                pending, timeout=max(0.0, wait_until - now), return_when=FIRST_COMPLETED
+            )
+            for future in done:
+                attempt = pending.pop(future)
+                try:
+                    result, latency = future.result()
+                except Exception as e:
+                    error = e
+                    continue
+                self._finish(pending, attempt, latency)
+                return result
+            # 応答が遅い場合だけヘッジし、失敗した場合の再試行は呼び出し側に任せる
+            if pending and can_hedge and time.monotonic() >= hedge_at:
+                logger.info(f"{self.name} is slow, sending a hedged request")
+                put_metrics({"HedgedRequest": 1}, dimensions={"Client": self.name})
+                pending[_executor.submit(self._timed, fn, deadline)] = sent
+                sent += 1
+                hedge_at = time.monotonic() + self.hedge_delay()
+
+        if error is not None and not pending:
+            raise error
+        for future in pending:
+            future.cancel()
+        put_metrics({"LatencyBudgetExceeded": 1}, dimensions={"Client": self.name})
+        raise LatencyBudgetExceededError(
+            f"{self.name} did not respond within {self.budget_seconds}s"
+        )
+
+    def _timed(self, fn, deadline):
+        start = time.monotonic()
+        result = fn(deadline)
+        return result, time.monotonic() - start
+
+    def _finish(self, pending, attempt, latency):
+        """成功した応答時間を記録し、残りのリクエストを取り消す"""
+        with self._lock:
+            self._latencies.append(latency)
+        for future in pending:
+            # 開始前のリクエストは取り消し、送信中のリクエストの応答は破棄する
+            future.cancel()
+        if attempt > 0:
+            put_metrics({"HedgedRequestWon": 1}, dimensions={"Client": self.name})
@@ -0,0 +1,235 @@
+import logging
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPSConnection
+from urllib3.connectionpool import HTTPSConnectionPool
+from urllib3.exceptions import NewConnectionError
+
+logger = logging.getLogger(__name__)
+
+# 接続を確立するまでの上限（秒）
+DEFAULT_CONNECT_TIMEOUT_SECONDS = 3.05
+# レスポンスを待つ上限（秒）
+DEFAULT_READ_TIMEOUT_SECONDS = 20
+# 再試行の上限回数
+DEFAULT_MAX_RETRIES = 2
+# 再試行までの待ち時間の基準（秒）。試行ごとに倍にし、0からその値までの乱数を待つ
+DEFAULT_BACKOFF_SECONDS = 0.2
+# 再試行の待ち時間の上限（秒）
+MAX_BACKOFF_SECONDS = 2.0
+# Retry-After で指示された場合に待つ上限（秒）。これより長い場合は再試行しない
+MAX_RETRY_AFTER_SECONDS = 20.0
+# 再試行するステータスコード
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+# リクエスト中の接続確立にかかった時間（スレッドごと）
+_phase_timings = threading.local()
+
+
+class _TimedHTTPSConnection(HTTPSConnection):
+    """TCP接続とTLSハンドシェイクにかかった時間を記録するHTTPS接続"""
+
+    def _new_conn(self):
+        start = time.perf_counter()
+        sock = super()._new_conn()
+        _phase_timings.connect = time.perf_counter() - start
+        return sock
+
+    def connect(self):
+        start = time.perf_counter()
+        super().connect()
+        elapsed = time.perf_counter() - start
+        _phase_timings.tls = elapsed - getattr(_phase_timings, "connect", 0.0)
+
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+
+class _TimedHTTPAdapter(HTTPAdapter):
+    """接続にかかった時間を記録する接続プールを使うアダプター"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            **self.poolmanager.pool_classes_by_scheme,
+            "https": _TimedHTTPSConnectionPool,
+        }
+
+
+def _is_connect_failure(error):
+    """接続を確立する前に失敗した（リクエストを送信していない）エラーかどうかを返す"""
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], "reason", None) if error.args else None
+    return isinstance(reason, NewConnectionError)
+
+
+def _retry_after(response):
+    """
+    レスポンスの Retry-After（秒数または日時）か retry-after-ms から待ち時間を返す。
+
+    Returns:
+        float: 待ち時間（秒）。指示がない場合は None
+    """
+    value = response.headers.get("retry-after-ms")
+    if isinstance(value, str):
+        try:
+            return max(float(value) / 1000, 0.0)
+        except ValueError:
+            pass
+    value = response.headers.get("Retry-After")
+    if not isinstance(value, str):
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max((retry_at - datetime.now(timezone.utc)).total_seconds(), 0.0)
+
+
+class HttpClient:
+    """
+    keep-alive の接続プールを持つHTTPクライアント。
+
+    ウォームコンテナ間で接続を使い回し、接続とレスポンスの待ち時間に上限を設ける。
+    接続を確立できなかった場合と一時的なエラー（429, 5xx）はジッター付きの指数バックオフで再試行する。
+    レスポンスに Retry-After がある場合は少なくともその時間を待ち、全体の上限の時刻までに待てない場合は再試行しない。
+    接続後の切断やレスポンスを待つ間のタイムアウトは、リクエストが処理されている可能性があるため再試行しない。
+    リクエストごとに接続・TLS・最初のバイトまでの時間をログに出力する。
+
+    Attributes:
+        name (str): ログに出力するクライアントの名前
+        connect_timeout (float): 接続を確立するまでの上限（秒）
+        read_timeout (float): レスポンスを待つ上限（秒）
+        max_retries (int): 再試行の上限回数
+        backoff (float): 再試行までの待ち時間の基準（秒）
+    """
+
+    def __init__(
+        self,
+        name,
+        connect_timeout=DEFAULT_CONNECT_TIMEOUT_SECONDS,
+        read_timeout=DEFAULT_READ_TIMEOUT_SECONDS,
+        max_retries=DEFAULT_MAX_RETRIES,
+        backoff=DEFAULT_BACKOFF_SECONDS,
+        pool_maxsize=10,
+    ):
+        """
+        HttpClientの初期化メソッド。
+
+        Args:
+            name (str): ログに出力するクライアントの名前
+            connect_timeout (float): 接続を確立するまでの上限（秒）
+            read_timeout (float): レスポンスを待つ上限（秒）
+            max_retries (int): 再試行の上限回数
+            backoff (float): 再試行までの待ち時間の基準（秒）
+            pool_maxsize (int): ホストごとに保持する接続の数
+        """
+        self.name = name
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.session = requests.Session()
+        adapter = _TimedHTTPAdapter(pool_maxsize=pool_maxsize)
+        self.session.mount("https://", adapter)
+
+    def post(self, url, deadline=None, **kwargs):
+        """
+        POSTリクエストを送信する。
+
+        Args:
+            url (str): 送信先のURL
+            deadline (float): 再試行を含めた全体の上限の時刻（time.monotonic）。
+                指定した場合はレスポンスを待つ時間を残り時間までに短くし、
+                再試行までの待ち時間が残り時間を超える場合は再試行しない。
+            **kwargs: requests.Session.post に渡す引数（headers, json など）
+
+        Returns:
+            requests.Response: レスポンス。再試行しても一時的なエラーの場合は最後のレスポンス。
+
+        Raises:
+            requests.exceptions.RequestException: 再試行しても接続できない場合やタイムアウトした場合
+        """
+        for attempt in range(self.max_retries + 1):
+            _phase_timings.__dict__.clear()
+            start = time.perf_counter()
+            read_timeout = self.read_timeout
+            if deadline is not None:
+                read_timeout = min(read_timeout, max(deadline - time.monotonic(), 0.01))
+            try:
+                response = self.session.post(
+                    url, timeout=(self.connect_timeout, read_timeout), **kwargs
+                )
+            except requests.exceptions.ConnectionError as e:
+                # 接続を確立できなかった場合だけはリクエストが届いていないため再試行できる
+                if (
+                    not _is_connect_failure(e)
+                    or attempt == self.max_retries
+                    or not self._sleep_before_retry(attempt, deadline)
+                ):
+                    raise
+                logger.warning(f"{self.name} connection failed, retried: {e}")
+                continue
+
+            self._log_timings(response, time.perf_counter() - start, attempt)
+            if (
+                response.status_code in RETRY_STATUS_CODES
+                and attempt < self.max_retries
+                and self._sleep_before_retry(attempt, deadline, _retry_after(response))
+            ):
+                logger.warning(f"{self.name} returned {response.status_code}, retried")
+                continue
+            return response
+
+    def _sleep_before_retry(self, attempt, deadline, retry_after=None):
+        """
+        ジッター付きの指数バックオフで待つ。Retry-After がある場合は少なくともその時間を待つ。
+
+        Returns:
+            bool: 待った場合は True。全体の上限の時刻までに待てない場合は待たずに False
+        """
+        delay = random.uniform(0, min(self.backoff * 2**attempt, MAX_BACKOFF_SECONDS))
+        if retry_after is not None:
+            if retry_after > MAX_RETRY_AFTER_SECONDS:
+                return False
+            delay = max(delay, retry_after)
+        if deadline is not None and time.monotonic() + delay >= deadline:
+            return False
+        time.sleep(delay)
+        return True
+
+    def _log_timings(self, response, total, attempt):
+        """接続・TLS・最初のバイトまで・全体の時間をログに出力する"""
+        try:
+            self._write_timings(response, total, attempt)
+        except Exception as e:
+            # 計測の失敗でリクエストを失敗させない
+            logger.warning(f"Failed to log {self.name} request timings: {e}")
+
+    def _write_timings(self, response, total, attempt):
+        connect = getattr(_phase_timings, "connect", None)
+        tls = getattr(_phase_timings, "tls", None)
+        # elapsed はリクエストの送信開始からレスポンスヘッダーの受信までの時間
+        ttfb = response.elapsed.total_seconds() - (connect or 0.0) - (tls or 0.0)
+        logger.info(
+            f"{self.name} request timings: "
+            + (
+                f"connect={connect * 1000:.0f}ms tls={tls * 1000:.0f}ms "
+                if connect is not None and tls is not None
+                else "connection=reused "
+            )
+            + f"ttfb={ttfb * 1000:.0f}ms total={total * 1000:.0f}ms "
+            f"status={response.status_code} attempt={attempt + 1}"
+        )
@@ -0,0 +1,228 @@
+import hashlib
+import json
+import logging
+import os
+import time
+
+from botocore.exceptions import ClientError
+
+from common import aws
+
+logger = logging.getLogger(__name__)
+
+STATUS_IN_PROGRESS = "IN_PROGRESS"
+STATUS_COMPLETED = "COMPLETED"
+
+# 処理中のレコードを他のリクエストが引き継げるようになるまでの時間（秒）
+DEFAULT_LOCK_SECONDS = 60
+# 完了したレコードを保持する時間（秒）。DynamoDBのTTLで削除される
+DEFAULT_TTL_SECONDS = 24 * 60 * 60
+
+
+class IdempotencyConflictError(Exception):
+    """同じ日付のリクエストが処理中、または冪等キーが別のリクエストに使われている場合の例外"""
+
+
+def request_fingerprint(*values):
+    """
+    リクエストの内容から冪等性の判定に使うハッシュ値を返す。
+
+    Args:
+        *values: リクエストを構成する値（JSONに変換できること）
+
+    Returns:
+        str: SHA-256のハッシュ値（16進数）
+    """
+    payload = json.dumps(values, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class IdempotencyStore:
+    """
+    (user_id, date) ごとに冪等キーと処理結果を保存するクラス。
+
+    begin で条件付き書き込みによりレコードを確保し、complete で結果を保存する。
+    同じ冪等キーで再送されたリクエストには保存済みの結果を返す。
+    テーブル名が未設定の場合は無効となる。
+
+    Attributes:
+        table_name (str): 冪等性レコードを保存するテーブル名
+        lock_seconds (int): 処理中のレコードを引き継げるようになるまでの時間（秒）
+        ttl_seconds (int): 完了したレコードを保持する時間（秒）
+    """
+
+    def __init__(self, table_name, dynamodb=None, lock_seconds=None, ttl_seconds=None):
+        """
+        IdempotencyStoreの初期化メソッド。
+
+        Args:
+            table_name (str): 冪等性レコードを保存するテーブル名
+            dynamodb (object): 使用するDynamoDBリソース。未指定の場合は初回利用時に生成する。
+            lock_seconds (int): 処理中のレコードを引き継げるようになるまでの時間（秒）。
+                未指定の場合は環境変数から取得する。
+            ttl_seconds (int): 完了したレコードを保持する時間（秒）。未指定の場合は環境変数から取得する。
+        """
+        self.table_name = table_name
+        self._dynamodb = dynamodb
+        self.lock_seconds = (
+            lock_seconds
+            if lock_seconds is not None
+            else int(os.environ.get("IDEMPOTENCY_LOCK_SECONDS", DEFAULT_LOCK_SECONDS))
+        )
+        self.ttl_seconds = (
+            ttl_seconds
+            if ttl_seconds is not None
+            else int(os.environ.get("IDEMPOTENCY_TTL_SECONDS", DEFAULT_TTL_SECONDS))
+        )
+
+    @property
+    def enabled(self):
+        """保存先テーブルが設定されているかどうか"""
+        return bool(self.table_name)
+
+    @property
+    def table(self):
+        """冪等性レコードを保存するテーブルを返す。"""
+        if self._dynamodb is None:
+            self._dynamodb = aws.resource("dynamodb")
+        return self._dynamodb.Table(self.table_name)
+
+    def begin(self, user_id, date, idempotency_key, fingerprint):
+        """
+        リクエストの処理を開始する。
+
+        レコードが無い場合、別の冪等キーの処理が完了している場合、
+        処理中のレコードのロックが切れている場合にレコードを確保する。
+
+        Args:
+            user_id (str): ユーザーのID
+            date (str): 日記の日付
+            idempotency_key (str): 冪等キー
+            fingerprint (str): リクエスト内容のハッシュ値
+
+        Returns:
+            dict: 同じ冪等キーの処理が完了している場合は保存済みの結果。確保できた場合は None。
+
+        Raises:
+            IdempotencyConflictError: 同じ日付のリクエストが処理中の場合、
+                または冪等キーが異なる内容のリクエストに使われている場合
+        """
+        now = int(time.time())
+        try:
+            self.table.put_item(
+                Item={
+                    "user_id": user_id,
+                    "date": date,
+                    "idempotency_key": idempotency_key,
+                    "fingerprint": fingerprint,
+                    "status": STATUS_IN_PROGRESS,
+                    "lock_expires_at": now + self.lock_seconds,
+                    "expires_at": now + self.ttl_seconds,
+                },
+                ConditionExpression=(
+                    "attribute_not_exists(user_id)"
+                    " OR (#status = :completed AND idempotency_key <> :key)"
+                    " OR (#status = :in_progress AND lock_expires_at < :now)"
+                ),
+                ExpressionAttributeNames={"#status": "status"},
+                ExpressionAttributeValues={
+                    ":completed": STATUS_COMPLETED,
+                    ":in_progress": STATUS_IN_PROGRESS,
+                    ":key": idempotency_key,
+                    ":now": now,
+                },
+            )
+            return None
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                raise
+
+        item = self.table.get_item(
+            Key={"user_id": user_id, "date": date}, ConsistentRead=True
+        ).get("Item")
+        if item is None or item["idempotency_key"] != idempotency_key:
+            raise IdempotencyConflictError(
+                "Error: Another request for this date is in progress."
+            )
+        if item.get("fingerprint") != fingerprint:
+            raise IdempotencyConflictError(
+                "Error: Idempotency key was already used for a different request."
+            )
+        if item["status"] != STATUS_COMPLETED:
+            raise IdempotencyConflictError(
+                "Error: A request with this idempotency key is in progress."
+            )
+
+        logger.info(f"Replaying stored result for idempotency key {idempotency_key}")
+        return json.loads(item["result"])
+
+    def complete(self, user_id, date, idempotency_key, result):
+        """
+        処理結果を保存し、レコードを完了状態にする。
+
+        Args:
+            user_id (str): ユーザーのID
+            date (str): 日記の日付
+            idempotency_key (str): 冪等キー
+            result (dict): 再送時に返す処理結果（JSONに変換できること）
+        """
+        self.table.update_item(
+            Key={"user_id": user_id, "date": date},
+            UpdateExpression="SET #status = :completed, #result = :result"
+            " REMOVE lock_expires_at",
+            ConditionExpression="idempotency_key = :key",
+            ExpressionAttributeNames={"#status": "status", "#result": "result"},
+            ExpressionAttributeValues={
+                ":completed": STATUS_COMPLETED,
+                ":result": json.dumps(result, ensure_ascii=False),
+                ":key": idempotency_key,
+            },
+        )
+
+    def release(self, user_id, date, idempotency_key):
+        """
+        処理に失敗したリクエストのレコードを削除し、再送時に再実行できるようにする。
+
+        Args:
+            user_id (str): ユーザーのID
+            date (str): 日記の日付
+            idempotency_key (str): 冪等キー
+        """
+        try:
+            self.table.delete_item(
+                Key={"user_id": user_id, "date": date},
+                ConditionExpression="idempotency_key = :key AND #status = :in_progress",
+                ExpressionAttributeNames={"#status": "status"},
+                ExpressionAttributeValues={
+                    ":key": idempotency_key,
+                    ":in_progress": STATUS_IN_PROGRESS,
+                },
+            )
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                raise
+
+    def invalidate(self, user_id, date, idempotency_key):
+        """
+        完了したレコードを削除し、同じ冪等キーのリクエストを新たに処理できるようにする。
+
+        保存した結果が現在の状態と合わなくなった場合（日記が削除・編集された場合など）に使う。
+
+        Args:
+            user_id (str): ユーザーのID
+            date (str): 日記の日付
+            idempotency_key (str): 冪等キー
+        """
+        try:
+            self.table.delete_item(
+                Key={"user_id": user_id, "date": date},
+                ConditionExpression="idempotency_key = :key AND #status = :completed",
+                ExpressionAttributeNames={"#status": "status"},
+                ExpressionAttributeValues={
+                    ":key": idempotency_key,
+                    ":completed": STATUS_COMPLETED,
+                },
+            )
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                raise
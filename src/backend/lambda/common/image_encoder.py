@@ -0,0 +1,97 @@
+import os
+from io import BytesIO
+
+from PIL import Image
+
+# 既定のエンコードプロファイル
+DEFAULT_PROFILE = "png"
+
+# エンコードプロファイルの定義
+# 各プロファイルの速度とサイズは scripts/benchmark_image_encoders.py で計測できる
+ENCODER_PROFILES = {
+    # Pillowの既定設定（compress_level=6）
+    "png": {
+        "format": "PNG",
+        "content_type": "image/png",
+        "params": {},
+    },
+    # 圧縮率を下げてエンコード時間を優先する
+    "png_fast": {
+        "format": "PNG",
+        "content_type": "image/png",
+        "params": {"compress_level": 1},
+    },
+    # 最適なフィルタと圧縮を探索してサイズを優先する
+    "png_optimized": {
+        "format": "PNG",
+        "content_type": "image/png",
+        "params": {"optimize": True},
+    },
+    # 256色パレットに減色してサイズを大きく削減する（非可逆）
+    "png_palette": {
+        "format": "PNG",
+        "content_type": "image/png",
+        "params": {"optimize": True},
+        "quantize": 256,
+    },
+    # 可逆圧縮のWebP
+    "webp_lossless": {
+        "format": "WEBP",
+        "content_type": "image/webp",
+        "params": {"lossless": True, "quality": 80, "method": 4},
+    },
+}
+
+
+def resolve_profile(profile=None, formats=None):
+    """
+    エンコードプロファイル名を解決する。
+
+    Args:
+        profile (str): プロファイル名。未指定の場合は環境変数 IMAGE_ENCODER_PROFILE を使う。
+        formats (tuple): 使用できる画像形式（"PNG" など）。未指定の場合は制限しない。
+            保存先のキーや読み出し側が特定の形式を前提とする場合に指定する。
+
+    Returns:
+        str: プロファイル名
+
+    Raises:
+        ValueError: 未定義のプロファイル、または使用できない形式のプロファイルが指定された場合
+    """
+    name = profile or os.environ.get("IMAGE_ENCODER_PROFILE", DEFAULT_PROFILE)
+    if name not in ENCODER_PROFILES:
+        raise ValueError(
+            f"Error: Unknown image encoder profile {name}. "
+            f"Please use one of: {', '.join(ENCODER_PROFILES)}."
+        )
+    if formats is not None and ENCODER_PROFILES[name]["format"] not in formats:
+        allowed = [n for n, p in ENCODER_PROFILES.items() if p["format"] in formats]
+        raise ValueError(
+            f"Error: Image encoder profile {name} is not supported here. "
+            f"Please use one of: {', '.join(allowed)}."
+        )
+    return name
+
+
+def encode_image(image, profile=None):
+    """
+    画像を指定したプロファイルでエンコードする。
+
+    Args:
+        image (Image): エンコードするPILイメージオブジェクト
+        profile (str): プロファイル名。未指定の場合は環境変数 IMAGE_ENCODER_PROFILE を使う。
+
+    Returns:
+        tuple: エンコードした画像のバイト列とContent-Type
+    """
+    settings = ENCODER_PROFILES[resolve_profile(profile)]
+
+    if "quantize" in settings:
+        # RGBAのまま減色できるのは FASTOCTREE のみ
+        image = image.quantize(
+            colors=settings["quantize"], method=Image.Quantize.FASTOCTREE
+        )
+
+    buffer = BytesIO()
+    image.save(buffer, format=settings["format"], **settings["params"])
+    return buffer.getvalue(), settings["content_type"]
@@ -0,0 +1,50 @@
+import json
+import logging
+import os
+import sys
+import time
+
+# メトリクスの名前空間
+DEFAULT_NAMESPACE = "DiaryApp"
+
+# CloudWatch が取り込めるよう、接頭辞を付けずにJSONだけを標準出力に書き出すロガー。
+# Lambda の既定のハンドラーはログに時刻やレベルを付けるため、専用のハンドラーを使う。
+_metrics_logger = logging.getLogger("common.metrics.emf")
+_metrics_logger.propagate = False
+_metrics_logger.setLevel(logging.INFO)
+if not _metrics_logger.handlers:
+    _handler = logging.StreamHandler(sys.stdout)
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    _metrics_logger.addHandler(_handler)
+
+
+def put_metrics(metrics, dimensions=None, unit="Count", namespace=None):
+    """
+    CloudWatch Embedded Metric Format でメトリクスをログに出力する。
+
+    Lambda のログに出力したJSONは CloudWatch がメトリクスとして取り込むため、
+    PutMetricData の呼び出しは不要。
+
+    Args:
+        metrics (dict): メトリクス名と値の辞書
+        dimensions (dict): ディメンション名と値の辞書
+        unit (str): 単位（Count, Milliseconds など）
+        namespace (str): 名前空間。未指定の場合は環境変数 METRICS_NAMESPACE を使う。
+    """
+    dimensions = dimensions or {}
+    payload = {
+        "_aws": {
+            "Timestamp": int(time.time() * 1000),
+            "CloudWatchMetrics": [
+                {
+                    "Namespace": namespace
+                    or os.environ.get("METRICS_NAMESPACE", DEFAULT_NAMESPACE),
+                    "Dimensions": [list(dimensions)],
+                    "Metrics": [{"Name": name, "Unit": unit} for name in metrics],
+                }
+            ],
+        },
+        **dimensions,
+        **metrics,
+    }
+    _metrics_logger.info(json.dumps(payload, ensure_ascii=False))
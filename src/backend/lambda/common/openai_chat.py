@@ -0,0 +1,93 @@
+import logging
+import os
+import time
+
+from common.adaptive_limiter import AdaptiveLimiter
+from common.circuit_breaker import CircuitBreaker
+from common.hedging import Hedger
+from common.http_client import HttpClient
+from common.rate_limiter import RateLimiter
+
+logger = logging.getLogger(__name__)
+
+OPENAI_CHAT_COMPLETIONS_URL = "https://api.openai.com/v1/chat/completions"
+# レート制限のトークンが補充されるのを待つ上限（秒）
+DEFAULT_RATE_LIMIT_WAIT_SECONDS = 10.0
+
+# OpenAI への接続をウォームコンテナ間で使い回すクライアント。
+# 429 と 5xx は Retry-After を守りつつ、全体の待ち時間の上限内で指数バックオフで再試行する
+openai_client = HttpClient(
+    "openai",
+    connect_timeout=float(os.environ.get("OPENAI_CONNECT_TIMEOUT_SECONDS", 3.05)),
+    read_timeout=float(os.environ.get("OPENAI_READ_TIMEOUT_SECONDS", 20)),
+    max_retries=int(os.environ.get("OPENAI_MAX_RETRIES", 3)),
+    backoff=float(os.environ.get("OPENAI_BACKOFF_SECONDS", 0.5)),
+)
+
+# OpenAI の応答が遅い場合にリクエストをもう1つ送り、全体の待ち時間に上限を設ける
+openai_hedger = Hedger(
+    "openai",
+    budget_seconds=float(os.environ.get("OPENAI_BUDGET_SECONDS", 20)),
+    hedge_percentile=float(os.environ.get("OPENAI_HEDGE_PERCENTILE", 95)),
+    max_hedges=int(os.environ.get("OPENAI_MAX_HEDGES", 1)),
+)
+
+# OpenAI の障害中は呼び出さずに失敗させるサーキットブレーカー。状態はコンテナ間で共有する
+openai_breaker = CircuitBreaker(
+    "openai", os.environ.get("EXTERNAL_API_STATE_TABLE_NAME")
+)
+
+# アカウントのレート制限を超えないよう、すべてのコンテナで OpenAI へのリクエストの速さを揃える
+openai_rate_limiter = RateLimiter(
+    "openai",
+    os.environ.get("EXTERNAL_API_STATE_TABLE_NAME"),
+    rate=float(os.environ.get("OPENAI_RATE_LIMIT_PER_SECOND", 8)),
+    capacity=float(os.environ.get("OPENAI_RATE_LIMIT_BURST", 16)),
+)
+
+# OpenAI への同時リクエスト数を応答に応じて調整するリミッター
+openai_limiter = AdaptiveLimiter(
+    "openai", latency_target=float(os.environ.get("OPENAI_LATENCY_TARGET_SECONDS", 10))
+)
+
+
+def send_chat_request(api_key, request_data, api_endpoint=OPENAI_CHAT_COMPLETIONS_URL):
+    """
+    OpenAI の Chat Completions API を呼び出し、レスポンスの本文を返す。
+
+    keep-alive の接続を使い回し、429 と 5xx は Retry-After を守って指数バックオフで再試行する。
+    応答が直近の応答時間のパーセンタイルを超えた場合は同じリクエストをもう1つ送り、
+    先に返った応答を使う。再試行を含めた全体の待ち時間は OPENAI_BUDGET_SECONDS までとする。
+    OpenAI の障害中は呼び出さずに失敗し、同時に送るリクエストの数を応答に応じて制限する。
+    レート制限のトークンは OPENAI_RATE_LIMIT_WAIT_SECONDS まで待つ。
+
+    Args:
+        api_key (str): OpenAI APIキー
+        request_data (dict): リクエストデータ
+        api_endpoint (str): APIエンドポイント
+
+    Returns:
+        str: レスポンスの本文（JSON）
+
+    Raises:
+        RateLimitExceededError: レート制限のトークンを取得できなかった場合
+        CircuitOpenError: OpenAI の障害中で呼び出さなかった場合
+        requests.exceptions.HTTPError: エラーのレスポンスが返った場合
+    """
+    headers = {"Content-Type": "application/json", "Authorization": "Bearer " + api_key}
+
+    def send(deadline):
+        response = openai_client.post(
+            api_endpoint, deadline=deadline, headers=headers, json=request_data
+        )
+        response.raise_for_status()
+        return response.text
+
+    rate_limit_wait = float(
+        os.environ.get(
+            "OPENAI_RATE_LIMIT_WAIT_SECONDS", DEFAULT_RATE_LIMIT_WAIT_SECONDS
+        )
+    )
+    openai_rate_limiter.acquire(deadline=time.monotonic() + rate_limit_wait)
+    with openai_breaker.guard(), openai_limiter.slot():
+        return openai_hedger.call(send)
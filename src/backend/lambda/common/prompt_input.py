@@ -0,0 +1,243 @@
+import logging
+import math
+import os
+import re
+import threading
+from collections import Counter
+
+from common.metrics import put_metrics
+
+logger = logging.getLogger(__name__)
+
+# 用途ごとの入力のトークン数の上限。タイトルは花の選択より短い文脈で足りる
+DEFAULT_TOKEN_BUDGETS = {
+    "title": 512,
+    "flower": 1024,
+    "analysis": 1024,
+}
+# 用途が未登録の場合のトークン数の上限
+DEFAULT_TOKEN_BUDGET = 1024
+# 既定のトークン数の数え方
+DEFAULT_TOKEN_COUNTER = "heuristic"
+
+# ASCII の単語、ASCII の記号、それ以外の1文字に分ける
+_TOKEN_PIECES = re.compile(r"[A-Za-z0-9]+|[!-/:-@\[-`{-~]|[^\x00-\x7f]")
+# 文末の記号（英語のピリオドは後ろに空白がある場合）か改行までを1文とする。区切りの空白は文に含める
+_SENTENCES = re.compile(
+    r"(?:[^。．！？!?.\n]|\.(?!\s|$))*(?:[。．！？!?]+|\.+(?=\s|$)|\n+|$)\s*"
+)
+# 英語の1トークンあたりの文字数の目安
+ASCII_CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text):
+    """
+    外部のライブラリや通信なしでトークン数を見積もる。
+
+    ASCII の単語は4文字ごとに1トークン、記号と日本語などの非 ASCII の文字は1文字ごとに1トークンとする。
+    日本語は実際のトークン数より多めに見積もるため、上限を超えることはない。
+
+    Args:
+        text (str): 見積もる文字列
+
+    Returns:
+        int: トークン数の見積もり
+    """
+    tokens = 0
+    for piece in _TOKEN_PIECES.findall(text):
+        if piece.isascii() and piece.isalnum():
+            tokens += math.ceil(len(piece) / ASCII_CHARS_PER_TOKEN)
+        else:
+            tokens += 1
+    return tokens
+
+
+def _load_tiktoken():
+    """tiktoken が使える場合はそのトークン数の数え方を返す"""
+    import tiktoken
+
+    encoding = tiktoken.get_encoding(os.environ.get("TIKTOKEN_ENCODING", "o200k_base"))
+    return lambda text: len(encoding.encode(text))
+
+
+# 名前 -> トークン数を返す関数、または初回利用時にそれを生成する関数
+_counters = {"heuristic": estimate_tokens}
+_counter_loaders = {"tiktoken": _load_tiktoken}
+_counters_lock = threading.Lock()
+
+
+def register_token_counter(name, counter):
+    """
+    トークン数の数え方を登録する。
+
+    Args:
+        name (str): TOKEN_COUNTER で指定する名前
+        counter (callable): 文字列を受け取りトークン数を返す関数
+    """
+    with _counters_lock:
+        _counters[name] = counter
+
+
+def get_token_counter(name=None):
+    """
+    トークン数の数え方を返す。
+
+    読み込めない場合（tiktoken が未インストールの場合など）は見積もりを使う。
+
+    Args:
+        name (str): トークン数の数え方の名前。未指定の場合は環境変数 TOKEN_COUNTER を使う。
+
+    Returns:
+        callable: 文字列を受け取りトークン数を返す関数
+    """
+    name = name or os.environ.get("TOKEN_COUNTER", DEFAULT_TOKEN_COUNTER)
+    with _counters_lock:
+        if name in _counters:
+            return _counters[name]
+        loader = _counter_loaders.get(name)
+        try:
+            if loader is None:
+                raise KeyError(name)
+            _counters[name] = loader()
+        except Exception as e:
+            logger.warning(f"Failed to load token counter {name!r}, estimating: {e}")
+            _counters[name] = estimate_tokens
+        return _counters[name]
+
+
+def get_token_budget(use_case):
+    """
+    用途ごとの入力のトークン数の上限を返す。
+
+    環境変数 <用途>_INPUT_TOKEN_BUDGET（例: TITLE_INPUT_TOKEN_BUDGET）で上書きできる。
+
+    Args:
+        use_case (str): 用途（title, flower など）
+
+    Returns:
+        int: トークン数の上限
+    """
+    return int(
+        os.environ.get(
+            f"{use_case.upper()}_INPUT_TOKEN_BUDGET",
+            DEFAULT_TOKEN_BUDGETS.get(use_case, DEFAULT_TOKEN_BUDGET),
+        )
+    )
+
+
+def split_sentences(text):
+    """文末の記号か改行で文に分ける。分けた文をつなげると元の文字列に戻る"""
+    return [sentence for sentence in _SENTENCES.findall(text) if sentence]
+
+
+def summarize(text, budget, counter=estimate_tokens):
+    """
+    重要な文を選んでトークン数の上限に収める（抽出型の要約）。
+
+    書き出しと締めくくりの文を優先し、残りは多くの文に現れる語より、その文に特徴的な語
+    （文字の2-gramの TF-IDF）を多く含む文ほど重要として選ぶ。
+    選んだ文は元の順に並べる。1文も収まらない場合は先頭から上限まで切り詰める。
+
+    Args:
+        text (str): 要約する文字列
+        budget (int): トークン数の上限
+        counter (callable): 文字列を受け取りトークン数を返す関数
+
+    Returns:
+        str: 上限に収めた文字列
+    """
+    sentences = split_sentences(text)
+    bigrams = [
+        [sentence[i : i + 2] for i in range(len(sentence.strip()) - 1)]
+        for sentence in sentences
+    ]
+    document_frequencies = Counter(b for sentence in bigrams for b in set(sentence))
+
+    def score(index):
+        if not bigrams[index]:
+            return 0.0
+        weights = (
+            math.log(len(sentences) / document_frequencies[b]) for b in bigrams[index]
+        )
+        return sum(weights) / len(bigrams[index])
+
+    last = len(sentences) - 1
+    others = sorted(range(1, last), key=score, reverse=True)
+    selected = set()
+    used = 0
+    for index in dict.fromkeys([0, last, *others]):
+        tokens = counter(sentences[index])
+        if used + tokens <= budget:
+            selected.add(index)
+            used += tokens
+    summary = "".join(sentences[i] for i in sorted(selected)).strip()
+    if summary:
+        return summary
+    return truncate(text, budget, counter)
+
+
+def truncate(text, budget, counter=estimate_tokens):
+    """先頭からトークン数の上限に収まる最長の文字列を返す"""
+    low, high = 0, len(text)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if counter(text[:middle]) <= budget:
+            low = middle
+        else:
+            high = middle - 1
+    return text[:low]
+
+
+def prepare_input(text, use_case, budget=None, counter=None):
+    """
+    LLM に送る入力を用途ごとのトークン数の上限に収め、トークン数をメトリクスに出力する。
+
+    Args:
+        text (str): 日記の内容
+        use_case (str): 用途（title, flower など）。メトリクスのディメンションに使う。
+        budget (int): トークン数の上限。未指定の場合は用途ごとの上限を使う。
+        counter (callable): トークン数の数え方。未指定の場合は TOKEN_COUNTER の数え方を使う。
+
+    Returns:
+        str: 上限に収めた入力
+    """
+    budget = budget if budget is not None else get_token_budget(use_case)
+    counter = counter or get_token_counter()
+    tokens = counter(text)
+    prepared = text if tokens <= budget else summarize(text, budget, counter)
+    prepared_tokens = tokens if prepared is text else counter(prepared)
+    if prepared is not text:
+        logger.info(
+            f"Trimmed {use_case} input from {tokens} to {prepared_tokens} tokens"
+        )
+    put_metrics(
+        {
+            "InputTokens": tokens,
+            "PreparedInputTokens": prepared_tokens,
+            "InputTrimmed": int(prepared is not text),
+        },
+        dimensions={"UseCase": use_case},
+    )
+    return prepared
+
+
+def record_usage(use_case, usage):
+    """
+    LLM の応答に含まれる実際のトークン数をメトリクスに出力する。
+
+    見積もりと比べて上限を調整するために使う。
+
+    Args:
+        use_case (str): 用途（title, flower など）
+        usage (dict): 応答の usage（prompt_tokens, completion_tokens）
+    """
+    metrics = {
+        name: int(usage[key])
+        for key, name in (
+            ("prompt_tokens", "PromptTokens"),
+            ("completion_tokens", "CompletionTokens"),
+        )
+        if isinstance(usage, dict) and usage.get(key) is not None
+    }
+    if metrics:
+        put_metrics(metrics, dimensions={"UseCase": use_case})
@@ -0,0 +1,215 @@
+import logging
+import math
+import threading
+import time
+from decimal import Decimal
+
+from botocore.exceptions import ClientError
+
+from common import aws
+from common.metrics import put_metrics
+
+logger = logging.getLogger(__name__)
+
+# 1回の予約でまとめて取り出すトークンの数
+DEFAULT_BLOCK_SIZE = 4
+# 予約したトークンを使える時間（秒）。使わなかったトークンは捨てて、まとめて使われないようにする
+DEFAULT_RESERVATION_SECONDS = 1.0
+# 他のコンテナと書き込みが競合した場合に読み直す回数
+MAX_CONFLICT_RETRIES = 5
+# トークンが足りない場合に待つ間隔の下限（秒）
+MIN_WAIT_SECONDS = 0.01
+
+
+class RateLimitExceededError(Exception):
+    """レート制限のトークンを取得できなかったことを表す例外"""
+
+
+class RateLimiter:
+    """
+    すべてのコンテナで共有するトークンバケットのレートリミッター。
+
+    バケットの状態（残りのトークン数、更新時刻、バージョン）はDynamoDBの1つのアイテムに保存し、
+    バージョンを条件とした書き込みで更新する。呼び出しごとにDynamoDBを読み書きしないよう、
+    コンテナはトークンを block_size 個ずつまとめて予約し、予約の残りから取り出す。
+    トークンが足りない場合は、上限の時刻まで待つか、すぐに RateLimitExceededError を送出して
+    呼び出し側に縮退させるかを選べる。
+    DynamoDBの読み書きに失敗した場合は呼び出しを止めない。テーブル名が未設定か rate が0の場合は無効となる。
+
+    Attributes:
+        name (str): ログとメトリクスに出力する外部APIの名前
+        table_name (str): 状態を保存するテーブル名
+        rate (float): 1秒あたりに補充するトークンの数
+        capacity (float): バケットに貯められるトークンの上限（バースト）
+        block_size (int): 1回の予約でまとめて取り出すトークンの数
+        reservation_seconds (float): 予約したトークンを使える時間（秒）
+    """
+
+    def __init__(
+        self,
+        name,
+        table_name,
+        rate,
+        capacity=None,
+        block_size=DEFAULT_BLOCK_SIZE,
+        reservation_seconds=DEFAULT_RESERVATION_SECONDS,
+        dynamodb=None,
+    ):
+        """
+        RateLimiterの初期化メソッド。
+
+        Args:
+            name (str): ログとメトリクスに出力する外部APIの名前
+            table_name (str): 状態を保存するテーブル名
+            rate (float): 1秒あたりに補充するトークンの数
+            capacity (float): バケットに貯められるトークンの上限。未指定の場合は rate と同じ。
+            block_size (int): 1回の予約でまとめて取り出すトークンの数
+            reservation_seconds (float): 予約したトークンを使える時間（秒）
+            dynamodb (object): 使用するDynamoDBリソース。未指定の場合は初回利用時に生成する。
+        """
+        self.name = name
+        self.table_name = table_name
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else rate)
+        self.block_size = max(1, int(block_size))
+        self.reservation_seconds = reservation_seconds
+        self._dynamodb = dynamodb
+        # 前回読み書きしたバケットの状態。条件付き書き込みの条件に使う
+        self._bucket = None
+        self._reserved = 0
+        self._reserved_until = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        """状態を保存するテーブルと補充の速さが設定されているかどうか"""
+        return bool(self.table_name) and self.rate > 0
+
+    @property
+    def table(self):
+        """状態を保存するテーブルを返す。"""
+        if self._dynamodb is None:
+            self._dynamodb = aws.resource("dynamodb")
+        return self._dynamodb.Table(self.table_name)
+
+    @property
+    def key(self):
+        return {"name": f"ratelimit#{self.name}"}
+
+    def acquire(self, deadline=None):
+        """
+        トークンを1つ取得する。
+
+        Args:
+            deadline (float): トークンが補充されるのを待つ上限の時刻（time.monotonic）。
+                未指定の場合は待たずに失敗させ、呼び出し側に縮退させる。
+
+        Raises:
+            RateLimitExceededError: 上限の時刻までにトークンを取得できなかった場合
+        """
+        if not self.enabled:
+            return
+        while True:
+            wait_seconds = self.try_acquire()
+            if wait_seconds == 0:
+                return
+            remaining = (deadline or 0) - time.monotonic()
+            if remaining <= 0:
+                put_metrics({"RateLimited": 1}, dimensions={"Client": self.name})
+                raise RateLimitExceededError(f"{self.name} rate limit exceeded")
+            time.sleep(min(max(wait_seconds, MIN_WAIT_SECONDS), remaining))
+
+    def try_acquire(self):
+        """
+        待たずにトークンを1つ取得する。
+
+        Returns:
+            float: 取得できた場合は0。取得できなかった場合はトークンが補充されるまでの見込み時間（秒）
+        """
+        with self._lock:
+            if self._reserved > 0 and time.monotonic() < self._reserved_until:
+                self._reserved -= 1
+                return 0
+            self._reserved = 0
+            taken, wait_seconds = self._reserve()
+            if taken == 0:
+                return wait_seconds
+            self._reserved = taken - 1
+            self._reserved_until = time.monotonic() + self.reservation_seconds
+            return 0
+
+    def _reserve(self):
+        """
+        バケットからトークンを最大 block_size 個取り出す。
+
+        Returns:
+            tuple: (取り出したトークンの数, 取り出せなかった場合に補充されるまでの見込み時間（秒）)
+        """
+        for _ in range(MAX_CONFLICT_RETRIES):
+            try:
+                bucket = self._bucket or self._read()
+            except Exception as e:
+                return self._fail_open(e)
+            now = int(time.time() * 1000)
+            elapsed = max(now - (bucket["updated_at"] or now), 0) / 1000
+            tokens = min(self.capacity, bucket["tokens"] + elapsed * self.rate)
+            taken = min(self.block_size, math.floor(tokens))
+            if taken < 1:
+                self._bucket = None
+                return 0, (1 - tokens) / self.rate
+            new_bucket = {
+                "tokens": tokens - taken,
+                "updated_at": now,
+                "version": bucket["version"] + 1,
+            }
+            try:
+                self._write(bucket, new_bucket)
+            except ClientError as e:
+                if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                    return self._fail_open(e)
+                # 他のコンテナが先に取り出したため、状態を読み直す
+                self._bucket = None
+                continue
+            except Exception as e:
+                return self._fail_open(e)
+            self._bucket = new_bucket
+            return taken, 0.0
+        # 競合が続く場合はバケットが混み合っているため、少し待たせる
+        return 0, 1 / self.rate
+
+    def _read(self):
+        item = self.table.get_item(Key=self.key, ConsistentRead=True).get("Item")
+        if item is None:
+            # 一度も使われていないバケットは満タンとする
+            return {"tokens": self.capacity, "updated_at": None, "version": 0}
+        return {
+            "tokens": float(item["tokens"]),
+            "updated_at": int(item["updated_at"]),
+            "version": int(item["version"]),
+        }
+
+    def _write(self, seen, bucket):
+        """見た時点の状態から変わっていない場合だけバケットの状態を書き込む"""
+        if seen["version"] == 0:
+            condition = "attribute_not_exists(version)"
+            values = {}
+        else:
+            condition = "version = :seen"
+            values = {":seen": seen["version"]}
+        self.table.update_item(
+            Key=self.key,
+            UpdateExpression="SET tokens = :tokens, updated_at = :now, version = :version",
+            ConditionExpression=condition,
+            ExpressionAttributeValues={
+                ":tokens": Decimal(str(round(bucket["tokens"], 6))),
+                ":now": bucket["updated_at"],
+                ":version": bucket["version"],
+                **values,
+            },
+        )
+
+    def _fail_open(self, error):
+        # 状態を共有できない場合も外部APIの呼び出しは止めない
+        logger.warning(f"Failed to access {self.name} rate limit state: {error}")
+        self._bucket = None
+        return 1, 0.0
@@ -0,0 +1,153 @@
+import logging
+import os
+import threading
+import time
+
+from botocore.exceptions import ClientError
+
+from common import aws
+
+logger = logging.getLogger(__name__)
+
+# 取得した値の有効期間（秒）
+DEFAULT_TTL_SECONDS = 300
+# 有効期限のこの秒数前からはバックグラウンドで値を更新する
+DEFAULT_REFRESH_AHEAD_SECONDS = 60
+# スロットリング時に前回の値を使い続け、再取得を控える時間（秒）
+THROTTLE_BACKOFF_SECONDS = 10
+# SSMがスロットリング時に返すエラーコード
+THROTTLING_ERROR_CODES = ("ThrottlingException", "TooManyRequestsException")
+
+
+class SecretsProvider:
+    """
+    SSMパラメータストアの復号済みの値をウォームコンテナ間でTTL付きで保持するクラス。
+
+    有効期限が近づいた値はバックグラウンドで更新し、呼び出し元は待たずに現在の値を受け取る。
+    SSMがスロットリングした場合は、前回取得した値があればそれを返す。
+
+    Attributes:
+        ttl (float): 取得した値の有効期間（秒）
+        refresh_ahead (float): 有効期限の何秒前からバックグラウンドで更新するか
+    """
+
+    def __init__(self, ssm_client=None, ttl=None, refresh_ahead=None):
+        """
+        SecretsProviderの初期化メソッド。
+
+        Args:
+            ssm_client (object): 使用するSSMクライアント。未指定の場合は取得のたびに生成する。
+            ttl (float): 取得した値の有効期間（秒）。未指定の場合は環境変数から取得する。
+            refresh_ahead (float): 有効期限の何秒前からバックグラウンドで更新するか。
+                未指定の場合は環境変数から取得する。
+        """
+        self._ssm = ssm_client
+        self.ttl = (
+            ttl
+            if ttl is not None
+            else float(os.environ.get("SECRETS_TTL_SECONDS", DEFAULT_TTL_SECONDS))
+        )
+        self.refresh_ahead = (
+            refresh_ahead
+            if refresh_ahead is not None
+            else float(
+                os.environ.get(
+                    "SECRETS_REFRESH_AHEAD_SECONDS", DEFAULT_REFRESH_AHEAD_SECONDS
+                )
+            )
+        )
+        # パラメータ名 -> (値, 有効期限)
+        self._values = {}
+        self._refreshing = set()
+        self._lock = threading.Lock()
+
+    def get(self, name):
+        """
+        パラメータの復号済みの値を返す。
+
+        Args:
+            name (str): パラメータ名
+
+        Returns:
+            str: パラメータの値
+
+        Raises:
+            ClientError: 取得に失敗し、スロットリング時に返せる前回の値も無い場合
+        """
+        now = time.monotonic()
+        with self._lock:
+            cached = self._values.get(name)
+            if cached is not None:
+                value, expires_at = cached
+                if now < expires_at - self.refresh_ahead:
+                    return value
+                if now < expires_at:
+                    self._start_refresh(name)
+                    return value
+
+        return self._fetch(name)
+
+    def clear(self):
+        """保持している値をすべて破棄する。"""
+        with self._lock:
+            self._values.clear()
+
+    def _fetch(self, name):
+        """SSMから値を取得して保持する。スロットリング時は前回の値を返す。"""
+        ssm = self._ssm or aws.client("ssm")
+        try:
+            response = ssm.get_parameter(Name=name, WithDecryption=True)
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") not in THROTTLING_ERROR_CODES:
+                raise
+            with self._lock:
+                cached = self._values.get(name)
+                if cached is None:
+                    raise
+                # 直後の呼び出しがSSMを再び叩かないよう、少しの間だけ前回の値を使い続ける
+                value = cached[0]
+                self._values[name] = (
+                    value,
+                    time.monotonic() + self.refresh_ahead + THROTTLE_BACKOFF_SECONDS,
+                )
+            logger.warning(f"SSM throttled while fetching {name}, using cached value")
+            return value
+
+        value = response["Parameter"]["Value"]
+        with self._lock:
+            self._values[name] = (value, time.monotonic() + self.ttl)
+        return value
+
+    def _start_refresh(self, name):
+        """バックグラウンドでの更新を開始する。ロックを保持した状態で呼び出すこと。"""
+        if name in self._refreshing:
+            return
+        self._refreshing.add(name)
+        threading.Thread(target=self._refresh, args=(name,), daemon=True).start()
+
+    def _refresh(self, name):
+        """バックグラウンドで値を更新する。失敗しても現在の値を使い続ける。"""
+        try:
+            self._fetch(name)
+        except Exception as e:
+            logger.warning(f"Failed to refresh parameter {name}: {e}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(name)
+
+
+# ウォームコンテナ間で共有するプロバイダー
+default_provider = SecretsProvider()
+
+
+def get_secret(name):
+    """
+    共有のプロバイダーからパラメータの復号済みの値を返す。
+
+    Args:
+        name (str): パラメータ名
+
+    Returns:
+        str: パラメータの値
+    """
+    return default_provider.get(name)
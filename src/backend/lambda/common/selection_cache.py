@@ -0,0 +1,190 @@
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+from common import aws
+from common.metrics import put_metrics
+
+logger = logging.getLogger(__name__)
+
+# キャッシュした選択結果を保持する期間（秒）。DynamoDBのTTLで削除される
+DEFAULT_TTL_SECONDS = 30 * 24 * 60 * 60
+# コンテナ内のLRUに保持する件数。0の場合はLRUを使わない
+DEFAULT_LRU_SIZE = 256
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_content(content):
+    """
+    キャッシュのキーに使うために日記の内容を正規化する。
+
+    全角・半角の揺れ（NFKC）、大文字・小文字、空白の有無を同一視する。
+
+    Args:
+        content (str): 日記の内容
+
+    Returns:
+        str: 正規化した内容
+    """
+    normalized = unicodedata.normalize("NFKC", content).casefold()
+    return _WHITESPACE.sub("", normalized)
+
+
+def content_hash(content):
+    """
+    正規化した日記の内容のハッシュ値を返す。
+
+    Args:
+        content (str): 日記の内容
+
+    Returns:
+        str: SHA-256のハッシュ値（16進数）
+    """
+    return hashlib.sha256(normalize_content(content).encode("utf-8")).hexdigest()
+
+
+class SelectionCache:
+    """
+    日記の内容のハッシュ値ごとに花の選択結果を保存するキャッシュ。
+
+    同じ内容（定型文や再投稿など）の日記は外部APIを呼び出さずに保存済みの花のIDを返す。
+    DynamoDBのテーブルの手前にコンテナ内のLRUを置くことができる。
+    ヒット・ミスの件数はメトリクスとして出力する。テーブル名が未設定の場合は無効となる。
+
+    Attributes:
+        table_name (str): 選択結果を保存するテーブル名
+        ttl_seconds (int): 選択結果を保持する期間（秒）
+        lru_size (int): コンテナ内のLRUに保持する件数
+        stats (dict): コンテナ内でのヒット・ミスの件数
+    """
+
+    def __init__(self, table_name, dynamodb=None, ttl_seconds=None, lru_size=None):
+        """
+        SelectionCacheの初期化メソッド。
+
+        Args:
+            table_name (str): 選択結果を保存するテーブル名
+            dynamodb (object): 使用するDynamoDBリソース。未指定の場合は初回利用時に生成する。
+            ttl_seconds (int): 選択結果を保持する期間（秒）。未指定の場合は環境変数から取得する。
+            lru_size (int): コンテナ内のLRUに保持する件数。未指定の場合は環境変数から取得する。
+        """
+        self.table_name = table_name
+        self._dynamodb = dynamodb
+        self.ttl_seconds = (
+            ttl_seconds
+            if ttl_seconds is not None
+            else int(os.environ.get("FLOWER_CACHE_TTL_SECONDS", DEFAULT_TTL_SECONDS))
+        )
+        self.lru_size = (
+            lru_size
+            if lru_size is not None
+            else int(os.environ.get("FLOWER_CACHE_LRU_SIZE", DEFAULT_LRU_SIZE))
+        )
+        self.stats = {"lru_hits": 0, "hits": 0, "misses": 0}
+        # content_hash -> (flower_id, 有効期限（UNIX時刻）)
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        """保存先テーブルが設定されているかどうか"""
+        return bool(self.table_name)
+
+    @property
+    def table(self):
+        """選択結果を保存するテーブルを返す。"""
+        if self._dynamodb is None:
+            self._dynamodb = aws.resource("dynamodb")
+        return self._dynamodb.Table(self.table_name)
+
+    def get(self, content):
+        """
+        日記の内容に対する保存済みの花のIDを返す。
+
+        取得に失敗した場合はミスとして扱い、呼び出し元の処理を止めない。
+
+        Args:
+            content (str): 日記の内容
+
+        Returns:
+            str: 花のID。保存されていない場合は None。
+        """
+        key = content_hash(content)
+        now = int(time.time())
+
+        with self._lock:
+            cached = self._lru.get(key)
+            if cached is not None and cached[1] > now:
+                self._lru.move_to_end(key)
+            else:
+                cached = None
+        # _record はロックを取得するため、ロックを解放してから記録する
+        if cached is not None:
+            self._record("lru_hits")
+            return cached[0]
+
+        try:
+            item = self.table.get_item(Key={"content_hash": key}).get("Item")
+        except Exception as e:
+            logger.warning(f"Failed to read flower selection cache: {e}")
+            item = None
+
+        # TTLによる削除は遅れることがあるため、期限切れのアイテムはミスとする
+        if item is None or int(item["expires_at"]) <= now:
+            self._record("misses")
+            return None
+
+        self._remember(key, item["flower_id"], int(item["expires_at"]))
+        self._record("hits")
+        return item["flower_id"]
+
+    def put(self, content, flower_id):
+        """
+        日記の内容に対する花の選択結果を保存する。
+
+        保存に失敗しても例外は送出しない。
+
+        Args:
+            content (str): 日記の内容
+            flower_id (str): 選択された花のID
+        """
+        key = content_hash(content)
+        expires_at = int(time.time()) + self.ttl_seconds
+        self._remember(key, flower_id, expires_at)
+        try:
+            self.table.put_item(
+                Item={
+                    "content_hash": key,
+                    "flower_id": flower_id,
+                    "expires_at": expires_at,
+                }
+            )
+        except Exception as e:
+            logger.warning(f"Failed to write flower selection cache: {e}")
+
+    def _remember(self, key, flower_id, expires_at):
+        """コンテナ内のLRUに保持し、上限を超えた古いものから破棄する"""
+        if self.lru_size <= 0:
+            return
+        with self._lock:
+            self._lru[key] = (flower_id, expires_at)
+            self._lru.move_to_end(key)
+            while len(self._lru) > self.lru_size:
+                self._lru.popitem(last=False)
+
+    def _record(self, result):
+        """ヒット・ミスの件数を数え、メトリクスとして出力する"""
+        with self._lock:
+            self.stats[result] += 1
+        name = {
+            "lru_hits": "FlowerCacheLruHit",
+            "hits": "FlowerCacheHit",
+            "misses": "FlowerCacheMiss",
+        }[result]
+        put_metrics({name: 1})
@@ -0,0 +1,267 @@
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+from botocore.exceptions import ClientError
+
+from common import aws
+from common.metrics import put_metrics
+
+logger = logging.getLogger(__name__)
+
+# リースを取得したコンテナが結果を保存するまでの時間（秒）。過ぎた場合は他のコンテナが引き継ぐ
+DEFAULT_LEASE_SECONDS = 30
+# 他のコンテナの結果を待つ上限（秒）。過ぎた場合は自分で呼び出す
+DEFAULT_WAIT_SECONDS = 25
+# 保存した結果を使い回す時間（秒）。DynamoDBのTTLで削除される
+DEFAULT_RESULT_SECONDS = 60
+# 他のコンテナの結果を確認する間隔（秒）
+DEFAULT_POLL_SECONDS = 0.25
+
+
+class _Call:
+    """コンテナ内で実行中の呼び出し"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    同じキーの同時の呼び出しを1回にまとめるシングルフライト。
+
+    コンテナ内では、同じキーで実行中の呼び出しがあればその完了を待ち、結果（または例外）を使い回す。
+    コンテナ間では、外部APIの状態テーブルに短命なリースのアイテムを条件付き書き込みで作成し、
+    リースを取得したコンテナだけが呼び出して結果をアイテムに保存する。
+    他のコンテナは保存された結果を待って使い回し、リースが切れた場合は引き継ぎ、
+    待つ上限を過ぎた場合は自分で呼び出す。
+    呼び出しごとに、まとめられたかどうかをメトリクスとして出力する。
+    DynamoDBの読み書きに失敗した場合は自分で呼び出す。テーブル名が未設定の場合はコンテナ内だけでまとめる。
+
+    Attributes:
+        name (str): ログとメトリクスに出力する処理の名前
+        table_name (str): リースを保存するテーブル名
+        lease_seconds (float): リースを取得したコンテナが結果を保存するまでの時間（秒）
+        wait_seconds (float): 他のコンテナの結果を待つ上限（秒）
+        result_seconds (float): 保存した結果を使い回す時間（秒）
+    """
+
+    def __init__(
+        self,
+        name,
+        table_name,
+        lease_seconds=None,
+        wait_seconds=None,
+        result_seconds=None,
+        dynamodb=None,
+    ):
+        """
+        SingleFlightの初期化メソッド。
+
+        Args:
+            name (str): ログとメトリクスに出力する処理の名前
+            table_name (str): リースを保存するテーブル名
+            lease_seconds (float): リースの時間（秒）。未指定の場合は環境変数から取得する。
+            wait_seconds (float): 結果を待つ上限（秒）。未指定の場合は環境変数から取得する。
+            result_seconds (float): 結果を使い回す時間（秒）。未指定の場合は環境変数から取得する。
+            dynamodb (object): 使用するDynamoDBリソース。未指定の場合は初回利用時に生成する。
+        """
+        self.name = name
+        self.table_name = table_name
+        self.lease_seconds = float(
+            lease_seconds
+            if lease_seconds is not None
+            else os.environ.get("SINGLE_FLIGHT_LEASE_SECONDS", DEFAULT_LEASE_SECONDS)
+        )
+        self.wait_seconds = float(
+            wait_seconds
+            if wait_seconds is not None
+            else os.environ.get("SINGLE_FLIGHT_WAIT_SECONDS", DEFAULT_WAIT_SECONDS)
+        )
+        self.result_seconds = float(
+            result_seconds
+            if result_seconds is not None
+            else os.environ.get("SINGLE_FLIGHT_RESULT_SECONDS", DEFAULT_RESULT_SECONDS)
+        )
+        self.poll_seconds = DEFAULT_POLL_SECONDS
+        self._dynamodb = dynamodb
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        """リースを保存するテーブルが設定されているかどうか"""
+        return bool(self.table_name)
+
+    @property
+    def table(self):
+        """リースを保存するテーブルを返す。"""
+        if self._dynamodb is None:
+            self._dynamodb = aws.resource("dynamodb")
+        return self._dynamodb.Table(self.table_name)
+
+    def item_key(self, key):
+        return {"name": f"singleflight#{self.name}#{key}"}
+
+    def do(self, key, fn):
+        """
+        同じキーの呼び出しをまとめて fn を実行し、結果を返す。
+
+        Args:
+            key (str): 呼び出しをまとめるキー（request_fingerprint などのハッシュ値）
+            fn (callable): 引数なしで呼び出す処理。結果はJSONに変換できること。
+
+        Returns:
+            object: fn の結果、または同じキーの他の呼び出しの結果。
+                他のコンテナの結果はJSONから復元するため、タプルはリストになる。
+
+        Raises:
+            Exception: fn が送出した例外。同じコンテナで待っていた呼び出しにも同じ例外を送出する。
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            # 実行中の呼び出しは fn かリースを待つ上限のどちらかで必ず完了する
+            call.done.wait()
+            self._put_metrics(container=True)
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = self._do_shared(key, fn)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def _do_shared(self, key, fn):
+        """リースを使って他のコンテナと呼び出しをまとめる"""
+        if not self.enabled:
+            self._put_metrics()
+            return fn()
+
+        owner = uuid.uuid4().hex
+        deadline = time.monotonic() + self.wait_seconds
+        while True:
+            try:
+                if self._acquire(key, owner):
+                    break
+                item = self._read(key)
+            except Exception as e:
+                logger.warning(f"Failed to access {self.name} single flight lease: {e}")
+                self._put_metrics()
+                return fn()
+            if item is not None and "result" in item:
+                logger.info(f"Reusing {self.name} result from another container")
+                self._put_metrics(lease=True)
+                return json.loads(item["result"])
+            if time.monotonic() >= deadline:
+                logger.warning(f"Timed out waiting for {self.name} single flight lease")
+                self._put_metrics(timeout=True)
+                return fn()
+            time.sleep(self.poll_seconds)
+
+        self._put_metrics()
+        try:
+            result = fn()
+        except Exception:
+            self._release(key, owner)
+            raise
+        self._complete(key, owner, result)
+        return result
+
+    def _acquire(self, key, owner):
+        """
+        リースを取得する。
+
+        アイテムが無い場合、保存した結果の期限が切れている場合、
+        結果が保存されないままリースが切れている場合に取得できる。
+
+        Returns:
+            bool: 取得できた場合は True
+        """
+        now = int(time.time())
+        try:
+            self.table.put_item(
+                Item={
+                    **self.item_key(key),
+                    "owner": owner,
+                    "lease_expires_at": now + int(self.lease_seconds),
+                    "expires_at": now + int(self.lease_seconds + self.result_seconds),
+                },
+                ConditionExpression=(
+                    "attribute_not_exists(#name) OR expires_at < :now"
+                    " OR (attribute_not_exists(#result) AND lease_expires_at < :now)"
+                ),
+                ExpressionAttributeNames={"#name": "name", "#result": "result"},
+                ExpressionAttributeValues={":now": now},
+            )
+            return True
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                raise
+            return False
+
+    def _read(self, key):
+        item = self.table.get_item(Key=self.item_key(key), ConsistentRead=True).get(
+            "Item"
+        )
+        if item is None or int(item["expires_at"]) < int(time.time()):
+            return None
+        return item
+
+    def _complete(self, key, owner, result):
+        """結果を保存し、待っている他のコンテナに渡す。保存に失敗しても例外は送出しない"""
+        try:
+            self.table.update_item(
+                Key=self.item_key(key),
+                UpdateExpression="SET #result = :result, expires_at = :expires_at"
+                " REMOVE lease_expires_at",
+                ConditionExpression="#owner = :owner",
+                ExpressionAttributeNames={"#result": "result", "#owner": "owner"},
+                ExpressionAttributeValues={
+                    ":result": json.dumps(result, ensure_ascii=False),
+                    ":expires_at": int(time.time() + self.result_seconds),
+                    ":owner": owner,
+                },
+            )
+        except Exception as e:
+            logger.warning(f"Failed to save {self.name} single flight result: {e}")
+
+    def _release(self, key, owner):
+        """失敗した呼び出しのリースを削除し、待っている他のコンテナに引き継がせる"""
+        try:
+            self.table.delete_item(
+                Key=self.item_key(key),
+                ConditionExpression="#owner = :owner AND attribute_not_exists(#result)",
+                ExpressionAttributeNames={"#owner": "owner", "#result": "result"},
+                ExpressionAttributeValues={":owner": owner},
+            )
+        except Exception as e:
+            logger.warning(f"Failed to release {self.name} single flight lease: {e}")
+
+    def _put_metrics(self, container=False, lease=False, timeout=False):
+        # 平均を取ると、それぞれの方法でまとめられた呼び出しの割合になる
+        put_metrics(
+            {
+                "SingleFlightCalls": 1,
+                "SingleFlightCoalescedInContainer": int(container),
+                "SingleFlightCoalescedByLease": int(lease),
+                "SingleFlightLeaseTimeout": int(timeout),
+            },
+            dimensions={"Operation": self.name},
+        )
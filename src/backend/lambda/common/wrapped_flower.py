@@ -0,0 +1,247 @@
+import json
+import logging
+import os
+import random
+import threading
+import time
+from datetime import datetime
+
+from botocore.exceptions import ClientError
+
+from common import aws
+from common.asset_cache import AssetCache
+from common.compositing import centered_x, composite
+from common.image_encoder import encode_image
+
+logger = logging.getLogger(__name__)
+
+# パレット（背景）のサイズ
+PALETTE_SIZE = (700, 700)
+# 包装紙を貼り付ける縦方向の位置
+WRAPER_OFFSET_Y = 75
+
+FLOWER_PREFIX = "single_flowers/"
+WRAPER_FRONT_PREFIX = "wrapers_front/"
+WRAPER_BACK_PREFIX = "wrapers_back/"
+
+# 事前レンダリング画像の保存先
+VARIANT_PREFIX = "wrapped_flowers/"
+MANIFEST_KEY = f"{VARIANT_PREFIX}manifest.json"
+# マニフェストの有効期間（秒）
+DEFAULT_MANIFEST_TTL_SECONDS = 300
+
+
+def compose_wrapped_flower(flower, wraper_front, wraper_back):
+    """
+    包装紙(back)、花、包装紙(front)の順に透明なパレットへ合成する。
+
+    Args:
+        flower (Image): 花の画像（RGBA）
+        wraper_front (Image): 包装紙(前面)の画像（RGBA）
+        wraper_back (Image): 包装紙(背面)の画像（RGBA）
+
+    Returns:
+        Image: 合成した画像（RGBA）
+    """
+    palette_width = PALETTE_SIZE[0]
+    return composite(
+        [
+            # 包装紙(背面)
+            (wraper_back, (centered_x(palette_width, wraper_back), WRAPER_OFFSET_Y)),
+            # 花（中心揃え）
+            (flower, (centered_x(palette_width, flower), 0)),
+            # 包装紙(前面)
+            (wraper_front, (centered_x(palette_width, wraper_front), WRAPER_OFFSET_Y)),
+        ],
+        size=PALETTE_SIZE,
+    )
+
+
+def asset_name(key):
+    """S3キーから拡張子を除いたファイル名を返す（例: 'single_flowers/lily1.png' -> 'lily1'）"""
+    return key.rsplit("/", 1)[-1].rsplit(".", 1)[0]
+
+
+def variant_key(flower_id, front_key, back_key, extension="png"):
+    """
+    花と包装紙の組み合わせに対応する事前レンダリング画像のキーを返す。
+
+    Args:
+        flower_id (str): 花のID
+        front_key (str): 包装紙(前面)のS3キー
+        back_key (str): 包装紙(背面)のS3キー
+        extension (str): 画像の拡張子
+
+    Returns:
+        str: 事前レンダリング画像のS3キー
+    """
+    return f"{VARIANT_PREFIX}{flower_id}/{asset_name(front_key)}__{asset_name(back_key)}.{extension}"
+
+
+class WrappedFlowerStore:
+    """
+    事前レンダリングした包装済みの花画像をマニフェスト経由で取得するクラス。
+
+    マニフェストはTTL付きでコンテナ内に保持するため、通常はGET 1回で画像を取得できる。
+    バケット名が未設定の場合は無効となり、常にNoneを返す。
+
+    Attributes:
+        bucket_name (str): 事前レンダリング画像の保存先バケット名
+        manifest_ttl (float): マニフェストの有効期間（秒）
+    """
+
+    def __init__(self, bucket_name, s3_client=None, manifest_ttl=None):
+        """
+        WrappedFlowerStoreの初期化メソッド。
+
+        Args:
+            bucket_name (str): 事前レンダリング画像の保存先バケット名
+            s3_client (object): 使用するS3クライアント。未指定の場合は初回利用時に生成する。
+            manifest_ttl (float): マニフェストの有効期間（秒）。未指定の場合は環境変数から取得する。
+        """
+        self.bucket_name = bucket_name
+        self._s3 = s3_client
+        self.manifest_ttl = (
+            manifest_ttl
+            if manifest_ttl is not None
+            else float(
+                os.environ.get(
+                    "WRAPPED_FLOWER_MANIFEST_TTL_SECONDS", DEFAULT_MANIFEST_TTL_SECONDS
+                )
+            )
+        )
+        self._manifest = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        """保存先バケットが設定されているかどうか"""
+        return bool(self.bucket_name)
+
+    @property
+    def s3(self):
+        """S3クライアントを返す。未生成の場合はここで生成する。"""
+        if self._s3 is None:
+            self._s3 = aws.client("s3")
+        return self._s3
+
+    def variants(self):
+        """
+        花のIDごとの事前レンダリング画像キー一覧を返す。
+
+        マニフェストが存在しない場合は空の辞書を返し、TTLの間は再取得しない。
+
+        Returns:
+            dict: flower_id をキー、画像キーのリストを値とする辞書
+        """
+        now = time.monotonic()
+        with self._lock:
+            if self._manifest is not None and now - self._loaded_at < self.manifest_ttl:
+                return self._manifest
+
+        try:
+            resp = self.s3.get_object(Bucket=self.bucket_name, Key=MANIFEST_KEY)
+            manifest = json.loads(resp["Body"].read())["variants"]
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") not in ("NoSuchKey", "404"):
+                raise
+            logger.info("Wrapped flower manifest not found, using live compositing")
+            manifest = {}
+
+        with self._lock:
+            self._manifest = manifest
+            self._loaded_at = now
+        return manifest
+
+    def pick_variant_key(self, flower_id):
+        """
+        指定した花の事前レンダリング画像のキーをランダムに1つ選択する。
+
+        Args:
+            flower_id (str): 花のID
+
+        Returns:
+            str: 画像のS3キー。該当する画像が無い場合は None。
+        """
+        if not self.enabled:
+            return None
+
+        keys = self.variants().get(flower_id)
+        if not keys:
+            return None
+        return random.choice(keys)
+
+    def get_variant(self, flower_id):
+        """
+        指定した花の事前レンダリング画像をランダムに1つ取得する。
+
+        Args:
+            flower_id (str): 花のID
+
+        Returns:
+            bytes: PNG画像のバイト列。該当する画像が無い場合は None。
+        """
+        key = self.pick_variant_key(flower_id)
+        if key is None:
+            return None
+
+        resp = self.s3.get_object(Bucket=self.bucket_name, Key=key)
+        return resp["Body"].read()
+
+
+def prerender_wrapped_flowers(
+    source_bucket, cache_bucket, s3_client=None, encoder_profile=None
+):
+    """
+    すべての花と包装紙(front/back)の組み合わせを事前にレンダリングし、
+    画像とマニフェストをキャッシュ用バケットに保存する。
+
+    Args:
+        source_bucket (str): 元画像の入ったバケット名
+        cache_bucket (str): 事前レンダリング画像の保存先バケット名
+        s3_client (object): 使用するS3クライアント。未指定の場合は新たに生成する。
+        encoder_profile (str): 画像のエンコードプロファイル。未指定の場合は環境変数から取得する。
+
+    Returns:
+        dict: flower_id をキー、画像キーのリストを値とする辞書
+    """
+    s3 = s3_client or aws.client("s3")
+    assets = AssetCache(s3_client=s3)
+
+    flower_keys = assets.list_png_keys(source_bucket, FLOWER_PREFIX)
+    front_keys = assets.list_png_keys(source_bucket, WRAPER_FRONT_PREFIX)
+    back_keys = assets.list_png_keys(source_bucket, WRAPER_BACK_PREFIX)
+
+    variants = {}
+    for flower_key in flower_keys:
+        flower_id = asset_name(flower_key)
+        flower = assets.get_image(source_bucket, flower_key)
+        for front_key in front_keys:
+            for back_key in back_keys:
+                image = compose_wrapped_flower(
+                    flower,
+                    assets.get_image(source_bucket, front_key),
+                    assets.get_image(source_bucket, back_key),
+                )
+                body, content_type = encode_image(image, encoder_profile)
+                key = variant_key(
+                    flower_id, front_key, back_key, content_type.split("/")[-1]
+                )
+                s3.put_object(
+                    Bucket=cache_bucket,
+                    Key=key,
+                    Body=body,
+                    ContentType=content_type,
+                )
+                variants.setdefault(flower_id, []).append(key)
+        logger.info(f"Pre-rendered {len(variants[flower_id])} variants of {flower_id}")
+
+    manifest = {"generated_at": datetime.now().isoformat(), "variants": variants}
+    s3.put_object(
+        Bucket=cache_bucket,
+        Key=MANIFEST_KEY,
+        Body=json.dumps(manifest).encode("utf-8"),
+        ContentType="application/json",
+    )
+    return variants
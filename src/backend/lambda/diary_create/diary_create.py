@@ -1,19 +1,44 @@
 import base64
+import hashlib
 import json
 import logging
 import os
-import random
+import time
 import uuid
+from concurrent.futures import ThreadPoolExecutor, wait
 from datetime import datetime
-from io import BytesIO
 
-import boto3
 from botocore.exceptions import ClientError
-from PIL import Image
+from common import aws
+from common.asset_cache import AssetCache
+from common.flower_selection import select_and_save_flower
+from common.idempotency import (
+    IdempotencyConflictError,
+    IdempotencyStore,
+    request_fingerprint,
+)
+from common.image_encoder import encode_image
+from common.wrapped_flower import WrappedFlowerStore, compose_wrapped_flower
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
+# 包装紙・花の元画像はウォームコンテナ間で使い回す
+asset_cache = AssetCache()
+# 事前レンダリング済みの包装済み花画像（未設定の場合は毎回合成する）
+wrapped_flower_store = WrappedFlowerStore(os.getenv("WRAPPED_FLOWER_CACHE_BUCKET_NAME"))
+# 並行実行モードで使うスレッドプール（ウォームコンテナ間で使い回す）
+executor = ThreadPoolExecutor(max_workers=3)
+# 再送されたリクエストの重複排除に使う冪等性レコード（未設定の場合は重複排除しない）
+idempotency_store = IdempotencyStore(os.getenv("IDEMPOTENCY_TABLE_NAME"))
+
+# 花の画像の返却方法（inline: base64 を埋め込む, url: 署名付きURLを返す）
+IMAGE_DELIVERY_MODES = ("inline", "url")
+# 冪等性レコードに保存する base64 画像の上限（DynamoDBのアイテム上限 400KB に収める）
+MAX_STORED_IMAGE_BYTES = 300 * 1024
+# 保存した署名付きURLを再利用するために必要な残り有効期間（秒）
+STORED_URL_MIN_REMAINING_SECONDS = 60
+
 
 def validate_input(body):
     """
@@ -23,7 +48,7 @@ def validate_input(body):
         body (dict): リクエストボディの JSON データ。
 
     Raises:
-        ValueError: 必須フィールドが不足している場合や日付形式が不正な場合に発生。
+        ValueError: 必須フィールドが不足している場合や日付形式・画像の返却方法が不正な場合に発生。
     """
     required_fields = ["date", "content"]
     for field in required_fields:
@@ -37,6 +62,11 @@ def validate_input(body):
             "Error: Invalid date format. Please use the YYYY-MM-DD format."
         )
 
+    if body.get("image_delivery", "inline") not in IMAGE_DELIVERY_MODES:
+        raise ValueError(
+            "Error: Invalid image_delivery. Please use one of: inline, url."
+        )
+
 
 def save_to_dynamodb(user_id, date, content, is_deleted=False):
     """
@@ -51,7 +81,7 @@ def save_to_dynamodb(user_id, date, content, is_deleted=False):
     Returns:
         str: 新たに生成された日記の ID。
     """
-    dynamodb = boto3.resource("dynamodb")
+    dynamodb = aws.resource("dynamodb")
     table = dynamodb.Table(os.getenv("TABLE_NAME"))
 
     diary_id = str(uuid.uuid4())
@@ -69,47 +99,46 @@ def save_to_dynamodb(user_id, date, content, is_deleted=False):
     return diary_id
 
 
+def diary_matches(user_id, date, content):
+    """
+    保存されている日記が指定した内容と一致するかどうかを返す関数。
+
+    Args:
+        user_id (str): ユーザーの一意の ID。
+        date (str): 日記の日付。
+        content (str): 日記の内容。
+
+    Returns:
+        bool: 削除されていない日記が存在し、内容が一致する場合は True。
+    """
+    dynamodb = aws.resource("dynamodb")
+    table = dynamodb.Table(os.getenv("TABLE_NAME"))
+    item = table.get_item(
+        Key={"user_id": user_id, "date": date}, ConsistentRead=True
+    ).get("Item")
+    return (
+        item is not None and not item.get("is_deleted") and item["content"] == content
+    )
+
+
 def load_random_image_from_s3(bucket_name, prefix):
     """
     指定されたS3バケットとプレフィックスからPNG画像ファイル一覧を取得し、
     その中からランダムで1つの画像を選択してロードし、PIL Imageとして返す。
+    キー一覧とデコード済み画像はウォームコンテナ間でキャッシュされる。
     Args:
         bucketname (str): 元画像の入ったバケット名
         purefix (str): ランダムに取得した画像の入ったフォルダ名
     Returns:
-        ogject: PILイメージオブジェクト。
+        ogject: PILイメージオブジェクト（キャッシュと共有されるため変更しないこと）。
     Raises:
         ValueError: 指定したプレフィックスがバケット内に存在しない。もしくはPNG画像が存在しない。
         ClientError: S3操作などのAWSクライアントエラー
         Exception: S3操作に関するその他のエラー
 
     """
-    s3 = boto3.client("s3")
-
     try:
-        response = s3.list_objects_v2(Bucket=bucket_name, Prefix=prefix)
-        if "Contents" not in response:
-            raise ValueError(
-                f"Error: No images found under prefix {prefix} in bucket {bucket_name}"
-            )
-
-        # PNGファイルのみをフィルタ
-        png_keys = [
-            obj["Key"] for obj in response["Contents"] if obj["Key"].endswith(".png")
-        ]
-        if not png_keys:
-            raise ValueError(
-                f"Error: No PNG images found under prefix {prefix} in bucket {bucket_name}"
-            )
-
-        # ランダムに1つのキーを選択
-        chosen_key = random.choice(png_keys)
-
-        # 選んだ画像のみをS3から取得
-        resp = s3.get_object(Bucket=bucket_name, Key=chosen_key)
-        img = Image.open(resp["Body"]).convert("RGBA")
-
-        return img
+        return asset_cache.load_random_image(bucket_name, prefix)
 
     except ClientError as e:
         # S3操作などのAWSクライアントエラー
@@ -122,6 +151,57 @@ def load_random_image_from_s3(bucket_name, prefix):
         ) from e
 
 
+def load_wrapers(bucket_name):
+    """
+    包装紙(front/back)の画像をランダムに選択してロードする関数。
+
+    Args:
+        bucket_name (str): 元画像の入ったバケット名。
+
+    Returns:
+        tuple: 包装紙(前面)と包装紙(背面)のPILイメージオブジェクト。
+    """
+    wraper_front = load_random_image_from_s3(bucket_name, "wrapers_front/")
+    wraper_back = load_random_image_from_s3(bucket_name, "wrapers_back/")
+    return wraper_front, wraper_back
+
+
+def load_wrapped_flower_variant(flower_id):
+    """
+    事前レンダリング済みの包装済み花画像を取得する関数。
+
+    Args:
+        flower_id (str): Flower ID。
+
+    Returns:
+        bytes: PNG画像のバイト列。未設定・未生成・取得失敗の場合は None。
+    """
+    try:
+        return wrapped_flower_store.get_variant(flower_id)
+    except Exception as e:
+        # 取得に失敗しても合成処理にフォールバックする
+        logger.warning(f"Failed to load pre-rendered flower image: {e}")
+        return None
+
+
+def find_wrapped_flower_variant_key(flower_id):
+    """
+    事前レンダリング済みの包装済み花画像のキーを選択する関数。
+
+    Args:
+        flower_id (str): Flower ID。
+
+    Returns:
+        str: 画像のS3キー。未設定・未生成・取得失敗の場合は None。
+    """
+    try:
+        return wrapped_flower_store.pick_variant_key(flower_id)
+    except Exception as e:
+        # 取得に失敗しても合成処理にフォールバックする
+        logger.warning(f"Failed to load pre-rendered flower manifest: {e}")
+        return None
+
+
 def send_message_to_sqs(user_id, date, flower_id):
     """
     SQSキューにメッセージを送信する関数。
@@ -134,7 +214,7 @@ def send_message_to_sqs(user_id, date, flower_id):
     Raises:
         Exception: メッセージ送信に失敗した場合。
     """
-    sqs = boto3.client("sqs")
+    sqs = aws.client("sqs")
     queue_url = os.getenv("IMAGE_PROCESSING_QUEUE_URL")
 
     message = {
@@ -154,7 +234,7 @@ def send_message_to_sqs(user_id, date, flower_id):
         raise RuntimeError("Error: Failed to send message to SQS")
 
 
-def flower_wrap(flower_id):
+def flower_wrap(flower_id, wrapers=None):
     if not flower_id:
         raise ValueError("Invalid flower ID provided.")
     ...
@@ -163,44 +243,88 @@ def flower_wrap(flower_id):
     """
     ランダムに選択した包装紙(front/back)で指定flower_idの花を包み、
     base64エンコードした画像を返すPython関数。
+    wrapers に包装紙を先読みした Future を渡した場合はその結果を使う。
     """
-    bucket_name = os.environ["ORIGINAL_IMAGE_BUCKET_NAME"]
+    # 事前レンダリング済みの組み合わせがあれば合成せずにそのまま返す
+    variant = load_wrapped_flower_variant(flower_id)
+    if variant is not None:
+        return base64.b64encode(variant).decode("utf-8")
+
+    # 画像をBase64にエンコードして戻す
+    image, _ = compose_flower_image(flower_id, wrapers)
+    return base64.b64encode(image).decode("utf-8")
 
-    # パレット（背景）を作成
-    palette_width = 700
-    palette_height = 700
-    palette_color = (0, 0, 0, 0)  # 透明背景
-    palette = Image.new("RGBA", (palette_width, palette_height), palette_color)
+
+def flower_wrap_url(flower_id, wrapers=None):
+    """
+    包装済みの花画像の署名付きURLを返す関数。
+
+    事前レンダリング済みの組み合わせがあればその画像のURLを返す。無い場合は合成した画像を
+    内容のハッシュをキーとして花画像バケットに保存し、そのURLを返す。
+
+    Args:
+        flower_id (str): Flower ID。
+        wrapers (Future): 包装紙を先読みした Future。未指定の場合はその場でロードする。
+
+    Returns:
+        str: 画像の署名付きURL。
+    """
+    if not flower_id:
+        raise ValueError("Error: Invalid flower ID provided.")
+
+    s3 = aws.client("s3")
+    variant_key = find_wrapped_flower_variant_key(flower_id)
+    if variant_key is not None:
+        bucket_name = wrapped_flower_store.bucket_name
+        key = variant_key
+    else:
+        image, content_type = compose_flower_image(flower_id, wrapers)
+        bucket_name = os.environ["FLOWER_BUKCET_NAME"]
+        extension = content_type.split("/")[-1]
+        key = f"wrapped_flowers/{hashlib.sha256(image).hexdigest()}.{extension}"
+        s3.put_object(Bucket=bucket_name, Key=key, Body=image, ContentType=content_type)
+
+    return s3.generate_presigned_url(
+        "get_object",
+        Params={"Bucket": bucket_name, "Key": key},
+        ExpiresIn=get_image_url_expires_seconds(),
+    )
+
+
+def get_image_url_expires_seconds():
+    """花の画像の署名付きURLの有効期間（秒）を返す関数。"""
+    return int(os.getenv("FLOWER_IMAGE_URL_EXPIRES_SECONDS", "300"))
+
+
+def compose_flower_image(flower_id, wrapers=None):
+    """
+    ランダムに選択した包装紙(front/back)で指定flower_idの花を包み、
+    環境変数 IMAGE_ENCODER_PROFILE のプロファイルでエンコードした画像を返す関数。
+
+    Args:
+        flower_id (str): Flower ID。
+        wrapers (Future): 包装紙を先読みした Future。未指定の場合はその場でロードする。
+
+    Returns:
+        tuple: エンコードした画像のバイト列とContent-Type。
+    """
+    bucket_name = os.environ["ORIGINAL_IMAGE_BUCKET_NAME"]
 
     # 包装紙(front/back)はランダムに選択
-    wraper_front = load_random_image_from_s3(bucket_name, "wrapers_front/")
-    wraper_back = load_random_image_from_s3(bucket_name, "wrapers_back/")
+    if wrapers is not None:
+        wraper_front, wraper_back = wrapers.result()
+    else:
+        wraper_front, wraper_back = load_wrapers(bucket_name)
     # 花画像は固定キー flowers/{flower_id}.png を読み込む想定
     flower_key = f"single_flowers/{flower_id}.png"
     flower = load_random_image_from_s3(bucket_name, flower_key)
 
-    # 包装紙(背面)をパレットに合成
-    wraper_position_back = ((palette_width - wraper_back.width) // 2, 75)
-    palette.paste(wraper_back, wraper_position_back, wraper_back)
-
-    # 花をパレットに合成（中心揃え）
-    flower_position = ((palette_width - flower.width) // 2, 0)
-    palette.paste(flower, flower_position, flower)
+    palette = compose_wrapped_flower(flower, wraper_front, wraper_back)
 
-    # 包装紙(前面)をパレットに合成
-    wraper_position_front = ((palette_width - wraper_front.width) // 2, 75)
-    palette.paste(wraper_front, wraper_position_front, wraper_front)
-
-    # 画像をBase64にエンコードして戻す
-    buffer = BytesIO()
     try:
-        palette.save(buffer, format="PNG")
+        return encode_image(palette)
     except Exception as e:
         raise RuntimeError(f"Error: Failed to save image: {e}")
-    buffer.seek(0)
-    encoded_image = base64.b64encode(buffer.read()).decode("utf-8")
-
-    return encoded_image
 
 
 def invoke_flower_lambda(user_id, date, content):
@@ -218,7 +342,7 @@ def invoke_flower_lambda(user_id, date, content):
     Raises:
         Exception: 呼び出しやレスポンスの処理が失敗した場合に発生。
     """
-    lambda_client = boto3.client("lambda")
+    lambda_client = aws.client("lambda")
     response = lambda_client.invoke(
         FunctionName=os.getenv("FLOWER_SELECT_FUNCTION_NAME"),
         InvocationType="RequestResponse",
@@ -233,6 +357,258 @@ def invoke_flower_lambda(user_id, date, content):
     return body["flower_id"]
 
 
+def select_flower_id(user_id, date, content):
+    """
+    日記内容に基づいて花を選択し、花の ID を返す関数。
+
+    環境変数 FLOWER_SELECT_MODE が "in_process" の場合は花の選択処理を直接呼び出し、
+    "invoke"（既定）の場合は Flower Lambda を呼び出す。どちらも同じ処理を行う。
+
+    Args:
+        user_id (str): ユーザーの一意の ID。
+        date (str): 日記の日付。
+        content (str): 日記の内容。
+
+    Returns:
+        str: 取得された花の ID。
+    """
+    if os.getenv("FLOWER_SELECT_MODE", "invoke") == "in_process":
+        return select_and_save_flower(user_id, date, content)
+    return invoke_flower_lambda(user_id, date, content)
+
+
+def render_flower_image(flower_id, image_delivery, wrapers=None):
+    """
+    指定された返却方法で包装済みの花画像を返す関数。
+
+    Args:
+        flower_id (str): Flower ID。
+        image_delivery (str): 花の画像の返却方法（inline または url）。
+        wrapers (Future): 包装紙を先読みした Future。
+
+    Returns:
+        str: base64 エンコードした花の画像、または画像の署名付きURL。
+    """
+    if image_delivery == "url":
+        return flower_wrap_url(flower_id, wrapers=wrapers)
+    return flower_wrap(flower_id, wrapers=wrapers)
+
+
+def create_diary_sequential(user_id, date, content, image_delivery="inline"):
+    """
+    日記の保存、花の選択、SQSへの送信、花の画像の生成を順番に実行する関数。
+
+    Args:
+        user_id (str): ユーザーの一意の ID。
+        date (str): 日記の日付。
+        content (str): 日記の内容。
+        image_delivery (str): 花の画像の返却方法（inline または url）。
+
+    Returns:
+        tuple: 花の ID と、base64 エンコードした花の画像または画像の署名付きURL。
+    """
+    # DynamoDB にアイテムを保存
+    save_to_dynamodb(user_id, date, content)
+
+    # 日記内容に基づいて花の ID を取得
+    flower_id = select_flower_id(user_id, date, content)
+    if not flower_id:
+        raise ValueError("Error: Invalid flower ID returned from flower Lambda")
+
+    # SQSキューにメッセージを送信
+    send_message_to_sqs(user_id, date, flower_id)
+
+    return flower_id, render_flower_image(flower_id, image_delivery)
+
+
+def create_diary_concurrent(user_id, date, content, image_delivery="inline"):
+    """
+    日記の保存と包装紙の先読みを花の選択と並行して実行する関数。
+
+    花の画像の読み込みのみ flower_id の確定を待ち、SQSへの送信は画像の生成と並行して行う。
+    いずれかの処理が失敗しても、実行中の処理がすべて終わるまで待ってから例外を送出する。
+
+    Args:
+        user_id (str): ユーザーの一意の ID。
+        date (str): 日記の日付。
+        content (str): 日記の内容。
+        image_delivery (str): 花の画像の返却方法（inline または url）。
+
+    Returns:
+        tuple: 花の ID と、base64 エンコードした花の画像または画像の署名付きURL。
+    """
+    bucket_name = os.environ["ORIGINAL_IMAGE_BUCKET_NAME"]
+    futures = []
+    try:
+        save_future = executor.submit(save_to_dynamodb, user_id, date, content)
+        futures.append(save_future)
+        wrapers_future = executor.submit(load_wrapers, bucket_name)
+        futures.append(wrapers_future)
+
+        flower_id = select_flower_id(user_id, date, content)
+        if not flower_id:
+            raise ValueError("Error: Invalid flower ID returned from flower Lambda")
+        save_future.result()
+
+        sqs_future = executor.submit(send_message_to_sqs, user_id, date, flower_id)
+        futures.append(sqs_future)
+        flower_image = render_flower_image(
+            flower_id, image_delivery, wrapers=wrapers_future
+        )
+        sqs_future.result()
+
+        return flower_id, flower_image
+    finally:
+        # コンテナが凍結される前にバックグラウンドの処理を完了させる
+        wait(futures)
+
+
+def create_diary(user_id, date, content, image_delivery="inline"):
+    """
+    環境変数 DIARY_CREATE_EXECUTION_MODE に従って日記を作成する関数。
+
+    既定では各処理を並行して実行する（"sequential" で逐次実行）。
+
+    Args:
+        user_id (str): ユーザーの一意の ID。
+        date (str): 日記の日付。
+        content (str): 日記の内容。
+        image_delivery (str): 花の画像の返却方法（inline または url）。
+
+    Returns:
+        tuple: 花の ID と、base64 エンコードした花の画像または画像の署名付きURL。
+    """
+    if os.getenv("DIARY_CREATE_EXECUTION_MODE", "concurrent") == "sequential":
+        return create_diary_sequential(user_id, date, content, image_delivery)
+    return create_diary_concurrent(user_id, date, content, image_delivery)
+
+
+def get_idempotency_key(event, fingerprint):
+    """
+    リクエストの冪等キーを返す関数。
+
+    Idempotency-Key ヘッダーが無い場合はリクエスト内容のハッシュを冪等キーとする。
+
+    Args:
+        event (dict): Lambda イベントデータ。
+        fingerprint (str): リクエスト内容のハッシュ値。
+
+    Returns:
+        str: 冪等キー。
+    """
+    headers = event.get("headers") or {}
+    for name, value in headers.items():
+        if name.lower() == "idempotency-key" and value:
+            return value
+    return fingerprint
+
+
+def build_stored_result(flower_id, image_delivery, flower_image):
+    """
+    再送時に返すために冪等性レコードへ保存する処理結果を作成する関数。
+
+    base64 画像が大きすぎる場合は花の ID のみを保存する。
+
+    Args:
+        flower_id (str): 花の ID。
+        image_delivery (str): 花の画像の返却方法（inline または url）。
+        flower_image (str): base64 エンコードした花の画像、または画像の署名付きURL。
+
+    Returns:
+        dict: 保存する処理結果。
+    """
+    result = {"flower_id": flower_id}
+    if image_delivery == "url":
+        result["flower_image_url"] = flower_image
+        result["flower_image_url_expires_at"] = (
+            int(time.time()) + get_image_url_expires_seconds()
+        )
+    elif len(flower_image) <= MAX_STORED_IMAGE_BYTES:
+        result["flower_image"] = flower_image
+    return result
+
+
+def replay_stored_result(result, image_delivery):
+    """
+    保存済みの処理結果から花の ID と画像を返す関数。
+
+    画像を保存していない場合や署名付きURLの期限が近い場合は、花の選択は行わずに
+    保存済みの花の ID で画像のみを生成し直す。
+
+    Args:
+        result (dict): 冪等性レコードに保存した処理結果。
+        image_delivery (str): 花の画像の返却方法（inline または url）。
+
+    Returns:
+        tuple: 花の ID と、base64 エンコードした花の画像または画像の署名付きURL。
+    """
+    flower_id = result["flower_id"]
+    if image_delivery == "url":
+        expires_at = result.get("flower_image_url_expires_at", 0)
+        if expires_at - time.time() > STORED_URL_MIN_REMAINING_SECONDS:
+            return flower_id, result["flower_image_url"]
+    elif "flower_image" in result:
+        return flower_id, result["flower_image"]
+    return flower_id, render_flower_image(flower_id, image_delivery)
+
+
+def create_diary_idempotent(
+    user_id, date, content, image_delivery, idempotency_key, fingerprint
+):
+    """
+    冪等キーで重複排除しながら日記を作成する関数。
+
+    同じ冪等キーの処理が完了している場合は、日記の保存・花の選択・SQSへの送信を行わずに
+    保存済みの結果を返す。処理に失敗した場合は冪等性レコードを削除し、再送で再実行できるようにする。
+
+    Args:
+        user_id (str): ユーザーの一意の ID。
+        date (str): 日記の日付。
+        content (str): 日記の内容。
+        image_delivery (str): 花の画像の返却方法（inline または url）。
+        idempotency_key (str): 冪等キー。
+        fingerprint (str): リクエスト内容のハッシュ値。
+
+    Returns:
+        tuple: 花の ID と、base64 エンコードした花の画像または画像の署名付きURL。
+
+    Raises:
+        IdempotencyConflictError: 同じ日付のリクエストが処理中の場合など。
+    """
+    if not idempotency_store.enabled:
+        return create_diary(user_id, date, content, image_delivery)
+
+    stored = idempotency_store.begin(user_id, date, idempotency_key, fingerprint)
+    if stored is not None and not diary_matches(user_id, date, content):
+        # 日記が削除・編集された後の投稿は再送ではないため、記録を破棄して処理し直す
+        logger.info(f"Diary for {date} was changed, discarding stored result")
+        idempotency_store.invalidate(user_id, date, idempotency_key)
+        stored = idempotency_store.begin(user_id, date, idempotency_key, fingerprint)
+    if stored is not None:
+        return replay_stored_result(stored, image_delivery)
+
+    try:
+        flower_id, flower_image = create_diary(user_id, date, content, image_delivery)
+    except Exception:
+        try:
+            idempotency_store.release(user_id, date, idempotency_key)
+        except Exception as e:
+            logger.warning(f"Failed to release idempotency record: {e}")
+        raise
+
+    try:
+        idempotency_store.complete(
+            user_id,
+            date,
+            idempotency_key,
+            build_stored_result(flower_id, image_delivery, flower_image),
+        )
+    except Exception as e:
+        # 日記の作成は完了しているため、結果の保存に失敗してもレスポンスは返す
+        logger.warning(f"Failed to store idempotency result: {e}")
+    return flower_id, flower_image
+
+
 def lambda_handler(event, context):
     """
     メインの Lambda ハンドラー関数。入力データの検証、DynamoDB への保存、
@@ -252,30 +628,27 @@ def lambda_handler(event, context):
         user_id = event["requestContext"]["authorizer"]["claims"]["sub"]
         date = body["date"]
         content = body["content"]
+        image_delivery = body.get("image_delivery", "inline")
 
-        # DynamoDB にアイテムを保存
-        save_to_dynamodb(user_id, date, content)
-
-        # Flower Lambda を呼び出して花の ID を取得
-        flower_id = invoke_flower_lambda(user_id, date, content)
-        if not flower_id:
-            raise ValueError("Error: Invalid flower ID returned from flower Lambda")
-
-        # SQSキューにメッセージを送信
-        send_message_to_sqs(user_id, date, flower_id)
+        # 再送されたリクエストは保存済みの結果を返す
+        fingerprint = request_fingerprint(date, content, image_delivery)
+        idempotency_key = get_idempotency_key(event, fingerprint)
+        flower_id, flower_image = create_diary_idempotent(
+            user_id, date, content, image_delivery, idempotency_key, fingerprint
+        )
 
-        flower_image = flower_wrap(flower_id)
         if not flower_image:
             raise ValueError("Error: Flower Image not found")
 
-        # 成功レスポンスの返却
+        # 成功レスポンスの返却（url の場合は画像の代わりに署名付きURLを返す）
+        image_field = "flower_image_url" if image_delivery == "url" else "flower_image"
         return {
             "statusCode": 201,
             "body": json.dumps(
                 {
                     "message": "Success",
                     "flower_id": flower_id,
-                    "flower_image": flower_image,
+                    image_field: flower_image,
                 }
             ),
             "headers": {
@@ -283,6 +656,15 @@ def lambda_handler(event, context):
                 "Access-Control-Allow-Origin": "*",
             },
         }
+    except IdempotencyConflictError as e:
+        return {
+            "statusCode": 409,
+            "body": json.dumps({"error": str(e)}),
+            "headers": {
+                "Content-Type": "application/json",
+                "Access-Control-Allow-Origin": "*",
+            },
+        }
     except ValueError as e:
         return {
             "statusCode": 400,
@@ -2,6 +2,7 @@ import json
 import os
 
 import boto3
+from botocore.exceptions import ClientError
 
 
 def lambda_handler(event, context):
@@ -17,16 +18,22 @@ def lambda_handler(event, context):
 
     try:
         # DynamoDB テーブルのアイテムを更新
-        table.update_item(
-            Key={
-                "user_id": user_id,
-                "date": date,
-            },
-            UpdateExpression="SET content = :new_content",
-            ExpressionAttributeValues={
-                ":new_content": new_content,
-            },
-        )
+        # 内容が変わらない場合は書き込まず、ストリームからタイトルの再生成を起こさない
+        try:
+            table.update_item(
+                Key={
+                    "user_id": user_id,
+                    "date": date,
+                },
+                UpdateExpression="SET content = :new_content",
+                ConditionExpression="attribute_not_exists(content) OR content <> :new_content",
+                ExpressionAttributeValues={
+                    ":new_content": new_content,
+                },
+            )
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                raise
 
         return {
             "statusCode": 200,
@@ -0,0 +1,397 @@
+import json
+import logging
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from common import aws
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# BatchWriteItem で1回に書き込める最大件数
+BATCH_WRITE_SIZE = 25
+# BatchGetItem で1回に読み込める最大件数
+BATCH_GET_SIZE = 100
+# send_message_batch で1回に送信できる最大件数
+SQS_BATCH_SIZE = 10
+# 1リクエストで受け付ける最大件数
+DEFAULT_MAX_ENTRIES = 5000
+# 花の選択ジョブを送信する同時実行数
+SQS_SEND_CONCURRENCY = 8
+# 未処理アイテムの再送回数
+MAX_UNPROCESSED_RETRIES = 5
+# インポートの進捗を保持する期間（秒）
+JOB_TTL_SECONDS = 7 * 24 * 60 * 60
+
+
+def chunked(items, size):
+    """リストを size 件ずつに分割して返す"""
+    return [items[i : i + size] for i in range(0, len(items), size)]
+
+
+def validate_entries(body):
+    """
+    インポートする日記のバリデーションを行う関数。
+
+    Args:
+        body (dict): リクエストボディの JSON データ。
+
+    Returns:
+        list: 日記（date, content）のリスト。
+
+    Raises:
+        ValueError: entries が不正な場合や日付形式が不正な場合、件数が上限を超える場合に発生。
+    """
+    entries = body.get("entries")
+    if not isinstance(entries, list) or not entries:
+        raise ValueError("Error: Required field is missing. entries")
+
+    max_entries = int(os.getenv("DIARY_IMPORT_MAX_ENTRIES", DEFAULT_MAX_ENTRIES))
+    if len(entries) > max_entries:
+        raise ValueError(f"Error: Too many entries. Please import up to {max_entries}.")
+
+    dates = set()
+    for entry in entries:
+        for field in ("date", "content"):
+            if field not in entry:
+                raise ValueError(f"Error: Required field is missing. {field}")
+        try:
+            datetime.strptime(entry["date"], "%Y-%m-%d")
+        except ValueError:
+            raise ValueError(
+                "Error: Invalid date format. Please use the YYYY-MM-DD format."
+            )
+        if entry["date"] in dates:
+            raise ValueError(f"Error: Duplicate date. {entry['date']}")
+        dates.add(entry["date"])
+
+    return [{"date": e["date"], "content": e["content"]} for e in entries]
+
+
+def find_existing_dates(user_id, dates):
+    """
+    既に日記が存在する日付を BatchGetItem で100件ずつ調べる関数。
+
+    BatchWriteItem は同じキーの日記を上書きするため、アプリで書いた日記を
+    インポートで消さないよう、保存の前に確認する。削除済みの日記は存在しないものとみなす。
+
+    Args:
+        user_id (str): ユーザーの一意の ID。
+        dates (list): 調べる日付のリスト。
+
+    Returns:
+        set: 日記が存在する日付の集合。
+    """
+    dynamodb = aws.resource("dynamodb")
+    table_name = os.getenv("TABLE_NAME")
+
+    existing = set()
+    for chunk in chunked(dates, BATCH_GET_SIZE):
+        request = {
+            table_name: {
+                "Keys": [{"user_id": user_id, "date": date} for date in chunk],
+                "ProjectionExpression": "#date, is_deleted",
+                "ExpressionAttributeNames": {"#date": "date"},
+            }
+        }
+        for attempt in range(MAX_UNPROCESSED_RETRIES + 1):
+            if attempt:
+                time.sleep(min(0.05 * 2**attempt, 1.0))
+            response = dynamodb.batch_get_item(RequestItems=request)
+            existing.update(
+                item["date"]
+                for item in response.get("Responses", {}).get(table_name, [])
+                if not item.get("is_deleted")
+            )
+            request = response.get("UnprocessedKeys") or {}
+            if not request:
+                break
+        else:
+            raise RuntimeError("Failed to check existing diaries")
+
+    return existing
+
+
+def batch_save_to_dynamodb(user_id, entries):
+    """
+    日記を BatchWriteItem で25件ずつ DynamoDB に保存する関数。
+
+    未処理アイテムは指数バックオフで再送し、再送しきれなかった日記を失敗として返す。
+
+    Args:
+        user_id (str): ユーザーの一意の ID。
+        entries (list): 日記（date, content）のリスト。
+
+    Returns:
+        tuple: 保存した日記のリストと、失敗した日記の日付とエラーの辞書。
+    """
+    dynamodb = aws.resource("dynamodb")
+    table_name = os.getenv("TABLE_NAME")
+
+    saved = []
+    failures = {}
+    for chunk in chunked(entries, BATCH_WRITE_SIZE):
+        now = datetime.now().isoformat()
+        put_requests = [
+            {
+                "PutRequest": {
+                    "Item": {
+                        "user_id": user_id,
+                        "date": entry["date"],
+                        "diary_id": str(uuid.uuid4()),
+                        "content": entry["content"],
+                        "is_deleted": False,
+                        "created_at": now,
+                        "updated_at": now,
+                    }
+                }
+            }
+            for entry in chunk
+        ]
+
+        try:
+            for attempt in range(MAX_UNPROCESSED_RETRIES + 1):
+                if attempt:
+                    time.sleep(min(0.05 * 2**attempt, 1.0))
+                response = dynamodb.batch_write_item(
+                    RequestItems={table_name: put_requests}
+                )
+                put_requests = response.get("UnprocessedItems", {}).get(table_name, [])
+                if not put_requests:
+                    break
+        except Exception as e:
+            logger.error(f"Failed to save diaries to DynamoDB: {e}")
+            failures.update({entry["date"]: str(e) for entry in chunk})
+            continue
+
+        unprocessed = {r["PutRequest"]["Item"]["date"] for r in put_requests}
+        for entry in chunk:
+            if entry["date"] in unprocessed:
+                failures[entry["date"]] = "Unprocessed by BatchWriteItem"
+            else:
+                saved.append(entry)
+        logger.info(f"Saved {len(saved)}/{len(entries)} diaries")
+
+    return saved, failures
+
+
+def send_import_messages(user_id, import_id, entries):
+    """
+    保存した日記ごとの花の選択ジョブをインポート用のSQSキューに送信する関数。
+
+    send_message_batch で10件ずつ、同時実行数を制限して並行に送信する。
+    バッチの合計サイズの上限（256 KB）を超えないよう、メッセージには日記の内容を含めず、
+    ワーカーが日記テーブルから読み出す。
+
+    Args:
+        user_id (str): ユーザーの一意の ID。
+        import_id (str): インポートの ID。
+        entries (list): 日記（date, content）のリスト。
+
+    Returns:
+        dict: 送信に失敗した日記の日付とエラーの辞書。
+    """
+    sqs = aws.client("sqs")
+    queue_url = os.getenv("DIARY_IMPORT_QUEUE_URL")
+
+    def send(chunk):
+        messages = [
+            {
+                # バッチ内のIDは英数字・ハイフン・アンダースコアのみ使用できる
+                "Id": entry["date"].replace("-", "_"),
+                "MessageBody": json.dumps(
+                    {
+                        "user_id": user_id,
+                        "import_id": import_id,
+                        "date": entry["date"],
+                    }
+                ),
+            }
+            for entry in chunk
+        ]
+        try:
+            response = sqs.send_message_batch(QueueUrl=queue_url, Entries=messages)
+        except Exception as e:
+            logger.error(f"Failed to send messages to SQS: {e}")
+            return {entry["date"]: str(e) for entry in chunk}
+        return {
+            failed["Id"].replace("_", "-"): failed.get(
+                "Message", failed.get("Code", "Unknown")
+            )
+            for failed in response.get("Failed", [])
+        }
+
+    failures = {}
+    with ThreadPoolExecutor(max_workers=SQS_SEND_CONCURRENCY) as pool:
+        for chunk_failures in pool.map(send, chunked(entries, SQS_BATCH_SIZE)):
+            failures.update(chunk_failures)
+    return failures
+
+
+def create_import_job(user_id, import_id, total, queued, failed):
+    """
+    インポートの進捗を記録するアイテムを作成する関数。
+
+    花の選択の結果は diary_import_worker が完了した日付（done_dates）と
+    失敗した日付（failed_dates）の文字列セットに追加する。
+
+    Args:
+        user_id (str): ユーザーの一意の ID。
+        import_id (str): インポートの ID。
+        total (int): リクエストされた日記の件数。
+        queued (int): 花の選択ジョブを送信した日記の件数。
+        failed (list): 保存または送信に失敗した日記（日付・処理段階・エラー）のリスト。
+    """
+    table = aws.resource("dynamodb").Table(os.getenv("IMPORT_JOB_TABLE_NAME"))
+    table.put_item(
+        Item={
+            "user_id": user_id,
+            "import_id": import_id,
+            "total": total,
+            "queued": queued,
+            "failed": failed,
+            "created_at": datetime.now().isoformat(),
+            "expires_at": int(time.time()) + JOB_TTL_SECONDS,
+        }
+    )
+
+
+def import_diaries(user_id, entries):
+    """
+    日記を一括で保存し、花の選択と画像生成をワーカーに引き渡す関数。
+
+    既に日記がある日付は上書きせず、失敗（stage: exists）として返す。
+
+    Args:
+        user_id (str): ユーザーの一意の ID。
+        entries (list): 日記（date, content）のリスト。
+
+    Returns:
+        dict: インポートの ID、件数、保存または送信に失敗した日記を含む結果。
+    """
+    import_id = str(uuid.uuid4())
+    failed = []
+
+    existing = find_existing_dates(user_id, [entry["date"] for entry in entries])
+    failed += [
+        {"date": date, "stage": "exists", "error": "Diary already exists"}
+        for date in sorted(existing)
+    ]
+    entries_to_save = [entry for entry in entries if entry["date"] not in existing]
+
+    saved, save_failures = batch_save_to_dynamodb(user_id, entries_to_save)
+    failed += [
+        {"date": date, "stage": "save", "error": error}
+        for date, error in save_failures.items()
+    ]
+
+    queue_failures = send_import_messages(user_id, import_id, saved)
+    failed += [
+        {"date": date, "stage": "flower_queue", "error": error}
+        for date, error in queue_failures.items()
+    ]
+
+    failed.sort(key=lambda f: f["date"])
+    queued = len(saved) - len(queue_failures)
+    create_import_job(user_id, import_id, len(entries), queued, failed)
+    logger.info(
+        f"Import {import_id}: queued {queued}/{len(entries)} diaries "
+        f"(failed: {len(failed)})"
+    )
+    return {
+        "import_id": import_id,
+        "total": len(entries),
+        "queued": queued,
+        "failed": failed,
+    }
+
+
+def get_import_status(user_id, import_id):
+    """
+    インポートの進捗を取得する関数。
+
+    Args:
+        user_id (str): ユーザーの一意の ID。
+        import_id (str): インポートの ID。
+
+    Returns:
+        dict: 進捗。インポートが存在しない場合は None。
+    """
+    table = aws.resource("dynamodb").Table(os.getenv("IMPORT_JOB_TABLE_NAME"))
+    item = table.get_item(
+        Key={"user_id": user_id, "import_id": import_id}, ConsistentRead=True
+    ).get("Item")
+    if item is None:
+        return None
+
+    done = sorted(item.get("done_dates", set()))
+    failed = list(item.get("failed", [])) + [
+        {"date": date, "stage": "flower_select", "error": "Flower selection failed"}
+        for date in sorted(item.get("failed_dates", set()))
+    ]
+    queued = int(item["queued"])
+    processed = len(done) + len(item.get("failed_dates", set()))
+    return {
+        "import_id": import_id,
+        "status": "COMPLETED" if processed >= queued else "IN_PROGRESS",
+        "total": int(item["total"]),
+        "queued": queued,
+        "succeeded": len(done),
+        "failed": sorted(failed, key=lambda f: f["date"]),
+    }
+
+
+def lambda_handler(event, context):
+    """
+    日記の一括インポートを受け付け、進捗を返す Lambda ハンドラー関数。
+
+    POST は日記を保存して花の選択をワーカーに引き渡し、202 とインポートの ID を返す。
+    花の選択と画像生成は非同期に行われるため、GET で import_id を指定して進捗を確認する。
+
+    Args:
+        event (dict): Lambda イベントデータ。
+        context (object): Lambda 実行コンテキストオブジェクト。
+
+    Returns:
+        dict: HTTP ステータスコード、レスポンスボディ、HTTP ヘッダーを含むレスポンスオブジェクト。
+    """
+    headers = {
+        "Content-Type": "application/json",
+        "Access-Control-Allow-Origin": "*",
+    }
+    try:
+        user_id = event["requestContext"]["authorizer"]["claims"]["sub"]
+
+        if event.get("httpMethod") == "GET":
+            params = event.get("queryStringParameters") or {}
+            if "import_id" not in params:
+                raise ValueError("Error: Required field is missing. import_id")
+            status = get_import_status(user_id, params["import_id"])
+            if status is None:
+                return {
+                    "statusCode": 404,
+                    "body": json.dumps({"error": "Import not found"}),
+                    "headers": headers,
+                }
+            return {"statusCode": 200, "body": json.dumps(status), "headers": headers}
+
+        body = json.loads(event["body"])
+        entries = validate_entries(body)
+        result = import_diaries(user_id, entries)
+        return {"statusCode": 202, "body": json.dumps(result), "headers": headers}
+    except ValueError as e:
+        return {
+            "statusCode": 400,
+            "body": json.dumps({"error": str(e)}),
+            "headers": headers,
+        }
+    except Exception as e:
+        logger.error(f"Unexpected error: {str(e)}")
+        return {
+            "statusCode": 500,
+            "body": json.dumps({"error": "サーバー内部エラーが発生しました"}),
+            "headers": headers,
+        }
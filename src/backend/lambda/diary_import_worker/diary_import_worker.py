@@ -0,0 +1,214 @@
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from common import aws
+from common.flower_selection import select_and_save_flower
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+logging.getLogger("common").setLevel(logging.INFO)
+
+# 花の選択を試行する最大回数。超えた場合は失敗としてインポートの進捗に記録する
+MAX_ATTEMPTS = 3
+# SendMessageBatch で1回に送信できる最大件数
+SQS_BATCH_SIZE = 10
+# 並行して花を選択するレコード数
+DEFAULT_CONCURRENCY = 3
+# 1件の花の選択に見込む時間（ミリ秒）。残り時間がこれを下回ったレコードは処理せずに再試行させる
+DEFAULT_RECORD_TIME_BUDGET_MS = 75_000
+
+
+class DiaryNotFoundError(Exception):
+    """インポートした日記がテーブルに存在しない（削除された）ことを表す例外"""
+
+
+def get_diary_content(user_id, date):
+    """
+    日記テーブルからインポートした日記の内容を取得する関数。
+
+    Args:
+        user_id (str): ユーザーの一意の ID。
+        date (str): 日記の日付。
+
+    Returns:
+        str: 日記の内容。
+
+    Raises:
+        DiaryNotFoundError: 日記が存在しないか削除されている場合
+    """
+    table = aws.resource("dynamodb").Table(os.getenv("TABLE_NAME"))
+    item = table.get_item(Key={"user_id": user_id, "date": date}).get("Item")
+    if item is None or item.get("is_deleted"):
+        raise DiaryNotFoundError(f"Diary not found: {date}")
+    return item["content"]
+
+
+def send_image_jobs(jobs):
+    """
+    花の画像生成ジョブを SQS キューに10件ずつまとめて送信する関数。
+
+    Args:
+        jobs (list): (user_id, date, flower_id) のタプルのリスト。
+
+    Returns:
+        list: 送信に失敗したジョブのインデックスのリスト。
+    """
+    sqs = aws.client("sqs")
+    failed = []
+    for start in range(0, len(jobs), SQS_BATCH_SIZE):
+        chunk = jobs[start : start + SQS_BATCH_SIZE]
+        try:
+            response = sqs.send_message_batch(
+                QueueUrl=os.getenv("IMAGE_PROCESSING_QUEUE_URL"),
+                Entries=[
+                    {
+                        "Id": str(start + i),
+                        "MessageBody": json.dumps(
+                            {"user_id": user_id, "date": date, "flower_id": flower_id}
+                        ),
+                    }
+                    for i, (user_id, date, flower_id) in enumerate(chunk)
+                ],
+            )
+        except Exception as e:
+            logger.error(f"Failed to send image jobs: {e}")
+            failed += range(start, start + len(chunk))
+            continue
+        for entry in response.get("Failed", []):
+            logger.error(f"Failed to send image job: {entry}")
+            failed.append(int(entry["Id"]))
+    return failed
+
+
+def record_progress(user_id, import_id, date, succeeded):
+    """
+    インポートの進捗に処理した日付を追加する関数。
+
+    文字列セットへの追加は冪等なため、同じメッセージが重複して届いても件数は変わらない。
+
+    Args:
+        user_id (str): ユーザーの一意の ID。
+        import_id (str): インポートの ID。
+        date (str): 処理した日記の日付。
+        succeeded (bool): 花の選択と画像生成ジョブの送信に成功したかどうか。
+    """
+    table = aws.resource("dynamodb").Table(os.getenv("IMPORT_JOB_TABLE_NAME"))
+    table.update_item(
+        Key={"user_id": user_id, "import_id": import_id},
+        UpdateExpression="ADD #dates :date",
+        ExpressionAttributeNames={
+            "#dates": "done_dates" if succeeded else "failed_dates"
+        },
+        ExpressionAttributeValues={":date": {date}},
+    )
+
+
+def select_flower_for_record(record, context, time_budget_ms):
+    """
+    1件の日記の内容を取得し、花を選択する関数。
+
+    Lambda の残り時間が見込み時間を下回っている場合は処理せずに再試行させる。
+
+    Args:
+        record (dict): SQS のレコード。
+        context (object): Lambda 実行コンテキストオブジェクト。
+        time_budget_ms (int): 1件の処理に見込む時間（ミリ秒）。
+
+    Returns:
+        str: 選択された花の ID。
+
+    Raises:
+        TimeoutError: 残り時間が足りない場合
+    """
+    if context is not None and context.get_remaining_time_in_millis() < time_budget_ms:
+        raise TimeoutError("Not enough time left to process the record")
+    message = json.loads(record["body"])
+    content = get_diary_content(message["user_id"], message["date"])
+    return select_and_save_flower(message["user_id"], message["date"], content)
+
+
+def handle_failure(record, error):
+    """
+    処理に失敗したレコードを再試行させるかどうかを判定する関数。
+
+    最大試行回数に達した場合と日記が存在しない場合は、失敗として進捗に記録する。
+
+    Args:
+        record (dict): SQS のレコード。
+        error (Exception): 発生した例外。
+
+    Returns:
+        bool: SQS に再試行させる場合は True。
+    """
+    message = json.loads(record["body"])
+    attempts = int(record["attributes"]["ApproximateReceiveCount"])
+    logger.error(f"Failed to process {message['date']} (attempt {attempts}): {error}")
+    if attempts < MAX_ATTEMPTS and not isinstance(error, DiaryNotFoundError):
+        return True
+    record_progress(
+        message["user_id"], message["import_id"], message["date"], succeeded=False
+    )
+    return False
+
+
+def lambda_handler(event, context):
+    """
+    インポートした日記の花の選択と画像生成ジョブの送信を行う Lambda ハンドラー関数。
+
+    花の選択は同時実行数を制限して並行に行い、画像生成ジョブは呼び出しごとにまとめて送信する。
+    失敗したレコードだけを batchItemFailures で返し、SQS に再試行させる。
+
+    Args:
+        event (dict): SQS イベントデータ。
+        context (object): Lambda 実行コンテキストオブジェクト。
+
+    Returns:
+        dict: 再試行するレコードのメッセージ ID を含む batchItemFailures。
+    """
+    records = event["Records"]
+    concurrency = int(
+        os.environ.get("DIARY_IMPORT_WORKER_CONCURRENCY", DEFAULT_CONCURRENCY)
+    )
+    time_budget_ms = int(
+        os.environ.get(
+            "DIARY_IMPORT_RECORD_TIME_BUDGET_MS", DEFAULT_RECORD_TIME_BUDGET_MS
+        )
+    )
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = [
+            executor.submit(select_flower_for_record, record, context, time_budget_ms)
+            for record in records
+        ]
+
+    retry = []
+    selected = []
+    for record, future in zip(records, futures):
+        try:
+            selected.append((record, future.result()))
+        except Exception as e:
+            if handle_failure(record, e):
+                retry.append(record)
+
+    messages = [json.loads(record["body"]) for record, _ in selected]
+    failed_jobs = set(
+        send_image_jobs(
+            [
+                (message["user_id"], message["date"], flower_id)
+                for message, (_, flower_id) in zip(messages, selected)
+            ]
+        )
+    )
+    for i, (message, (record, _)) in enumerate(zip(messages, selected)):
+        if i in failed_jobs:
+            if handle_failure(record, RuntimeError("Failed to send image job")):
+                retry.append(record)
+            continue
+        record_progress(
+            message["user_id"], message["import_id"], message["date"], succeeded=True
+        )
+
+    logger.info(f"Processed {len(records) - len(retry)} records")
+    return {"batchItemFailures": [{"itemIdentifier": r["messageId"]} for r in retry]}
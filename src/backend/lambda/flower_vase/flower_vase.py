@@ -1,43 +1,33 @@
 import json
 import os
-import random
 from datetime import datetime
-from io import BytesIO
 
 import boto3
 from botocore.exceptions import ClientError
-from PIL import Image
+from common.asset_cache import AssetCache
+from common.compositing import centered_x, composite
+from common.image_encoder import encode_image, resolve_profile
 
 s3 = boto3.client("s3")
 sqs = boto3.client("sqs")
+# 花と花瓶の元画像はウォームコンテナ間で使い回す
+asset_cache = AssetCache(s3_client=s3)
+
+# パレット（背景）のサイズ
+PALETTE_SIZE = (700, 700)
+# 花瓶を貼り付ける縦方向の位置
+VASE_OFFSET_Y = 120
+# 出力先のキー（.png）と読み出し側がPNGを前提とするため、PNGのプロファイルに限る
+IMAGE_ENCODER_PROFILE = resolve_profile(formats=("PNG",))
 
 
 def load_random_image_from_s3(bucket_name, prefix):
     """
     指定されたS3バケットとプレフィックスからランダムなPNG画像をロード。
+    キー一覧とデコード済み画像はウォームコンテナ間でキャッシュされる。
     """
     try:
-        response = s3.list_objects_v2(Bucket=bucket_name, Prefix=prefix)
-        if "Contents" not in response:
-            raise ValueError(
-                f"No images found under prefix {prefix} in bucket {bucket_name}"
-            )
-
-        # PNGファイルのみをフィルタ
-        png_keys = [
-            obj["Key"] for obj in response["Contents"] if obj["Key"].endswith(".png")
-        ]
-        if not png_keys:
-            raise ValueError(
-                f"No PNG images found under prefix {prefix} in bucket {bucket_name}"
-            )
-
-        # ランダムに1つのキーを選択
-        chosen_key = random.choice(png_keys)
-        resp = s3.get_object(Bucket=bucket_name, Key=chosen_key)
-        img = Image.open(resp["Body"]).convert("RGBA")
-        return img
-
+        return asset_cache.load_random_image(bucket_name, prefix)
     except ClientError as e:
         raise RuntimeError(f"Error: Failed to get random image from S3: {e}") from e
     except Exception as e:
@@ -65,12 +55,10 @@ def get_year_week(date: datetime) -> str:
 
 def save_image_to_s3(bucket_name, key, image):
     """
-    PIL画像をS3に保存。
+    PIL画像を環境変数 IMAGE_ENCODER_PROFILE のPNGプロファイルでエンコードしてS3に保存。
     """
-    buffer = BytesIO()
-    image.save(buffer, format="PNG")
-    buffer.seek(0)
-    s3.put_object(Bucket=bucket_name, Key=key, Body=buffer, ContentType="image/png")
+    body, content_type = encode_image(image, IMAGE_ENCODER_PROFILE)
+    s3.put_object(Bucket=bucket_name, Key=key, Body=body, ContentType=content_type)
 
 
 def lambda_handler(event, context):
@@ -89,23 +77,20 @@ def lambda_handler(event, context):
             flower_id = message["flower_id"]
             date = message["date"]
 
-            # パレットの作成
-            palette_width, palette_height = 700, 700
-            palette = Image.new("RGBA", (palette_width, palette_height), (0, 0, 0, 0))
-
             # 花と花瓶の画像をロード
             flower = load_random_image_from_s3(
                 original_bucket, f"single_flowers/{flower_id}.png"
             )
             vase = load_random_image_from_s3(original_bucket, "vases/")
 
-            # 花をパレットに貼り付け
-            flower_position = ((palette_width - flower.width) // 2, 0)
-            palette.paste(flower, flower_position, flower)
-
-            # 花瓶をパレットに貼り付け
-            vase_position = ((palette_width - vase.width) // 2, 120)
-            palette.paste(vase, vase_position, vase)
+            # 花、花瓶の順にパレットへ合成
+            palette = composite(
+                [
+                    (flower, (centered_x(PALETTE_SIZE[0], flower), 0)),
+                    (vase, (centered_x(PALETTE_SIZE[0], vase), VASE_OFFSET_Y)),
+                ],
+                size=PALETTE_SIZE,
+            )
 
             # 保存先のキーを構築
             today = datetime.now()
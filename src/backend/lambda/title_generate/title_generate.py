@@ -1,10 +1,17 @@
 import json
 import logging
 import os
-import urllib.parse
-import urllib.request
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 import boto3
+import requests
+from common.idempotency import request_fingerprint
+from common.openai_chat import send_chat_request
+from common.prompt_input import prepare_input, record_usage
+from common.secrets import get_secret
+from common.selection_cache import content_hash
+from common.single_flight import SingleFlight
 
 logger = logging.getLogger(__name__)
 # ロガーの設定
@@ -16,55 +23,205 @@ handler.setFormatter(formatter)
 logger.addHandler(handler)
 logger.setLevel(logging.INFO)
 
+# 並行してタイトルを生成するレコード数
+DEFAULT_TITLE_GENERATE_CONCURRENCY = 4
+# 1件のタイトル生成に見込む時間（ミリ秒）。残り時間がこれを下回ったレコードは処理せずに再試行させる
+DEFAULT_RECORD_TIME_BUDGET_MS = 22_000
+
+# DIARY_ANALYSIS_MODE が combined の場合に、花の選択と一緒に保存されるタイトルを待つ上限（秒）
+DEFAULT_COMBINED_TITLE_WAIT_SECONDS = 15
+# 花の選択と一緒に保存されるタイトルを確認する間隔（秒）
+COMBINED_TITLE_POLL_SECONDS = 1.0
+
+# ストリームの再配信などで同じ内容のタイトル生成が同時に届いた場合に、コンテナ内とコンテナ間で1回にまとめる。
+# 他のコンテナの結果を待つ時間は1件の処理に見込む時間に収める
+title_flight = SingleFlight(
+    "title-generation",
+    os.environ.get("EXTERNAL_API_STATE_TABLE_NAME"),
+    wait_seconds=float(os.environ.get("TITLE_SINGLE_FLIGHT_WAIT_SECONDS", 10)),
+)
+
 
 def lambda_handler(event, context):
     """
     AWS Lambdaハンドラ関数。DynamoDBストリームのレコードを処理し、日記のタイトルを生成します。
 
     この関数は以下を行います:
-    - DynamoDBでの 'INSERT' 操作によってトリガーされたイベントを処理。
-    - イベントから日記の内容を抽出。
-    - OpenAI API（ChatGPT）を使用して日記内容からタイトルを生成。
-    - 生成したタイトルを同じDynamoDBレコードに保存。
+    - DynamoDBでの 'INSERT' と 'MODIFY' 操作によってトリガーされたレコードを、同時実行数を制限して並行に処理。
+    - レコードから日記の内容を抽出し、内容のフィンガープリントを計算。
+    - 内容が前回タイトルを生成したときから変わっている場合だけ、OpenAI API（ChatGPT）を使用してタイトルを生成。
+    - 生成したタイトルとフィンガープリントを生成AIテーブルに保存。
+
+    失敗したレコードと残り時間が足りずに処理しなかったレコードは batchItemFailures で返し、
+    Lambda にそのレコードから再試行させます。
 
     Args:
         event (dict): DynamoDBストリームイベントの詳細情報、変更されたレコードを含む。
         context (object): 実行時情報を提供するコンテキストオブジェクト。
 
     Returns:
-        dict: ステータスコード、ヘッダー、および本文を含むHTTPレスポンス。
+        dict: 再試行するレコードのシーケンス番号を含む batchItemFailures。
     """
     logger.info("title generate lambda start")
+    records = event["Records"]
+    concurrency = int(
+        os.environ.get("TITLE_GENERATE_CONCURRENCY", DEFAULT_TITLE_GENERATE_CONCURRENCY)
+    )
+    time_budget_ms = int(
+        os.environ.get("TITLE_RECORD_TIME_BUDGET_MS", DEFAULT_RECORD_TIME_BUDGET_MS)
+    )
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = [
+            executor.submit(process_record, record, context, time_budget_ms)
+            for record in records
+        ]
+
+    failures = []
+    for record, future in zip(records, futures):
+        try:
+            future.result()
+        except Exception as e:
+            logger.error(
+                f"Failed to generate title for {record['dynamodb'].get('Keys')}: {e}"
+            )
+            failures.append({"itemIdentifier": record["dynamodb"]["SequenceNumber"]})
+
+    logger.info(f"Processed {len(records) - len(failures)}/{len(records)} records")
+    return {"batchItemFailures": failures}
+
+
+def process_record(record, context, time_budget_ms):
+    """
+    1件のストリームレコードのタイトルを生成して保存します。
+
+    日記の内容のフィンガープリントが変更前の内容、または前回タイトルを生成したときの内容と
+    同じ場合は OpenAI を呼び出しません（削除フラグだけの更新や同じ内容での上書き、再試行など）。
+    同じ内容のタイトル生成が同時に届いた場合は1回だけ OpenAI を呼び出し、結果を使い回します。
+    Lambda の残り時間が見込み時間を下回っている場合は処理せずに再試行させます。
+
+    Args:
+        record (dict): DynamoDBストリームのレコード
+        context (object): 実行時情報を提供するコンテキストオブジェクト
+        time_budget_ms (int): 1件の処理に見込む時間（ミリ秒）
+
+    Raises:
+        TimeoutError: 残り時間が足りない場合
+        Exception: タイトルの生成または保存に失敗した場合
+    """
+    if record["eventName"] not in ("INSERT", "MODIFY"):
+        return
+    new_image = record["dynamodb"]["NewImage"]
+    if "content" not in new_image or new_image.get("is_deleted", {}).get("BOOL"):
+        return
+    diary_content = new_image["content"]["S"]
+    fingerprint = content_fingerprint(diary_content)
+
+    old_content = record["dynamodb"].get("OldImage", {}).get("content", {}).get("S")
+    if old_content is not None and content_fingerprint(old_content) == fingerprint:
+        logger.info("Diary content is unchanged, skipping title generation")
+        return
+    saved_fingerprint = get_saved_fingerprint(record)
+    if saved_fingerprint != fingerprint and record["eventName"] == "INSERT":
+        saved_fingerprint = wait_for_combined_title(record, fingerprint, context)
+    if saved_fingerprint == fingerprint:
+        logger.info("Title is already generated for this content, skipping")
+        return
+
+    if context is not None and context.get_remaining_time_in_millis() < time_budget_ms:
+        raise TimeoutError("Not enough time left to process the record")
+    key = get_record_key(record)
+    generated_title = title_flight.do(
+        request_fingerprint(key["user_id"], key["date"], fingerprint),
+        lambda: generate_title_from_content(diary_content),
+    )
+    save_title_to_dynamodb(generated_title, record, fingerprint)
+
+
+def content_fingerprint(diary_content):
+    """日記の内容のフィンガープリントを計算します。
+
+    花の選択結果のキャッシュと同じく、全角・半角や空白などの表記の違いでは変わりません。
+    花の選択と一緒にタイトルを保存する場合も同じフィンガープリントを保存します。
+
+    Args:
+        diary_content (string): 日記の内容
+
+    Returns:
+        string: 内容の SHA-256 ハッシュ（16進数）
+    """
+    return content_hash(diary_content)
+
+
+def get_saved_fingerprint(record):
+    """前回タイトルを生成したときの内容のフィンガープリントを取得します。
+
+    Args:
+        record (dict): Lambda関数のイベントレコード
+
+    Returns:
+        string: 保存されているフィンガープリント。未保存か取得に失敗した場合は None
+    """
     try:
-        record = event["Records"][0]
-        if record["eventName"] == "INSERT":
-            logger.info(f"content: {record['dynamodb']['NewImage']['content']['S']}")
-            diary_content = record["dynamodb"]["NewImage"]["content"]["S"]
-            generated_title = generate_title_from_content(diary_content)
-            save_title_to_dynamodb(generated_title, record)
-
-        return {
-            "statusCode": 200,
-            "body": json.dumps("Processed DynamoDB Stream records."),
-            "headers": {
-                "Content-Type": "application/json",
-                "Access-Control-Allow-Origin": "*",
-            },
-        }
+        table = boto3.resource("dynamodb").Table(os.environ["TABLE_NAME"])
+        item = table.get_item(
+            Key=get_record_key(record),
+            ProjectionExpression="content_fingerprint",
+        ).get("Item", {})
     except Exception as e:
-        return {
-            "statusCode": 400,
-            "body": json.dumps(f"An error occurred: {str(e)}"),
-            "headers": {
-                "Content-Type": "application/json",
-                "Access-Control-Allow-Origin": "*",
-            },
-        }
+        # 取得できない場合はタイトルを生成し直す
+        logger.warning(f"Failed to get saved fingerprint: {str(e)}")
+        return None
+    return item.get("content_fingerprint")
+
+
+def wait_for_combined_title(record, fingerprint, context):
+    """花の選択と一緒に保存されるタイトルを待ちます。
+
+    DIARY_ANALYSIS_MODE が combined の場合、新しい日記のタイトルは花の選択と同じ呼び出しで
+    生成されるため、保存されるまで COMBINED_TITLE_WAIT_SECONDS を上限に待ちます。
+    それ以外の場合は待ちません。
+
+    Args:
+        record (dict): Lambda関数のイベントレコード
+        fingerprint (string): 日記の内容のフィンガープリント
+        context (object): 実行時情報を提供するコンテキストオブジェクト
+
+    Returns:
+        string: 最後に確認したフィンガープリント
+    """
+    if os.environ.get("DIARY_ANALYSIS_MODE", "separate") != "combined":
+        return None
+    wait_seconds = float(
+        os.environ.get(
+            "COMBINED_TITLE_WAIT_SECONDS", DEFAULT_COMBINED_TITLE_WAIT_SECONDS
+        )
+    )
+    deadline = time.monotonic() + wait_seconds
+    if context is not None:
+        # 待った後にタイトルを生成する時間を残す
+        remaining = context.get_remaining_time_in_millis() / 1000
+        deadline = min(deadline, time.monotonic() + remaining / 2)
+    saved_fingerprint = None
+    while time.monotonic() < deadline:
+        time.sleep(COMBINED_TITLE_POLL_SECONDS)
+        saved_fingerprint = get_saved_fingerprint(record)
+        if saved_fingerprint == fingerprint:
+            break
+    return saved_fingerprint
+
+
+def get_record_key(record):
+    """レコードの日記のキー（user_id と date）を返します。"""
+    new_image = record["dynamodb"]["NewImage"]
+    return {"user_id": new_image["user_id"]["S"], "date": new_image["date"]["S"]}
 
 
 def generate_title_from_content(diary_content):
     """ChatGPTを使用して日記の内容からタイトルを生成します。
 
+    長い日記はタイトル用のトークン数の上限（TITLE_INPUT_TOKEN_BUDGET）に収めてから送ります。
+
     Args:
         diary_content (string): 日記の内容
 
@@ -86,16 +243,18 @@ def generate_title_from_content(diary_content):
         "model": "gpt-4o-mini",
         "messages": [
             {"role": "system", "content": system_message},
-            {"role": "user", "content": diary_content},
+            {"role": "user", "content": prepare_input(diary_content, "title")},
         ],
         "temperature": 0.7,
     }
     try:
         response = send_request_to_openai_api(api_endpoint, api_key, request_data)
-        generated_title = json.loads(response)["choices"][0]["message"]["content"]
+        response_data = json.loads(response)
+        record_usage("title", response_data.get("usage"))
+        generated_title = response_data["choices"][0]["message"]["content"]
         return generated_title
-    except urllib.error.HTTPError as e:
-        if e.code == 429:
+    except requests.exceptions.HTTPError as e:
+        if e.response is not None and e.response.status_code == 429:
             logger.error(
                 "API request rate limit exceeded or usage has exceeded billing threshold. "
                 "Please wait and try again or check your account billing details."
@@ -108,12 +267,13 @@ def generate_title_from_content(diary_content):
         raise
 
 
-def save_title_to_dynamodb(generated_title, record):
+def save_title_to_dynamodb(generated_title, record, fingerprint=None):
     """生成されたタイトルをDynamoDBに保存します。
 
     Args:
         generated_title (string): 生成されたタイトル
         record (dict): Lambda関数のイベントレコード
+        fingerprint (string): タイトルを生成した日記の内容のフィンガープリント
 
     Returns:
         none
@@ -122,13 +282,16 @@ def save_title_to_dynamodb(generated_title, record):
     table_name = os.environ["TABLE_NAME"]
     table = dynamodb.Table(table_name)
     try:
+        if fingerprint is None:
+            update_expression = "set title = :t"
+            values = {":t": generated_title}
+        else:
+            update_expression = "set title = :t, content_fingerprint = :f"
+            values = {":t": generated_title, ":f": fingerprint}
         dynamodb_response = table.update_item(
-            Key={
-                "user_id": record["dynamodb"]["NewImage"]["user_id"]["S"],
-                "date": record["dynamodb"]["NewImage"]["date"]["S"],
-            },
-            UpdateExpression="set title = :t",
-            ExpressionAttributeValues={":t": generated_title},
+            Key=get_record_key(record),
+            UpdateExpression=update_expression,
+            ExpressionAttributeValues=values,
         )
         logger.info(f"DynamoDB update response: {dynamodb_response}")
     except Exception as e:
@@ -145,13 +308,9 @@ def get_parameter_from_parameter_store(parameter_name):
     Returns:
         string: OpenAI APIトークン
     """
-
-    ssm = boto3.client(
-        "ssm", region_name=os.environ.get("AWS_REGION", "ap-northeast-1")
-    )
     try:
-        response = ssm.get_parameter(Name=parameter_name, WithDecryption=True)
-        return response["Parameter"]["Value"]
+        # 復号済みの値はウォームコンテナ間でTTL付きでキャッシュされる
+        return get_secret(parameter_name)
     except Exception as e:
         logger.error(
             f"An unexpected error occurred during get parameter fro parameter store: {str(e)}"
@@ -162,6 +321,9 @@ def get_parameter_from_parameter_store(parameter_name):
 def send_request_to_openai_api(api_endpoint, api_key, request_data):
     """OpenAI APIを呼び出します
 
+    共通の OpenAI クライアントで送信します（common.openai_chat.send_chat_request）。
+    レート制限のトークンを取得できない場合は失敗して、ストリームのレコードを再試行させます。
+
     Args:
         api_endpoint (string): OpenAI APIエンドポイント
         api_key (string): OpenAI APIキー
@@ -170,13 +332,8 @@ def send_request_to_openai_api(api_endpoint, api_key, request_data):
     Returns:
         dict: ChatGPTへのAPIリクエストのレスポンスデータ
     """
-    headers = {"Content-Type": "application/json", "Authorization": "Bearer " + api_key}
-
-    data = json.dumps(request_data).encode("utf-8")
-    req = urllib.request.Request(api_endpoint, data=data, headers=headers)
-
     try:
-        response = urllib.request.urlopen(req).read().decode("utf-8")
+        response = send_chat_request(api_key, request_data, api_endpoint)
     except Exception as e:
         error_message = f"An unexpected error occurred: {str(e)}"
         logger.error(json.dumps({"error": error_message}))
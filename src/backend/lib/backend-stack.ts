@@ -1,5 +1,6 @@
 import * as cdk from 'aws-cdk-lib'
 import * as acm from 'aws-cdk-lib/aws-certificatemanager'
+import * as lambda from 'aws-cdk-lib/aws-lambda'
 import * as s3 from 'aws-cdk-lib/aws-s3'
 import type { Construct } from 'constructs'
 import { Api, Auth, Bouquet, Flower, Identity, Settings, Web } from './constructs'
@@ -33,6 +34,17 @@ export class BackendStack extends cdk.Stack {
       }
     }
 
+    // Lambda関数間で共有するPythonモジュールのレイヤー
+    const commonLayer = new lambda.LayerVersion(this, 'CommonLayer', {
+      code: lambda.Code.fromAsset('lambda/common', {
+        bundling: {
+          image: lambda.Runtime.PYTHON_3_11.bundlingImage,
+          command: ['bash', '-c', 'mkdir -p /asset-output/python/common && cp -au . /asset-output/python/common'],
+        },
+      }),
+      compatibleRuntimes: [lambda.Runtime.PYTHON_3_11],
+    })
+
     // 認証機能スタックのインスタンス化
     const auth = new Auth(this, 'Auth', { cognitoDomain })
 
@@ -50,6 +62,7 @@ export class BackendStack extends cdk.Stack {
       userPool: auth.userPool,
       api: api.api,
       cognitoAuthorizer: api.cognitoAuthorizer,
+      commonLayer,
     })
     // Diary機能コンストラクトのスタック化
     const diary = new Diary(this, 'Diary', {
@@ -62,6 +75,11 @@ export class BackendStack extends cdk.Stack {
       flowerSelectFunction: flower.flowerSelectFunction,
       originalImageBucket: flower.originalImageBucket,
       imageProcessingQueue: flower.imageProcessingQueue,
+      difyApiKey: flower.difyApiKey,
+      openAiApiKey: flower.openAiApiKey,
+      flowerSelectionCacheTable: flower.flowerSelectionCacheTable,
+      externalApiStateTable: flower.externalApiStateTable,
+      commonLayer,
     })
 
     const bouquet = new Bouquet(this, 'Bouquet', {
@@ -72,6 +90,7 @@ export class BackendStack extends cdk.Stack {
       generativeAiTable: flower.generativeAiTable,
       cognitoAuthorizer: api.cognitoAuthorizer,
       originalImageBucket: flower.originalImageBucket,
+      commonLayer,
     })
 
     const settings = new Settings(this, 'Settings', {
@@ -14,6 +14,7 @@ export interface BouquetProps {
   generativeAiTable: dynamodb.Table
   cognitoAuthorizer: apigateway.CognitoUserPoolsAuthorizer
   originalImageBucket: s3.Bucket
+  commonLayer: lambda.LayerVersion
 }
 
 export class Bouquet extends Construct {
@@ -49,6 +50,7 @@ export class Bouquet extends Construct {
           command: ['bash', '-c', 'pip install -r requirements.txt -t /asset-output && cp -au . /asset-output'],
         },
       }),
+      layers: [props.commonLayer],
       environment: {
         GENERATIVE_AI_TABLE_NAME: props.generativeAiTable.tableName,
         BOUQUET_TABLE_NAME: props.bouquetTable.tableName,
@@ -3,9 +3,10 @@ import * as apigateway from 'aws-cdk-lib/aws-apigateway'
 import type * as cognito from 'aws-cdk-lib/aws-cognito'
 import * as dynamodb from 'aws-cdk-lib/aws-dynamodb'
 import * as lambda from 'aws-cdk-lib/aws-lambda'
-import { DynamoEventSource } from 'aws-cdk-lib/aws-lambda-event-sources'
+import { DynamoEventSource, SqsEventSource } from 'aws-cdk-lib/aws-lambda-event-sources'
 import type * as s3 from 'aws-cdk-lib/aws-s3'
-import type * as sqs from 'aws-cdk-lib/aws-sqs'
+import * as sqs from 'aws-cdk-lib/aws-sqs'
+import type * as ssm from 'aws-cdk-lib/aws-ssm'
 import { Construct } from 'constructs'
 
 export interface DiaryProps {
@@ -18,6 +19,11 @@ export interface DiaryProps {
   originalImageBucket: s3.Bucket
   flowerBucket: s3.Bucket
   imageProcessingQueue: sqs.Queue
+  commonLayer: lambda.LayerVersion
+  difyApiKey: ssm.IStringParameter
+  openAiApiKey: ssm.IStringParameter
+  flowerSelectionCacheTable: dynamodb.Table
+  externalApiStateTable: dynamodb.Table
 }
 
 export class Diary extends Construct {
@@ -28,8 +34,26 @@ export class Diary extends Construct {
     super(scope, id)
 
     // DynamoDBストリームイベントソースの設定
+    // タイトル生成はバッチ内のレコードを並行に処理し、失敗したレコードだけを再試行させる
     const diaryTableEventSource = new DynamoEventSource(props.table, {
       startingPosition: lambda.StartingPosition.LATEST,
+      batchSize: 10,
+      reportBatchItemFailures: true,
+      retryAttempts: 5,
+    })
+
+    // 日記作成リクエストの冪等キーと処理結果を保存するDynamoDBテーブルの作成
+    const idempotencyTable = new dynamodb.Table(this, 'idempotencyTable', {
+      partitionKey: {
+        name: 'user_id',
+        type: dynamodb.AttributeType.STRING,
+      },
+      sortKey: {
+        name: 'date',
+        type: dynamodb.AttributeType.STRING,
+      },
+      removalPolicy: cdk.RemovalPolicy.DESTROY,
+      timeToLiveAttribute: 'expires_at',
     })
 
     // 日記作成用Lambda関数の定義
@@ -42,6 +66,7 @@ export class Diary extends Construct {
           command: ['bash', '-c', 'pip install -r requirements.txt -t /asset-output && cp -au . /asset-output'],
         },
       }),
+      layers: [props.commonLayer],
       logRetention: 14,
       environment: {
         TABLE_NAME: props.table.tableName,
@@ -49,14 +74,132 @@ export class Diary extends Construct {
         FLOWER_SELECT_FUNCTION_NAME: props.flowerSelectFunction.functionName,
         FLOWER_BUKCET_NAME: props.flowerBucket.bucketName,
         IMAGE_PROCESSING_QUEUE_URL: props.imageProcessingQueue.queueUrl,
+        // 事前レンダリング済みの包装済み花画像は元画像バケットの wrapped_flowers/ に置く
+        WRAPPED_FLOWER_CACHE_BUCKET_NAME: props.originalImageBucket.bucketName,
+        // 花の選択は flower_select Lambda を呼び出さずにプロセス内で行う
+        FLOWER_SELECT_MODE: 'in_process',
+        GENERATIVE_AI_TABLE_NAME: props.generativeAiTable.tableName,
+        IDEMPOTENCY_TABLE_NAME: idempotencyTable.tableName,
+        FLOWER_CACHE_TABLE_NAME: props.flowerSelectionCacheTable.tableName,
+        EXTERNAL_API_STATE_TABLE_NAME: props.externalApiStateTable.tableName,
       },
       timeout: cdk.Duration.seconds(30),
     })
-    props.table.grantWriteData(diaryCreateFunction)
+    props.table.grantReadWriteData(diaryCreateFunction)
     props.flowerSelectFunction.grantInvoke(diaryCreateFunction)
     props.originalImageBucket.grantRead(diaryCreateFunction)
     props.flowerBucket.grantPut(diaryCreateFunction)
+    // 署名付きURLで画像を返すため読み取り権限も付与
+    props.flowerBucket.grantRead(diaryCreateFunction)
     props.imageProcessingQueue.grantSendMessages(diaryCreateFunction)
+    // プロセス内で花を選択するための権限を付与
+    props.generativeAiTable.grantWriteData(diaryCreateFunction)
+    diaryCreateFunction.addToRolePolicy(
+      new cdk.aws_iam.PolicyStatement({
+        resources: [props.difyApiKey.parameterArn, props.openAiApiKey.parameterArn],
+        actions: ['ssm:GetParameter'],
+      }),
+    )
+    idempotencyTable.grantReadWriteData(diaryCreateFunction)
+    props.flowerSelectionCacheTable.grantReadWriteData(diaryCreateFunction)
+    props.externalApiStateTable.grantReadWriteData(diaryCreateFunction)
+
+    // 日記一括インポートの進捗を保存するDynamoDBテーブルの作成
+    const importJobTable = new dynamodb.Table(this, 'importJobTable', {
+      partitionKey: {
+        name: 'user_id',
+        type: dynamodb.AttributeType.STRING,
+      },
+      sortKey: {
+        name: 'import_id',
+        type: dynamodb.AttributeType.STRING,
+      },
+      removalPolicy: cdk.RemovalPolicy.DESTROY,
+      timeToLiveAttribute: 'expires_at',
+    })
+
+    // インポートした日記の花の選択ジョブ用のデッドレターキューの作成
+    const diaryImportDeadLetterQueue = new sqs.Queue(this, 'diaryImportDLQ', {
+      retentionPeriod: cdk.Duration.days(14), // メッセージ保持期間
+      enforceSSL: true, // SSL を強制
+    })
+
+    // インポートした日記の花の選択ジョブ用の SQS キューの作成
+    const diaryImportQueue = new sqs.Queue(this, 'diaryImportQueue', {
+      visibilityTimeout: cdk.Duration.seconds(1080), // ワーカーのタイムアウトの6倍
+      retentionPeriod: cdk.Duration.days(4), // メッセージの保持期間
+      deadLetterQueue: {
+        queue: diaryImportDeadLetterQueue,
+        maxReceiveCount: 5, // 最大試行回数
+      },
+      enforceSSL: true, // SSL を強制
+    })
+
+    // 日記一括インポート用Lambda関数の定義（保存と進捗の確認）
+    const diaryImportFunction = new lambda.Function(this, 'diaryImportLambda', {
+      runtime: lambda.Runtime.PYTHON_3_11,
+      handler: 'diary_import.lambda_handler',
+      code: lambda.Code.fromAsset('lambda/diary_import'),
+      layers: [props.commonLayer],
+      logRetention: 14,
+      environment: {
+        TABLE_NAME: props.table.tableName,
+        DIARY_IMPORT_QUEUE_URL: diaryImportQueue.queueUrl,
+        IMPORT_JOB_TABLE_NAME: importJobTable.tableName,
+      },
+      timeout: cdk.Duration.seconds(30),
+    })
+    // 既存の日記を上書きしないよう、保存の前に BatchGetItem で確認する
+    props.table.grantReadWriteData(diaryImportFunction)
+    importJobTable.grantReadWriteData(diaryImportFunction)
+    diaryImportQueue.grantSendMessages(diaryImportFunction)
+
+    // インポートした日記の花の選択と画像生成ジョブの送信を行うLambda関数の定義
+    const diaryImportWorkerFunction = new lambda.Function(this, 'diaryImportWorkerLambda', {
+      runtime: lambda.Runtime.PYTHON_3_11,
+      handler: 'diary_import_worker.lambda_handler',
+      code: lambda.Code.fromAsset('lambda/diary_import_worker', {
+        bundling: {
+          image: lambda.Runtime.PYTHON_3_11.bundlingImage,
+          command: ['bash', '-c', 'pip install -r requirements.txt -t /asset-output && cp -au . /asset-output'],
+        },
+      }),
+      layers: [props.commonLayer],
+      logRetention: 14,
+      environment: {
+        TABLE_NAME: props.table.tableName,
+        ORIGINAL_IMAGE_BUCKET_NAME: props.originalImageBucket.bucketName,
+        GENERATIVE_AI_TABLE_NAME: props.generativeAiTable.tableName,
+        IMAGE_PROCESSING_QUEUE_URL: props.imageProcessingQueue.queueUrl,
+        IMPORT_JOB_TABLE_NAME: importJobTable.tableName,
+        FLOWER_CACHE_TABLE_NAME: props.flowerSelectionCacheTable.tableName,
+        EXTERNAL_API_STATE_TABLE_NAME: props.externalApiStateTable.tableName,
+      },
+      timeout: cdk.Duration.seconds(180),
+    })
+    // メッセージには日記の内容を含めないため、日記テーブルから読み出す
+    props.table.grantReadData(diaryImportWorkerFunction)
+    props.generativeAiTable.grantWriteData(diaryImportWorkerFunction)
+    props.imageProcessingQueue.grantSendMessages(diaryImportWorkerFunction)
+    importJobTable.grantWriteData(diaryImportWorkerFunction)
+    props.flowerSelectionCacheTable.grantReadWriteData(diaryImportWorkerFunction)
+    props.externalApiStateTable.grantReadWriteData(diaryImportWorkerFunction)
+    // 選択結果を検証する花のカタログを読み込む
+    props.originalImageBucket.grantRead(diaryImportWorkerFunction)
+    diaryImportWorkerFunction.addToRolePolicy(
+      new cdk.aws_iam.PolicyStatement({
+        resources: [props.difyApiKey.parameterArn, props.openAiApiKey.parameterArn],
+        actions: ['ssm:GetParameter'],
+      }),
+    )
+    // Dify への同時リクエスト数を抑えるため、同時実行数を制限する
+    diaryImportWorkerFunction.addEventSource(
+      new SqsEventSource(diaryImportQueue, {
+        batchSize: 5,
+        maxConcurrency: 2,
+        reportBatchItemFailures: true,
+      }),
+    )
 
     // 日記編集用Lambda関数の定義
     const diaryEditFunction = new lambda.Function(this, 'diaryEditLambda', {
@@ -109,6 +252,13 @@ export class Diary extends Construct {
     diaryApi.addMethod('DELETE', new apigateway.LambdaIntegration(diaryDeleteFunction), {
       authorizer: props.cognitoAuthorizer,
     })
+    const diaryImportApi = diaryApi.addResource('import')
+    diaryImportApi.addMethod('POST', new apigateway.LambdaIntegration(diaryImportFunction), {
+      authorizer: props.cognitoAuthorizer,
+    })
+    diaryImportApi.addMethod('GET', new apigateway.LambdaIntegration(diaryImportFunction), {
+      authorizer: props.cognitoAuthorizer,
+    })
 
     // 生成AI用Lambda関数のロール作成
     const generativeAiLambdaRole = new cdk.aws_iam.Role(this, 'generativeAiLambdaRole', {
@@ -129,14 +279,22 @@ export class Diary extends Construct {
     const diaryGenerateTitleCreateFunction = new lambda.Function(this, 'TitleGenerateLambda', {
       runtime: lambda.Runtime.PYTHON_3_11,
       handler: 'title_generate.lambda_handler',
-      code: lambda.Code.fromAsset('lambda/title_generate'),
+      code: lambda.Code.fromAsset('lambda/title_generate', {
+        bundling: {
+          image: lambda.Runtime.PYTHON_3_11.bundlingImage,
+          command: ['bash', '-c', 'pip install -r requirements.txt -t /asset-output && cp -au . /asset-output'],
+        },
+      }),
+      layers: [props.commonLayer],
       role: generativeAiLambdaRole,
       environment: {
         TABLE_NAME: props.generativeAiTable.tableName,
+        EXTERNAL_API_STATE_TABLE_NAME: props.externalApiStateTable.tableName,
       },
-      timeout: cdk.Duration.seconds(30),
+      timeout: cdk.Duration.seconds(60),
     })
-    props.generativeAiTable.grantWriteData(diaryGenerateTitleCreateFunction)
+    props.generativeAiTable.grantReadWriteData(diaryGenerateTitleCreateFunction)
+    props.externalApiStateTable.grantReadWriteData(diaryGenerateTitleCreateFunction)
     props.table.grantStreamRead(diaryGenerateTitleCreateFunction)
     diaryGenerateTitleCreateFunction.addEventSource(diaryTableEventSource)
 
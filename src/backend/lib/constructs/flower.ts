@@ -14,6 +14,7 @@ export interface FlowerProps {
   userPool: cognito.UserPool
   api: apigateway.RestApi
   cognitoAuthorizer: apigateway.CognitoUserPoolsAuthorizer
+  commonLayer: lambda.LayerVersion
 }
 
 export class Flower extends Construct {
@@ -23,6 +24,10 @@ export class Flower extends Construct {
   public readonly flowerSelectFunction: lambda.Function
   public readonly flowerBucket: s3.Bucket
   public readonly imageProcessingQueue: sqs.Queue
+  public readonly difyApiKey: ssm.IStringParameter
+  public readonly openAiApiKey: ssm.IStringParameter
+  public readonly flowerSelectionCacheTable: dynamodb.Table
+  public readonly externalApiStateTable: dynamodb.Table
   constructor(scope: Construct, id: string, props: FlowerProps) {
     super(scope, id)
 
@@ -55,6 +60,26 @@ export class Flower extends Construct {
       pointInTimeRecovery: true,
     })
 
+    // 日記の内容のハッシュ値ごとに花の選択結果を保存するDynamoDBテーブルの作成
+    const flowerSelectionCacheTable = new dynamodb.Table(this, 'flowerSelectionCacheTable', {
+      partitionKey: {
+        name: 'content_hash',
+        type: dynamodb.AttributeType.STRING,
+      },
+      removalPolicy: cdk.RemovalPolicy.DESTROY,
+      timeToLiveAttribute: 'expires_at',
+    })
+
+    // 外部API（Dify, OpenAI）のサーキットブレーカーや呼び出しをまとめるリースなど、コンテナ間で共有する状態を保存するDynamoDBテーブルの作成
+    const externalApiStateTable = new dynamodb.Table(this, 'externalApiStateTable', {
+      partitionKey: {
+        name: 'name',
+        type: dynamodb.AttributeType.STRING,
+      },
+      removalPolicy: cdk.RemovalPolicy.DESTROY,
+      timeToLiveAttribute: 'expires_at',
+    })
+
     // 元画像保存用S3バケットの作成
     const originalImageBucket = new s3.Bucket(this, 'originalImageBucket', {
       enforceSSL: true,
@@ -94,24 +119,35 @@ export class Flower extends Construct {
           command: ['bash', '-c', 'pip install -r requirements.txt -t /asset-output && cp -au . /asset-output'],
         },
       }),
+      layers: [props.commonLayer],
       environment: {
         DIARY_TABLE_NAME: table.tableName,
         GENERATIVE_AI_TABLE_NAME: generativeAiTable.tableName,
         ORIGINAL_IMAGE_BUCKET_NAME: originalImageBucket.bucketName,
         FLOWER_BUCKET_NAME: flowerBucket.bucketName,
+        FLOWER_CACHE_TABLE_NAME: flowerSelectionCacheTable.tableName,
+        EXTERNAL_API_STATE_TABLE_NAME: externalApiStateTable.tableName,
       },
       timeout: cdk.Duration.seconds(60),
     })
     generativeAiTable.grantWriteData(flowerSelectFunction)
+    flowerSelectionCacheTable.grantReadWriteData(flowerSelectFunction)
+    externalApiStateTable.grantReadWriteData(flowerSelectFunction)
     flowerBucket.grantPut(flowerSelectFunction)
     table.grantStreamRead(flowerSelectFunction)
     originalImageBucket.grantPut(flowerSelectFunction)
+    // 選択結果を検証する花のカタログを読み込むための権限を付与
+    originalImageBucket.grantRead(flowerSelectFunction)
     const difyApiKey = ssm.StringParameter.fromStringParameterAttributes(this, 'DifyApiKey', {
       parameterName: 'DIFY_API_KEY',
     })
+    // DIARY_ANALYSIS_MODE が combined の場合は OpenAI でタイトルと花を一緒に選ぶ
+    const openAiApiKey = ssm.StringParameter.fromStringParameterAttributes(this, 'OpenAiApiKey', {
+      parameterName: 'OpenAI_API_KEY',
+    })
     flowerSelectFunction.addToRolePolicy(
       new iam.PolicyStatement({
-        resources: [difyApiKey.parameterArn],
+        resources: [difyApiKey.parameterArn, openAiApiKey.parameterArn],
         actions: ['ssm:GetParameter'],
       }),
     )
@@ -141,6 +177,7 @@ export class Flower extends Construct {
           command: ['bash', '-c', 'pip install -r requirements.txt -t /asset-output && cp -au . /asset-output'],
         },
       }),
+      layers: [props.commonLayer],
       environment: {
         ORIGINAL_IMAGE_BUCKET_NAME: originalImageBucket.bucketName,
         FLOWER_BUCKET_NAME: flowerBucket.bucketName,
@@ -170,5 +207,9 @@ export class Flower extends Construct {
     this.flowerSelectFunction = flowerSelectFunction
     this.flowerBucket = flowerBucket
     this.imageProcessingQueue = imageProcessingQueue
+    this.difyApiKey = difyApiKey
+    this.openAiApiKey = openAiApiKey
+    this.flowerSelectionCacheTable = flowerSelectionCacheTable
+    this.externalApiStateTable = externalApiStateTable
   }
 }
@@ -0,0 +1,306 @@
+"""
+タイトルが生成されていない日記のタイトルを生成して保存するスクリプト。
+
+日記テーブルを並列スキャンし、生成AIテーブルにタイトルがない日記のタイトルを
+レートリミッターで OpenAI へのリクエストの速さを抑えながら並行して生成する。
+生成したタイトルは内容のフィンガープリントと一緒にまとめて書き込む。
+処理を終えたページの位置はセグメントごとにチェックポイントのファイルに保存し、
+中断した場合は同じコマンドで続きから再開できる。
+生成に失敗した日記はチェックポイントを削除して再実行すると、改めて対象になる。
+--rate は稼働中の title_generate の分を残した速さを指定する。
+
+Usage:
+    python scripts/backfill_titles.py \\
+        --diary-table <DIARY_TABLE_NAME> \\
+        --generative-ai-table <GENERATIVE_AI_TABLE_NAME> \\
+        --state-table <EXTERNAL_API_STATE_TABLE_NAME>
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from boto3.dynamodb.types import TypeSerializer
+from botocore.exceptions import ClientError
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "lambda"))
+
+from common import aws  # noqa: E402
+from common.rate_limiter import RateLimiter  # noqa: E402
+from title_generate.title_generate import (  # noqa: E402
+    content_fingerprint,
+    generate_title_from_content,
+)
+
+logger = logging.getLogger(__name__)
+
+# BatchGetItem で1回に読み込める最大件数
+BATCH_GET_SIZE = 100
+# TransactWriteItems で1回に書き込める最大件数
+TRANSACT_WRITE_SIZE = 100
+# 1ページで読み込む日記の件数
+SCAN_PAGE_SIZE = 500
+# レート制限のトークンを待つ上限（秒）
+RATE_LIMIT_WAIT_SECONDS = 60
+
+_serializer = TypeSerializer()
+
+
+class Checkpoint:
+    """
+    セグメントごとの処理を終えた位置と件数を保存するチェックポイント。
+
+    Attributes:
+        path (Path): チェックポイントのファイル
+        segments (dict): セグメント番号 -> {"last_key", "done", "generated", "skipped", "failed"}
+    """
+
+    def __init__(self, path, total_segments):
+        self.path = Path(path)
+        self.segments = {}
+        self._lock = threading.Lock()
+        if self.path.exists():
+            data = json.loads(self.path.read_text())
+            if data["total_segments"] != total_segments:
+                raise ValueError(
+                    f"Checkpoint was created with {data['total_segments']} segments"
+                )
+            self.segments = {int(k): v for k, v in data["segments"].items()}
+        self.total_segments = total_segments
+
+    def get(self, segment):
+        with self._lock:
+            return dict(
+                self.segments.get(
+                    segment,
+                    {
+                        "last_key": None,
+                        "done": False,
+                        "generated": 0,
+                        "skipped": 0,
+                        "failed": 0,
+                    },
+                )
+            )
+
+    def update(self, segment, state):
+        """セグメントの状態を更新し、ファイルを置き換えて保存する"""
+        with self._lock:
+            self.segments[segment] = state
+            tmp = self.path.with_suffix(".tmp")
+            tmp.write_text(
+                json.dumps(
+                    {"total_segments": self.total_segments, "segments": self.segments},
+                    ensure_ascii=False,
+                )
+            )
+            os.replace(tmp, self.path)
+
+    def totals(self):
+        with self._lock:
+            return {
+                name: sum(state[name] for state in self.segments.values())
+                for name in ("generated", "skipped", "failed")
+            }
+
+
+def scan_pages(table, segment, total_segments, start_key):
+    """セグメントの日記をページごとに返す"""
+    kwargs = {
+        "Segment": segment,
+        "TotalSegments": total_segments,
+        "Limit": SCAN_PAGE_SIZE,
+        "ProjectionExpression": "user_id, #date, content, is_deleted",
+        "ExpressionAttributeNames": {"#date": "date"},
+    }
+    if start_key:
+        kwargs["ExclusiveStartKey"] = start_key
+    while True:
+        response = table.scan(**kwargs)
+        last_key = response.get("LastEvaluatedKey")
+        yield response["Items"], last_key
+        if not last_key:
+            return
+        kwargs["ExclusiveStartKey"] = last_key
+
+
+def find_untitled(dynamodb, generative_ai_table, diaries):
+    """生成AIテーブルにタイトルがない日記を返す"""
+    titled = set()
+    for start in range(0, len(diaries), BATCH_GET_SIZE):
+        request = {
+            generative_ai_table: {
+                "Keys": [
+                    {"user_id": diary["user_id"], "date": diary["date"]}
+                    for diary in diaries[start : start + BATCH_GET_SIZE]
+                ],
+                "ProjectionExpression": "user_id, #date, title",
+                "ExpressionAttributeNames": {"#date": "date"},
+            }
+        }
+        while request:
+            response = dynamodb.batch_get_item(RequestItems=request)
+            for item in response["Responses"].get(generative_ai_table, []):
+                if item.get("title"):
+                    titled.add((item["user_id"], item["date"]))
+            request = response.get("UnprocessedKeys")
+    return [d for d in diaries if (d["user_id"], d["date"]) not in titled]
+
+
+def update_action(table_name, result):
+    """タイトルがまだない場合だけタイトルとフィンガープリントを設定する更新"""
+    return {
+        "Update": {
+            "TableName": table_name,
+            "Key": {
+                "user_id": _serializer.serialize(result["user_id"]),
+                "date": _serializer.serialize(result["date"]),
+            },
+            "UpdateExpression": "SET title = :t, content_fingerprint = :f",
+            "ConditionExpression": "attribute_not_exists(title)",
+            "ExpressionAttributeValues": {
+                ":t": _serializer.serialize(result["title"]),
+                ":f": _serializer.serialize(result["fingerprint"]),
+            },
+        }
+    }
+
+
+def write_titles(client, table_name, results):
+    """
+    生成したタイトルをまとめて書き込む。
+
+    まとめた書き込みは1件でもタイトルが先に保存されていると取り消されるため、
+    その場合は1件ずつ書き込み、保存済みのタイトルは上書きしない。
+
+    Returns:
+        int: 書き込んだ件数
+    """
+    written = 0
+    for start in range(0, len(results), TRANSACT_WRITE_SIZE):
+        chunk = results[start : start + TRANSACT_WRITE_SIZE]
+        try:
+            client.transact_write_items(
+                TransactItems=[update_action(table_name, r) for r in chunk]
+            )
+            written += len(chunk)
+            continue
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "TransactionCanceledException":
+                raise
+        for result in chunk:
+            try:
+                client.update_item(**update_action(table_name, result)["Update"])
+                written += 1
+            except ClientError as e:
+                if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                    raise
+    return written
+
+
+def generate_title(limiter, diary):
+    """レート制限のトークンを待ってからタイトルを生成する"""
+    limiter.acquire(deadline=time.monotonic() + RATE_LIMIT_WAIT_SECONDS)
+    return generate_title_from_content(diary["content"])
+
+
+def backfill_segment(args, segment, checkpoint, limiter, executor):
+    """1つのセグメントのタイトルを生成する"""
+    state = checkpoint.get(segment)
+    if state["done"]:
+        return
+    # boto3 のリソースはスレッドセーフではないため、セグメントごとに生成する
+    dynamodb = aws.resource("dynamodb")
+    client = aws.client("dynamodb")
+    table = dynamodb.Table(args.diary_table)
+
+    for diaries, last_key in scan_pages(
+        table, segment, args.segments, state["last_key"]
+    ):
+        diaries = [d for d in diaries if d.get("content") and not d.get("is_deleted")]
+        untitled = find_untitled(dynamodb, args.generative_ai_table, diaries)
+        futures = [
+            (diary, executor.submit(generate_title, limiter, diary))
+            for diary in untitled
+        ]
+        results = []
+        for diary, future in futures:
+            try:
+                title = future.result()
+            except Exception as e:
+                logger.warning(f"Failed to generate title for {diary['date']}: {e}")
+                state["failed"] += 1
+                continue
+            results.append(
+                {
+                    "user_id": diary["user_id"],
+                    "date": diary["date"],
+                    "title": title,
+                    "fingerprint": content_fingerprint(diary["content"]),
+                }
+            )
+        if results and not args.dry_run:
+            written = write_titles(client, args.generative_ai_table, results)
+            state["generated"] += written
+            state["skipped"] += len(results) - written
+        state["skipped"] += len(diaries) - len(untitled)
+        state["last_key"] = last_key
+        state["done"] = last_key is None
+        checkpoint.update(segment, state)
+        logger.info(f"Segment {segment}: {checkpoint.totals()}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--diary-table", required=True, help="日記テーブル名")
+    parser.add_argument("--generative-ai-table", required=True, help="生成AIテーブル名")
+    parser.add_argument(
+        "--state-table",
+        default=os.environ.get("EXTERNAL_API_STATE_TABLE_NAME"),
+        help="レート制限の状態を保存する外部APIの状態テーブル名",
+    )
+    parser.add_argument("--segments", type=int, default=8, help="並列スキャンの数")
+    parser.add_argument(
+        "--concurrency", type=int, default=8, help="並行してタイトルを生成する数"
+    )
+    parser.add_argument(
+        "--rate", type=float, default=2, help="1秒あたりの OpenAI へのリクエスト数"
+    )
+    parser.add_argument(
+        "--checkpoint",
+        default="backfill_titles.checkpoint.json",
+        help="チェックポイント",
+    )
+    parser.add_argument(
+        "--dry-run", action="store_true", help="タイトルを生成するが書き込まない"
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if not args.state_table:
+        parser.error("--state-table or EXTERNAL_API_STATE_TABLE_NAME is required")
+
+    # 複数の端末やコンテナで実行しても合計の速さが --rate を超えないようにする
+    limiter = RateLimiter("openai-backfill", args.state_table, rate=args.rate)
+    checkpoint = Checkpoint(args.checkpoint, args.segments)
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        with ThreadPoolExecutor(max_workers=args.segments) as segments:
+            futures = [
+                segments.submit(
+                    backfill_segment, args, segment, checkpoint, limiter, executor
+                )
+                for segment in range(args.segments)
+            ]
+            for future in futures:
+                future.result()
+    print(f"Backfill finished: {checkpoint.totals()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+画像の合成処理の時間を計測するスクリプト。
+
+元画像バケットの花と包装紙（またはローカルディレクトリのPNG画像）を使い、
+変更前の Image.paste による合成と common.compositing による合成を比較する。
+
+Usage:
+    python scripts/benchmark_compositing.py --bucket <ORIGINAL_IMAGE_BUCKET_NAME>
+    python scripts/benchmark_compositing.py --dir <PNG画像のディレクトリ>
+"""
+
+import argparse
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "lambda"))
+
+from common.asset_cache import AssetCache  # noqa: E402
+from common.wrapped_flower import (  # noqa: E402
+    FLOWER_PREFIX,
+    PALETTE_SIZE,
+    WRAPER_BACK_PREFIX,
+    WRAPER_FRONT_PREFIX,
+    WRAPER_OFFSET_Y,
+    compose_wrapped_flower,
+)
+from PIL import Image  # noqa: E402
+
+
+def load_sets_from_bucket(bucket_name, limit):
+    """元画像バケットから (花, 包装紙(前面), 包装紙(背面)) の組を返す"""
+    assets = AssetCache(max_image_bytes=1024 * 1024 * 1024)
+    flower_keys = assets.list_png_keys(bucket_name, FLOWER_PREFIX)[:limit]
+    front_keys = assets.list_png_keys(bucket_name, WRAPER_FRONT_PREFIX)
+    back_keys = assets.list_png_keys(bucket_name, WRAPER_BACK_PREFIX)
+
+    return [
+        (
+            assets.get_image(bucket_name, flower_key),
+            assets.get_image(bucket_name, random.choice(front_keys)),
+            assets.get_image(bucket_name, random.choice(back_keys)),
+        )
+        for flower_key in flower_keys
+    ]
+
+
+def load_sets_from_dir(directory, limit):
+    """ディレクトリ内のPNG画像を花と包装紙として組み合わせて返す"""
+    paths = sorted(Path(directory).glob("*.png"))
+    images = [Image.open(path).convert("RGBA") for path in paths]
+    return [
+        (image, random.choice(images), random.choice(images))
+        for image in images[:limit]
+    ]
+
+
+def legacy_compose(flower, wraper_front, wraper_back):
+    """変更前の diary_create.flower_wrap と同じ合成処理"""
+    palette_width, palette_height = PALETTE_SIZE
+    palette = Image.new("RGBA", (palette_width, palette_height), (0, 0, 0, 0))
+    palette.paste(
+        wraper_back,
+        ((palette_width - wraper_back.width) // 2, WRAPER_OFFSET_Y),
+        wraper_back,
+    )
+    palette.paste(flower, ((palette_width - flower.width) // 2, 0), flower)
+    palette.paste(
+        wraper_front,
+        ((palette_width - wraper_front.width) // 2, WRAPER_OFFSET_Y),
+        wraper_front,
+    )
+    return palette
+
+
+def benchmark(compose, image_sets, repeat):
+    """
+    全ての組を合成し、1回あたりの時間を集計する。
+
+    Returns:
+        tuple: (中央値[ms], 最大値[ms])
+    """
+    timings = []
+    for image_set in image_sets:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            compose(*image_set)
+            timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings), max(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--bucket", help="元画像のバケット名")
+    source.add_argument("--dir", help="PNG画像のディレクトリ")
+    parser.add_argument("--limit", type=int, default=20, help="計測する花の枚数")
+    parser.add_argument("--repeat", type=int, default=10, help="1組あたりの計測回数")
+    args = parser.parse_args()
+
+    if args.bucket:
+        image_sets = load_sets_from_bucket(args.bucket, args.limit)
+    else:
+        image_sets = load_sets_from_dir(args.dir, args.limit)
+    if not image_sets:
+        sys.exit("No images found.")
+
+    # 計測の前に結果が一致することを確認する
+    for image_set in image_sets:
+        if (
+            legacy_compose(*image_set).tobytes()
+            != compose_wrapped_flower(*image_set).tobytes()
+        ):
+            sys.exit("Composited images do not match the legacy output.")
+
+    print(f"{len(image_sets)} image sets x {args.repeat} runs")
+    print(f"{'method':<16}{'median ms':>12}{'max ms':>12}")
+    for name, compose in (
+        ("legacy_paste", legacy_compose),
+        ("composite", compose_wrapped_flower),
+    ):
+        median_ms, max_ms = benchmark(compose, image_sets, args.repeat)
+        print(f"{name:<16}{median_ms:>12.2f}{max_ms:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
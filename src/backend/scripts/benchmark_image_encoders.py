@@ -0,0 +1,110 @@
+"""
+画像エンコードプロファイルごとのエンコード時間と出力サイズを計測するスクリプト。
+
+元画像バケットの花と包装紙から diary_create と同じ方法で合成した画像、
+またはローカルディレクトリのPNG画像を対象に計測する。
+結果を見て、各Lambdaの IMAGE_ENCODER_PROFILE を決める。
+
+Usage:
+    python scripts/benchmark_image_encoders.py --bucket <ORIGINAL_IMAGE_BUCKET_NAME>
+    python scripts/benchmark_image_encoders.py --dir <PNG画像のディレクトリ>
+"""
+
+import argparse
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "lambda"))
+
+from common.asset_cache import AssetCache  # noqa: E402
+from common.image_encoder import ENCODER_PROFILES, encode_image  # noqa: E402
+from common.wrapped_flower import (  # noqa: E402
+    FLOWER_PREFIX,
+    WRAPER_BACK_PREFIX,
+    WRAPER_FRONT_PREFIX,
+    compose_wrapped_flower,
+)
+from PIL import Image  # noqa: E402
+
+
+def load_images_from_bucket(bucket_name, limit):
+    """元画像バケットの花をランダムな包装紙で包んだ画像を返す"""
+    assets = AssetCache(max_image_bytes=1024 * 1024 * 1024)
+    flower_keys = assets.list_png_keys(bucket_name, FLOWER_PREFIX)[:limit]
+    front_keys = assets.list_png_keys(bucket_name, WRAPER_FRONT_PREFIX)
+    back_keys = assets.list_png_keys(bucket_name, WRAPER_BACK_PREFIX)
+
+    return [
+        compose_wrapped_flower(
+            assets.get_image(bucket_name, flower_key),
+            assets.get_image(bucket_name, random.choice(front_keys)),
+            assets.get_image(bucket_name, random.choice(back_keys)),
+        )
+        for flower_key in flower_keys
+    ]
+
+
+def load_images_from_dir(directory, limit):
+    """ディレクトリ内のPNG画像をRGBAで返す"""
+    paths = sorted(Path(directory).glob("*.png"))[:limit]
+    return [Image.open(path).convert("RGBA") for path in paths]
+
+
+def benchmark(images, repeat):
+    """
+    各プロファイルで全画像をエンコードし、1枚あたりの時間とサイズを集計する。
+
+    Returns:
+        list: (プロファイル名, 中央値[ms], 最大値[ms], 平均サイズ[bytes]) のリスト
+    """
+    results = []
+    for profile in ENCODER_PROFILES:
+        timings = []
+        sizes = []
+        for image in images:
+            for _ in range(repeat):
+                start = time.perf_counter()
+                body, _ = encode_image(image, profile)
+                timings.append((time.perf_counter() - start) * 1000)
+            sizes.append(len(body))
+        results.append(
+            (profile, statistics.median(timings), max(timings), statistics.mean(sizes))
+        )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--bucket", help="元画像のバケット名")
+    source.add_argument("--dir", help="PNG画像のディレクトリ")
+    parser.add_argument("--limit", type=int, default=20, help="計測する画像の枚数")
+    parser.add_argument("--repeat", type=int, default=3, help="1枚あたりの計測回数")
+    args = parser.parse_args()
+
+    if args.bucket:
+        images = load_images_from_bucket(args.bucket, args.limit)
+    else:
+        images = load_images_from_dir(args.dir, args.limit)
+    if not images:
+        sys.exit("No images found.")
+
+    results = benchmark(images, args.repeat)
+    baseline = next(size for profile, _, _, size in results if profile == "png")
+
+    print(f"{len(images)} images x {args.repeat} runs")
+    print(
+        f"{'profile':<16}{'median ms':>12}{'max ms':>12}{'avg bytes':>12}{'vs png':>10}"
+    )
+    for profile, median_ms, max_ms, size in results:
+        print(
+            f"{profile:<16}{median_ms:>12.1f}{max_ms:>12.1f}"
+            f"{size:>12.0f}{size / baseline:>10.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+"""
+多数のコンテナから共有のレートリミッターを使った場合の速さとDynamoDBの負荷を計測するスクリプト。
+
+コンテナごとに RateLimiter を1つ作り、コンテナ内の複数のスレッドから同時にトークンを取得する。
+既定では moto のDynamoDBを使い、--endpoint-url を指定すると DynamoDB Local などに接続する。
+取得できたトークンの速さが設定した rate を超えないこと、block_size によって
+トークン1つあたりのDynamoDBの書き込みと競合がどれだけ減るかを確認する。
+
+Usage:
+    python scripts/benchmark_rate_limiter.py --containers 20 --threads 4 --rate 50
+    python scripts/benchmark_rate_limiter.py --endpoint-url http://localhost:8000
+"""
+
+import argparse
+import statistics
+import sys
+import threading
+import time
+from pathlib import Path
+
+import boto3
+from moto import mock_aws
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "lambda"))
+
+from common import rate_limiter  # noqa: E402
+from common.rate_limiter import RateLimiter, RateLimitExceededError  # noqa: E402
+
+TABLE_NAME = "benchmark-external-api-state"
+
+
+class CountingLimiter(RateLimiter):
+    """DynamoDBの読み書きと競合の回数を数えるレートリミッター"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.reads = 0
+        self.writes = 0
+        self.conflicts = 0
+
+    def _read(self):
+        self.reads += 1
+        return super()._read()
+
+    def _write(self, seen, bucket):
+        self.writes += 1
+        try:
+            super()._write(seen, bucket)
+        except Exception:
+            self.conflicts += 1
+            raise
+
+
+def create_table(resource):
+    resource.create_table(
+        TableName=TABLE_NAME,
+        KeySchema=[{"AttributeName": "name", "KeyType": "HASH"}],
+        AttributeDefinitions=[{"AttributeName": "name", "AttributeType": "S"}],
+        BillingMode="PAY_PER_REQUEST",
+    )
+    resource.Table(TABLE_NAME).wait_until_exists()
+
+
+def run(args, block_size, new_resource):
+    """1つの block_size で計測し、結果の辞書を返す"""
+    limiters = [
+        CountingLimiter(
+            f"benchmark-{block_size}",
+            TABLE_NAME,
+            rate=args.rate,
+            capacity=args.rate,
+            block_size=block_size,
+            dynamodb=new_resource(),
+        )
+        for _ in range(args.containers)
+    ]
+    latencies = []
+    rejected = []
+    lock = threading.Lock()
+    stop_at = time.monotonic() + args.duration
+
+    def worker(limiter):
+        while time.monotonic() < stop_at:
+            start = time.perf_counter()
+            try:
+                limiter.acquire(deadline=time.monotonic() + args.wait)
+            except RateLimitExceededError:
+                with lock:
+                    rejected.append(1)
+                continue
+            with lock:
+                latencies.append(time.perf_counter() - start)
+
+    threads = [
+        threading.Thread(target=worker, args=(limiter,))
+        for limiter in limiters
+        for _ in range(args.threads)
+    ]
+    start = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - start
+
+    granted = len(latencies)
+    latencies.sort()
+    return {
+        "granted_per_s": granted / elapsed,
+        # 最初に満タンのバケットから取り出せる分を除いた速さ
+        "steady_per_s": max(granted - args.rate, 0) / elapsed,
+        "rejected": len(rejected),
+        "writes_per_token": sum(limiter.writes for limiter in limiters)
+        / max(granted, 1),
+        "conflicts": sum(limiter.conflicts for limiter in limiters),
+        "p50_ms": statistics.median(latencies) * 1000 if latencies else 0.0,
+        "p99_ms": latencies[int(len(latencies) * 0.99)] * 1000 if latencies else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--containers", type=int, default=20, help="コンテナの数")
+    parser.add_argument(
+        "--threads", type=int, default=4, help="コンテナごとのスレッド数"
+    )
+    parser.add_argument("--rate", type=float, default=50, help="1秒あたりのトークン数")
+    parser.add_argument("--duration", type=float, default=5, help="計測時間（秒）")
+    parser.add_argument(
+        "--wait", type=float, default=1, help="トークンを待つ上限（秒）"
+    )
+    parser.add_argument(
+        "--block-sizes", default="1,4,16", help="比較する block_size（カンマ区切り）"
+    )
+    parser.add_argument("--endpoint-url", help="DynamoDB Local などのエンドポイント")
+    args = parser.parse_args()
+
+    # 計測中の RateLimited のメトリクスは出力しない
+    rate_limiter.put_metrics = lambda *a, **k: None
+
+    def new_resource():
+        return boto3.resource(
+            "dynamodb",
+            region_name="ap-northeast-1",
+            endpoint_url=args.endpoint_url,
+            aws_access_key_id="benchmark",
+            aws_secret_access_key="benchmark",
+        )
+
+    def benchmark():
+        create_table(new_resource())
+        print(
+            f"{args.containers} containers x {args.threads} threads, "
+            f"rate={args.rate}/s, {args.duration}s"
+        )
+        print(
+            f"{'block':>6}{'granted/s':>11}{'steady/s':>10}{'rejected':>10}"
+            f"{'writes/tok':>12}{'conflicts':>11}{'p50 ms':>9}{'p99 ms':>9}"
+        )
+        for block_size in map(int, args.block_sizes.split(",")):
+            result = run(args, block_size, new_resource)
+            print(
+                f"{block_size:>6}{result['granted_per_s']:>11.1f}"
+                f"{result['steady_per_s']:>10.1f}{result['rejected']:>10}"
+                f"{result['writes_per_token']:>12.2f}{result['conflicts']:>11}"
+                f"{result['p50_ms']:>9.1f}{result['p99_ms']:>9.1f}"
+            )
+
+    if args.endpoint_url:
+        benchmark()
+    else:
+        with mock_aws():
+            benchmark()
+
+
+if __name__ == "__main__":
+    main()
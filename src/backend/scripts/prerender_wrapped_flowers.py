@@ -0,0 +1,38 @@
+"""
+花と包装紙(front/back)の全組み合わせを事前レンダリングするスクリプト。
+
+元画像バケットに花や包装紙を追加したら再実行し、マニフェストを更新する。
+マニフェストに無い組み合わせは diary_create がその場で合成する。
+
+Usage:
+    python scripts/prerender_wrapped_flowers.py \\
+        --source-bucket <ORIGINAL_IMAGE_BUCKET_NAME> \\
+        --cache-bucket <WRAPPED_FLOWER_CACHE_BUCKET_NAME>
+"""
+
+import argparse
+import logging
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "lambda"))
+
+from common.wrapped_flower import prerender_wrapped_flowers  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--source-bucket", required=True, help="元画像のバケット名")
+    parser.add_argument(
+        "--cache-bucket", required=True, help="事前レンダリング画像の保存先バケット名"
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    variants = prerender_wrapped_flowers(args.source_bucket, args.cache_bucket)
+    total = sum(len(keys) for keys in variants.values())
+    print(f"Pre-rendered {total} images for {len(variants)} flowers.")
+
+
+if __name__ == "__main__":
+    main()
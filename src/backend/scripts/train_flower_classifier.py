@@ -0,0 +1,107 @@
+"""
+過去の日記と選ばれた花からローカルの花の分類器を学習するスクリプト。
+
+生成AIテーブルの花のIDと日記テーブルの内容を組にして学習し、モデルを JSON で保存する。
+既定の保存先は共通レイヤー（lambda/common/flower_classifier_model.json）で、
+デプロイすると FLOWER_SELECTION_MODE の local, fallback, shadow で使われる。
+--input に (content, flower_id) の JSON Lines を指定すると、AWS に接続せずに学習できる。
+
+Usage:
+    python scripts/train_flower_classifier.py \\
+        --generative-ai-table <GENERATIVE_AI_TABLE_NAME> \\
+        --diary-table <DIARY_TABLE_NAME>
+    python scripts/train_flower_classifier.py --input pairs.jsonl
+"""
+
+import argparse
+import json
+import logging
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "lambda"))
+
+from common import aws  # noqa: E402
+from common.flower_classifier import DEFAULT_MODEL_PATH, FlowerClassifier  # noqa: E402
+
+# BatchGetItem で1回に読み込める最大件数
+BATCH_GET_SIZE = 100
+
+
+def load_pairs_from_tables(generative_ai_table, diary_table):
+    """生成AIテーブルの花のIDと日記テーブルの内容を組にして返す"""
+    dynamodb = aws.resource("dynamodb")
+    table = dynamodb.Table(generative_ai_table)
+    flowers = {}
+    kwargs = {
+        "ProjectionExpression": "user_id, #date, flower_id",
+        "ExpressionAttributeNames": {"#date": "date"},
+    }
+    while True:
+        response = table.scan(**kwargs)
+        for item in response["Items"]:
+            if item.get("flower_id"):
+                flowers[(item["user_id"], item["date"])] = item["flower_id"]
+        if "LastEvaluatedKey" not in response:
+            break
+        kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+    keys = list(flowers)
+    pairs = []
+    for start in range(0, len(keys), BATCH_GET_SIZE):
+        request = {
+            diary_table: {
+                "Keys": [
+                    {"user_id": user_id, "date": date}
+                    for user_id, date in keys[start : start + BATCH_GET_SIZE]
+                ]
+            }
+        }
+        while request:
+            response = dynamodb.batch_get_item(RequestItems=request)
+            for item in response["Responses"].get(diary_table, []):
+                if item.get("content") and not item.get("is_deleted"):
+                    flower_id = flowers[(item["user_id"], item["date"])]
+                    pairs.append((item["content"], flower_id))
+            request = response.get("UnprocessedKeys")
+    return pairs
+
+
+def load_pairs_from_file(path):
+    """JSON Lines ファイルから (content, flower_id) の組を読み込む"""
+    with open(path, encoding="utf-8") as f:
+        return [
+            (record["content"], record["flower_id"])
+            for record in map(json.loads, f)
+            if record
+        ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--generative-ai-table", help="生成AIテーブル名")
+    parser.add_argument("--diary-table", help="日記テーブル名")
+    parser.add_argument("--input", help="(content, flower_id) の JSON Lines ファイル")
+    parser.add_argument(
+        "--output", default=str(DEFAULT_MODEL_PATH), help="モデルの保存先"
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.input:
+        pairs = load_pairs_from_file(args.input)
+    elif args.generative_ai_table and args.diary_table:
+        pairs = load_pairs_from_tables(args.generative_ai_table, args.diary_table)
+    else:
+        parser.error("--input or both --generative-ai-table and --diary-table")
+
+    classifier = FlowerClassifier.train(pairs)
+    classifier.save(args.output)
+    print(
+        f"Trained on {len(pairs)} diaries for {len(classifier.labels)} flowers: "
+        f"{args.output}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+import threading
+from unittest.mock import patch
+
+import pytest
+from common.adaptive_limiter import AdaptiveLimiter, ConcurrencyLimitExceededError
+
+
+@pytest.fixture(autouse=True)
+def mock_metrics():
+    with patch("common.adaptive_limiter.put_metrics") as mock_metrics:
+        yield mock_metrics
+
+
+def test_additive_increase_and_multiplicative_decrease(mock_metrics):
+    """成功で上限を少しずつ増やし、失敗で半分にすることのテスト"""
+    limiter = AdaptiveLimiter("dify", latency_target=10, initial_limit=4, max_limit=5)
+    for _ in range(4):
+        with limiter.slot():
+            pass
+    assert limiter.limit == pytest.approx(5.0, abs=0.1)
+
+    with pytest.raises(RuntimeError):
+        with limiter.slot():
+            raise RuntimeError("Dify is down")
+    assert int(limiter.limit) == 2
+    mock_metrics.assert_called_once_with(
+        {"ConcurrencyLimit": 2}, dimensions={"Client": "dify"}, unit="None"
+    )
+    assert limiter.in_flight == 0
+
+
+def test_slow_response_decreases_limit():
+    """目標の時間を超えた応答は失敗として上限を減らすことのテスト"""
+    limiter = AdaptiveLimiter("dify", latency_target=-1, initial_limit=4)
+    with limiter.slot():
+        pass
+    assert limiter.limit == 2
+
+
+def test_rejects_when_no_slot_is_free(mock_metrics):
+    """上限に空きがない場合は待ち時間の上限後に例外を送出することのテスト"""
+    limiter = AdaptiveLimiter(
+        "dify", latency_target=10, initial_limit=1, acquire_timeout=0.05
+    )
+    entered = threading.Event()
+    release = threading.Event()
+
+    def hold():
+        with limiter.slot():
+            entered.set()
+            release.wait()
+
+    thread = threading.Thread(target=hold)
+    thread.start()
+    entered.wait()
+    try:
+        with pytest.raises(ConcurrencyLimitExceededError):
+            with limiter.slot():
+                pass
+    finally:
+        release.set()
+        thread.join()
+    mock_metrics.assert_called_once_with(
+        {"ConcurrencyLimitRejected": 1}, dimensions={"Client": "dify"}
+    )
@@ -0,0 +1,78 @@
+from io import BytesIO
+from unittest.mock import MagicMock
+
+import pytest
+from common.asset_cache import AssetCache
+from PIL import Image
+
+
+def png_body(size=(10, 10), color=(255, 0, 0, 255)):
+    """テスト用のPNG画像をS3レスポンスのBodyとして返す"""
+    buffer = BytesIO()
+    Image.new("RGBA", size, color).save(buffer, format="PNG")
+    buffer.seek(0)
+    return buffer
+
+
+@pytest.fixture
+def s3_client():
+    client = MagicMock()
+    client.list_objects_v2.return_value = {
+        "Contents": [{"Key": "wrapers_front/a.png"}, {"Key": "wrapers_front/b.txt"}]
+    }
+    client.get_object.side_effect = lambda Bucket, Key: {"Body": png_body()}
+    return client
+
+
+def test_load_random_image_uses_cache(s3_client):
+    """2回目以降はS3を呼び出さずにキャッシュから返すことのテスト"""
+    cache = AssetCache(s3_client=s3_client, listing_ttl=300)
+
+    first = cache.load_random_image("test-bucket", "wrapers_front/")
+    second = cache.load_random_image("test-bucket", "wrapers_front/")
+
+    assert first is second
+    assert first.mode == "RGBA"
+    # 不透明な領域はデコード時に計算して画像と一緒に保持する
+    assert first.info["alpha_bbox"] == (0, 0, 10, 10)
+    s3_client.list_objects_v2.assert_called_once_with(
+        Bucket="test-bucket", Prefix="wrapers_front/"
+    )
+    s3_client.get_object.assert_called_once_with(
+        Bucket="test-bucket", Key="wrapers_front/a.png"
+    )
+
+
+def test_listing_expires_after_ttl(s3_client):
+    """TTLが切れたキー一覧は再取得されることのテスト"""
+    cache = AssetCache(s3_client=s3_client, listing_ttl=0)
+
+    cache.list_png_keys("test-bucket", "wrapers_front/")
+    cache.list_png_keys("test-bucket", "wrapers_front/")
+
+    assert s3_client.list_objects_v2.call_count == 2
+
+
+def test_image_cache_evicts_least_recently_used(s3_client):
+    """メモリ上限を超えると最も古い画像から破棄されることのテスト"""
+    # 10x10のRGBA画像は400バイトなので、2枚分だけ保持できる
+    cache = AssetCache(s3_client=s3_client, max_image_bytes=800)
+
+    cache.get_image("test-bucket", "a.png")
+    cache.get_image("test-bucket", "b.png")
+    cache.get_image("test-bucket", "a.png")
+    cache.get_image("test-bucket", "c.png")
+    cache.get_image("test-bucket", "a.png")
+    cache.get_image("test-bucket", "b.png")
+
+    keys = [call.kwargs["Key"] for call in s3_client.get_object.call_args_list]
+    assert keys == ["a.png", "b.png", "c.png", "b.png"]
+
+
+def test_list_png_keys_without_png(s3_client):
+    """PNG画像が存在しない場合のテスト"""
+    s3_client.list_objects_v2.return_value = {"Contents": [{"Key": "a.txt"}]}
+    cache = AssetCache(s3_client=s3_client)
+
+    with pytest.raises(ValueError, match="No PNG images found"):
+        cache.list_png_keys("test-bucket", "wrapers_front/")
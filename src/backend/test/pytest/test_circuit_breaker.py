@@ -0,0 +1,149 @@
+from unittest.mock import MagicMock, patch
+
+import boto3
+import pytest
+from common.circuit_breaker import (
+    CLOSED,
+    HALF_OPEN,
+    OPEN,
+    CircuitBreaker,
+    CircuitOpenError,
+    is_degradation,
+)
+from moto import mock_aws
+
+
+@pytest.fixture
+def dynamodb():
+    """moto の外部APIの状態テーブルを返す"""
+    with mock_aws():
+        resource = boto3.resource("dynamodb", region_name="ap-northeast-1")
+        resource.create_table(
+            TableName="external-api-state",
+            KeySchema=[{"AttributeName": "name", "KeyType": "HASH"}],
+            AttributeDefinitions=[{"AttributeName": "name", "AttributeType": "S"}],
+            BillingMode="PAY_PER_REQUEST",
+        )
+        yield resource
+
+
+@pytest.fixture(autouse=True)
+def mock_metrics():
+    with patch("common.circuit_breaker.put_metrics") as mock_metrics:
+        yield mock_metrics
+
+
+def make_breaker(dynamodb, cooldown_seconds=60):
+    return CircuitBreaker(
+        "dify",
+        "external-api-state",
+        failure_threshold=2,
+        cooldown_seconds=cooldown_seconds,
+        refresh_seconds=0,
+        dynamodb=dynamodb,
+    )
+
+
+def fail(breaker):
+    with pytest.raises(RuntimeError):
+        with breaker.guard():
+            raise RuntimeError("Dify is down")
+
+
+def transitions(mock_metrics):
+    return [
+        call.kwargs["dimensions"]["State"]
+        for call in mock_metrics.call_args_list
+        if "CircuitStateTransition" in call.args[0]
+    ]
+
+
+def test_opens_after_consecutive_failures(dynamodb, mock_metrics):
+    """連続失敗回数が閾値に達すると回路を開き、他のコンテナでも呼び出しを止めることのテスト"""
+    breaker = make_breaker(dynamodb)
+    fail(breaker)
+    with breaker.guard():
+        pass
+    # 成功すると連続失敗回数は0に戻る
+    fail(breaker)
+    assert breaker.state == CLOSED
+
+    fail(breaker)
+    assert breaker.state == OPEN
+    assert transitions(mock_metrics) == [OPEN]
+
+    other_container = make_breaker(dynamodb)
+    with pytest.raises(CircuitOpenError):
+        with other_container.guard():
+            pytest.fail("must not be called")
+
+
+def test_half_open_lets_one_trial_through(dynamodb, mock_metrics):
+    """待ち時間の経過後は1つのコンテナだけが試しに呼び出し、成功すると閉じることのテスト"""
+    breaker = make_breaker(dynamodb)
+    fail(breaker)
+    fail(breaker)
+    # 回路を開いてから待ち時間が経過したことにする
+    dynamodb.Table("external-api-state").update_item(
+        Key={"name": "circuit#dify"},
+        UpdateExpression="SET changed_at = :t",
+        ExpressionAttributeValues={":t": 1},
+    )
+
+    assert breaker.allow()
+    assert breaker.state == HALF_OPEN
+    assert not make_breaker(dynamodb).allow()
+
+    breaker.record_success()
+    assert make_breaker(dynamodb).state == CLOSED
+    assert transitions(mock_metrics) == [OPEN, HALF_OPEN, CLOSED]
+
+
+def test_failed_trial_reopens(dynamodb, mock_metrics):
+    """試しの呼び出しが失敗すると再び開くことのテスト"""
+    breaker = make_breaker(dynamodb, cooldown_seconds=0)
+    fail(breaker)
+    fail(breaker)
+
+    fail(breaker)
+
+    assert breaker.state == OPEN
+    assert transitions(mock_metrics) == [OPEN, HALF_OPEN, OPEN]
+
+
+def test_client_errors_do_not_open(dynamodb):
+    """リクエストの誤り（4xx）は失敗として数えないことのテスト"""
+    breaker = make_breaker(dynamodb)
+    error = RuntimeError("bad request")
+    error.response = MagicMock(status_code=400)
+    for _ in range(3):
+        with pytest.raises(RuntimeError):
+            with breaker.guard():
+                raise error
+
+    assert breaker.state == CLOSED
+    assert not is_degradation(error)
+    error.response.status_code = 429
+    assert is_degradation(error)
+
+
+def test_state_errors_do_not_block_calls():
+    """状態を読み書きできない場合も呼び出しを止めないことのテスト"""
+    dynamodb = MagicMock()
+    dynamodb.Table.return_value.get_item.side_effect = Exception("throttled")
+    dynamodb.Table.return_value.update_item.side_effect = Exception("throttled")
+    breaker = CircuitBreaker(
+        "dify", "external-api-state", failure_threshold=1, dynamodb=dynamodb
+    )
+
+    fail(breaker)
+    with breaker.guard():
+        pass
+
+
+def test_disabled_without_table():
+    """テーブル名が未設定の場合は何もしないことのテスト"""
+    breaker = CircuitBreaker("dify", None)
+    assert not breaker.enabled
+    with breaker.guard():
+        pass
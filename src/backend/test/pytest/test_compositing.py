@@ -0,0 +1,116 @@
+import random
+
+import pytest
+from common.compositing import alpha_bbox, centered_x, composite
+from common.wrapped_flower import compose_wrapped_flower
+from PIL import Image
+
+
+def random_image(size, seed):
+    """半透明の縁と透明な余白を持つランダムなRGBA画像を返す"""
+    rng = random.Random(seed)
+    width, height = size
+    image = Image.new("RGBA", size, (0, 0, 0, 0))
+    inner = Image.frombytes(
+        "RGBA",
+        (width // 2, height // 2),
+        bytes(rng.randrange(256) for _ in range(width // 2 * height // 2 * 4)),
+    )
+    image.paste(inner, (width // 4, height // 4))
+    return image
+
+
+def legacy_paste(size, layers, base=None):
+    """変更前の各Lambdaと同じ方法（Image.paste）で合成する"""
+    palette = base if base is not None else Image.new("RGBA", size, (0, 0, 0, 0))
+    for image, position in layers:
+        palette.paste(image, position, image)
+    return palette
+
+
+@pytest.fixture
+def images():
+    return {
+        "flower": random_image((400, 500), 1),
+        "front": random_image((500, 600), 2),
+        "back": random_image((520, 600), 3),
+        "vase": random_image((300, 640), 4),
+    }
+
+
+def test_wrapped_flower_matches_legacy(images):
+    """包装済みの花の合成結果が変更前と一致することのテスト"""
+    expected = legacy_paste(
+        (700, 700),
+        [
+            (images["back"], ((700 - 520) // 2, 75)),
+            (images["flower"], ((700 - 400) // 2, 0)),
+            (images["front"], ((700 - 500) // 2, 75)),
+        ],
+    )
+
+    result = compose_wrapped_flower(images["flower"], images["front"], images["back"])
+
+    assert result.tobytes() == expected.tobytes()
+
+
+def test_flower_vase_matches_legacy(images):
+    """花瓶の合成結果（キャンバスからはみ出すレイヤーを含む）が変更前と一致することのテスト"""
+    layers = [
+        (images["flower"], (centered_x(700, images["flower"]), 0)),
+        (images["vase"], (centered_x(700, images["vase"]), 120)),
+    ]
+
+    result = composite(layers, size=(700, 700))
+
+    assert result.tobytes() == legacy_paste((700, 700), layers).tobytes()
+
+
+def test_bouquet_matches_legacy_without_mutating_base(images):
+    """土台の画像に重ねた結果が変更前と一致し、土台の画像を変更しないことのテスト"""
+    wrapping = random_image((700, 700), 5)
+    original = wrapping.tobytes()
+    layers = [
+        (images["flower"], (x, y)) for x, y in [(400, 180), (-50, 70), (650, 600)]
+    ]
+
+    result = composite(layers, base=wrapping)
+
+    assert wrapping.tobytes() == original
+    assert (
+        result.tobytes() == legacy_paste(None, layers, base=wrapping.copy()).tobytes()
+    )
+
+
+def test_layers_outside_canvas_are_skipped(images):
+    """キャンバスと重ならないレイヤーは無視されることのテスト"""
+    result = composite(
+        [(images["flower"], (700, 0)), (images["flower"], (0, -500))], size=(700, 700)
+    )
+
+    assert result.getbbox() is None
+
+
+def test_alpha_bbox_is_cached_on_image(images):
+    """不透明な領域の外接矩形を一度だけ計算して画像に保持することのテスト"""
+    flower = images["flower"]
+
+    assert alpha_bbox(flower) == (100, 125, 300, 375)
+    flower.paste((0, 0, 0, 0), (0, 0, 400, 500))
+    # 計算済みの値を返す（キャッシュした画像は変更しない前提）
+    assert alpha_bbox(flower) == (100, 125, 300, 375)
+    assert alpha_bbox(Image.new("RGBA", (10, 10))) is None
+
+
+def test_cropped_layers_match_legacy(images):
+    """不透明な領域がキャンバスの端で切れる場合も変更前と一致することのテスト"""
+    layers = [
+        (images["front"], (-200, -200)),
+        (images["flower"], (450, 300)),
+        (Image.new("RGBA", (700, 700)), (0, 0)),
+    ]
+
+    result = composite(layers, size=(700, 700))
+
+    assert result.tobytes() == legacy_paste((700, 700), layers).tobytes()
+    assert "alpha_bbox" not in composite(layers, base=result).info
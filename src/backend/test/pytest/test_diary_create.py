@@ -1,15 +1,21 @@
 import base64
+import hashlib
 import json
 import os
 from unittest.mock import MagicMock, patch
 
 import pytest
 from diary_create.diary_create import (
+    create_diary_concurrent,
+    create_diary_idempotent,
     flower_wrap,
+    flower_wrap_url,
     invoke_flower_lambda,
     save_to_dynamodb,
+    select_flower_id,
     validate_input,
 )
+from flower_select.flower_select import lambda_handler as flower_select_handler
 from PIL import Image
 
 
@@ -29,6 +35,15 @@ def test_validate_input():
     ):
         validate_input({"date": "15-03-2024", "content": "今日は散歩をしました。"})
 
+    with pytest.raises(ValueError, match="Error: Invalid image_delivery."):
+        validate_input(
+            {
+                "date": "2024-03-15",
+                "content": "今日は散歩をしました。",
+                "image_delivery": "binary",
+            }
+        )
+
 
 @patch("boto3.resource")
 def test_save_to_dynamodb(mock_boto_resource):
@@ -118,3 +133,240 @@ def test_flower_wrap_success(mock_load_random_image, mock_env):
     decoded = base64.b64decode(result)
     assert isinstance(decoded, bytes)
     assert len(decoded) > 0
+
+
+@patch("diary_create.diary_create.load_random_image_from_s3")
+@patch("diary_create.diary_create.load_wrapped_flower_variant")
+def test_flower_wrap_uses_pre_rendered_variant(
+    mock_load_variant, mock_load_random_image, mock_env
+):
+    """
+    事前レンダリング済みの画像がある場合は合成しないことのテスト
+    """
+    mock_load_variant.return_value = b"pre-rendered-png"
+
+    result = flower_wrap("sample_flower_id")
+
+    assert base64.b64decode(result) == b"pre-rendered-png"
+    mock_load_variant.assert_called_once_with("sample_flower_id")
+    mock_load_random_image.assert_not_called()
+
+
+@patch("diary_create.diary_create.flower_wrap", return_value="encoded-image")
+@patch("diary_create.diary_create.send_message_to_sqs")
+@patch("diary_create.diary_create.invoke_flower_lambda", return_value="lily1")
+@patch("diary_create.diary_create.load_wrapers")
+@patch("diary_create.diary_create.save_to_dynamodb")
+def test_create_diary_concurrent(
+    mock_save, mock_load_wrapers, mock_invoke, mock_send, mock_flower_wrap, mock_env
+):
+    """
+    並行実行モードで各処理が呼び出され、先読みした包装紙が使われることのテスト
+    """
+    wrapers = (Image.new("RGBA", (1, 1)), Image.new("RGBA", (1, 1)))
+    mock_load_wrapers.return_value = wrapers
+
+    flower_id, flower_image = create_diary_concurrent(
+        "test-user-id", "2024-03-15", "今日は散歩をしました。"
+    )
+
+    assert (flower_id, flower_image) == ("lily1", "encoded-image")
+    mock_save.assert_called_once_with(
+        "test-user-id", "2024-03-15", "今日は散歩をしました。"
+    )
+    mock_load_wrapers.assert_called_once_with("test-bucket")
+    mock_send.assert_called_once_with("test-user-id", "2024-03-15", "lily1")
+    wrapers_future = mock_flower_wrap.call_args.kwargs["wrapers"]
+    assert wrapers_future.result() == wrapers
+
+
+@patch("diary_create.diary_create.flower_wrap")
+@patch("diary_create.diary_create.send_message_to_sqs")
+@patch("diary_create.diary_create.invoke_flower_lambda", return_value="lily1")
+@patch("diary_create.diary_create.load_wrapers")
+@patch("diary_create.diary_create.save_to_dynamodb")
+def test_create_diary_concurrent_save_error(
+    mock_save, mock_load_wrapers, mock_invoke, mock_send, mock_flower_wrap, mock_env
+):
+    """
+    並行実行モードでDynamoDBへの保存が失敗した場合に後続処理を行わないことのテスト
+    """
+    mock_save.side_effect = RuntimeError("DynamoDB error")
+
+    with pytest.raises(RuntimeError, match="DynamoDB error"):
+        create_diary_concurrent("test-user-id", "2024-03-15", "今日は散歩をしました。")
+
+    mock_invoke.assert_called_once()
+    mock_send.assert_not_called()
+    mock_flower_wrap.assert_not_called()
+
+
+@patch("diary_create.diary_create.aws.client")
+@patch("diary_create.diary_create.find_wrapped_flower_variant_key", return_value=None)
+@patch(
+    "diary_create.diary_create.compose_flower_image",
+    return_value=(b"png-bytes", "image/png"),
+)
+def test_flower_wrap_url_stores_content_addressed_image(
+    mock_compose, mock_find_variant, mock_client, mock_env
+):
+    """
+    合成した画像を内容のハッシュをキーとして保存し、署名付きURLを返すことのテスト
+    """
+    os.environ["FLOWER_BUKCET_NAME"] = "flower-bucket"
+    s3_mock = mock_client.return_value
+    s3_mock.generate_presigned_url.return_value = "https://example.com/signed"
+
+    url = flower_wrap_url("sample_flower_id")
+
+    assert url == "https://example.com/signed"
+    expected_key = f"wrapped_flowers/{hashlib.sha256(b'png-bytes').hexdigest()}.png"
+    s3_mock.put_object.assert_called_once_with(
+        Bucket="flower-bucket",
+        Key=expected_key,
+        Body=b"png-bytes",
+        ContentType="image/png",
+    )
+    s3_mock.generate_presigned_url.assert_called_once_with(
+        "get_object",
+        Params={"Bucket": "flower-bucket", "Key": expected_key},
+        ExpiresIn=300,
+    )
+
+
+@patch("diary_create.diary_create.aws.client")
+@patch(
+    "diary_create.diary_create.find_wrapped_flower_variant_key",
+    return_value="wrapped_flowers/sample_flower_id/front1__back1.png",
+)
+@patch("diary_create.diary_create.compose_flower_image")
+def test_flower_wrap_url_uses_pre_rendered_variant(
+    mock_compose, mock_find_variant, mock_client, mock_env
+):
+    """
+    事前レンダリング済みの画像がある場合は保存せずにそのURLを返すことのテスト
+    """
+    s3_mock = mock_client.return_value
+
+    flower_wrap_url("sample_flower_id")
+
+    mock_compose.assert_not_called()
+    s3_mock.put_object.assert_not_called()
+    params = s3_mock.generate_presigned_url.call_args.kwargs["Params"]
+    assert params["Key"] == "wrapped_flowers/sample_flower_id/front1__back1.png"
+
+
+@pytest.mark.parametrize("mode", ["invoke", "in_process"])
+def test_select_flower_id_modes(mode, monkeypatch):
+    """
+    Lambda呼び出しとプロセス内呼び出しのどちらでも同じ花の ID が得られることのテスト
+    """
+    monkeypatch.setenv("FLOWER_SELECT_MODE", mode)
+    event = {
+        "user_id": "test-user-id",
+        "date": "2024-03-15",
+        "diary_content": "今日は散歩をしました。",
+    }
+
+    def invoke(FunctionName, InvocationType, Payload):
+        # flower_select Lambda を実際のハンドラーで代用する
+        response = flower_select_handler(json.loads(Payload), None)
+        return {"Payload": MagicMock(read=lambda: json.dumps(response).encode())}
+
+    with patch(
+        "common.flower_selection.select_and_save_flower", return_value="lily1"
+    ) as mock_select, patch(
+        "flower_select.flower_select.select_and_save_flower", mock_select
+    ), patch("diary_create.diary_create.select_and_save_flower", mock_select), patch(
+        "boto3.client"
+    ) as mock_boto_client:
+        mock_boto_client.return_value.invoke.side_effect = invoke
+
+        flower_id = select_flower_id(
+            event["user_id"], event["date"], event["diary_content"]
+        )
+
+    assert flower_id == "lily1"
+    mock_select.assert_called_once_with(
+        event["user_id"], event["date"], event["diary_content"]
+    )
+    assert mock_boto_client.return_value.invoke.called == (mode == "invoke")
+
+
+@patch("diary_create.diary_create.diary_matches", return_value=True)
+@patch("diary_create.diary_create.create_diary", return_value=("lily1", "image"))
+@patch("diary_create.diary_create.idempotency_store")
+def test_create_diary_idempotent(mock_store, mock_create, mock_matches):
+    """
+    初回は日記を作成して結果を保存し、再送時は保存済みの結果を返すことのテスト
+    """
+    args = ("test-user-id", "2024-03-15", "今日は散歩をしました。", "inline")
+
+    mock_store.begin.return_value = None
+    assert create_diary_idempotent(*args, "key-1", "fp-1") == ("lily1", "image")
+    mock_store.complete.assert_called_once_with(
+        "test-user-id",
+        "2024-03-15",
+        "key-1",
+        {"flower_id": "lily1", "flower_image": "image"},
+    )
+
+    mock_store.begin.return_value = {"flower_id": "lily1", "flower_image": "image"}
+    assert create_diary_idempotent(*args, "key-1", "fp-1") == ("lily1", "image")
+    mock_create.assert_called_once()
+
+    # 失敗した場合はレコードを削除して再実行できるようにする
+    mock_store.begin.return_value = None
+    mock_create.side_effect = RuntimeError("Dify error")
+    with pytest.raises(RuntimeError):
+        create_diary_idempotent(*args, "key-2", "fp-2")
+    mock_store.release.assert_called_once_with("test-user-id", "2024-03-15", "key-2")
+
+
+@patch("diary_create.diary_create.diary_matches", return_value=True)
+@patch("diary_create.diary_create.render_flower_image", return_value="new-url")
+@patch("diary_create.diary_create.create_diary")
+@patch("diary_create.diary_create.idempotency_store")
+def test_create_diary_idempotent_rerenders_expired_url(
+    mock_store, mock_create, mock_render, mock_matches
+):
+    """
+    保存済みの署名付きURLが期限切れの場合は花を選び直さずに画像だけ生成し直すことのテスト
+    """
+    mock_store.begin.return_value = {
+        "flower_id": "lily1",
+        "flower_image_url": "old-url",
+        "flower_image_url_expires_at": 0,
+    }
+
+    result = create_diary_idempotent(
+        "test-user-id", "2024-03-15", "今日は散歩をしました。", "url", "key-1", "fp-1"
+    )
+
+    assert result == ("lily1", "new-url")
+    mock_create.assert_not_called()
+    mock_render.assert_called_once_with("lily1", "url")
+
+
+@patch("diary_create.diary_create.create_diary", return_value=("rose1", "image"))
+@patch("diary_create.diary_create.idempotency_store")
+@patch("boto3.resource")
+def test_create_diary_idempotent_after_delete(
+    mock_boto_resource, mock_store, mock_create, mock_env
+):
+    """
+    日記が削除・編集された後の同じ内容の投稿は、保存済みの結果を返さずに作成し直すことのテスト
+    """
+    table = mock_boto_resource.return_value.Table.return_value
+    args = ("test-user-id", "2024-03-15", "今日は散歩をしました。", "inline")
+
+    for item in [None, {"content": "編集後の日記", "is_deleted": False}]:
+        table.get_item.return_value = {"Item": item} if item else {}
+        mock_store.begin.side_effect = [
+            {"flower_id": "lily1", "flower_image": "x"},
+            None,
+        ]
+        assert create_diary_idempotent(*args, "key-1", "fp-1") == ("rose1", "image")
+        mock_store.invalidate.assert_called_with("test-user-id", "2024-03-15", "key-1")
+
+    assert mock_create.call_count == 2
@@ -0,0 +1,246 @@
+import json
+from unittest.mock import patch
+
+import pytest
+from diary_import.diary_import import (
+    batch_save_to_dynamodb,
+    find_existing_dates,
+    get_import_status,
+    import_diaries,
+    lambda_handler,
+    send_import_messages,
+    validate_entries,
+)
+
+
+def make_entries(count):
+    """テスト用の日記のリストを作成"""
+    return [
+        {"date": f"2024-01-{day:02d}", "content": f"日記{day}"}
+        for day in range(1, count + 1)
+    ]
+
+
+@pytest.fixture
+def mock_env(monkeypatch):
+    monkeypatch.setenv("TABLE_NAME", "test-table")
+    monkeypatch.setenv("DIARY_IMPORT_QUEUE_URL", "test-queue-url")
+    monkeypatch.setenv("IMPORT_JOB_TABLE_NAME", "test-job-table")
+
+
+def test_validate_entries():
+    """validate_entries関数の正常系と異常系のテスト"""
+    assert validate_entries({"entries": make_entries(2)}) == make_entries(2)
+
+    with pytest.raises(ValueError, match="entries"):
+        validate_entries({"entries": []})
+    with pytest.raises(ValueError, match="Invalid date format"):
+        validate_entries({"entries": [{"date": "01-01-2024", "content": "a"}]})
+    with pytest.raises(ValueError, match="Duplicate date"):
+        validate_entries({"entries": make_entries(1) * 2})
+
+
+@patch("diary_import.diary_import.time.sleep")
+@patch("boto3.resource")
+def test_batch_save_to_dynamodb(mock_boto_resource, mock_sleep, mock_env):
+    """25件ずつ書き込み、未処理のアイテムを再送することのテスト"""
+    dynamodb = mock_boto_resource.return_value
+    entries = make_entries(30)
+
+    def batch_write_item(RequestItems):
+        items = RequestItems["test-table"]
+        # 最初のチャンクの1回目だけ先頭のアイテムを未処理として返す
+        if len(items) == 25 and dynamodb.batch_write_item.call_count == 1:
+            return {"UnprocessedItems": {"test-table": items[:1]}}
+        return {"UnprocessedItems": {}}
+
+    dynamodb.batch_write_item.side_effect = batch_write_item
+
+    saved, failures = batch_save_to_dynamodb("test-user-id", entries)
+
+    assert saved == entries
+    assert failures == {}
+    sizes = [
+        len(call.kwargs["RequestItems"]["test-table"])
+        for call in dynamodb.batch_write_item.call_args_list
+    ]
+    assert sizes == [25, 1, 5]
+
+
+@patch("boto3.client")
+def test_send_import_messages(mock_boto_client, mock_env):
+    """10件ずつ送信し、失敗したメッセージを返すことのテスト"""
+    sqs = mock_boto_client.return_value
+
+    def send_message_batch(QueueUrl, Entries):
+        if Entries[0]["Id"] == "2024_01_01":
+            return {
+                "Failed": [{"Id": "2024_01_03", "Code": "Internal", "Message": "x"}]
+            }
+        return {}
+
+    sqs.send_message_batch.side_effect = send_message_batch
+
+    failures = send_import_messages("test-user-id", "import-1", make_entries(12))
+
+    assert failures == {"2024-01-03": "x"}
+    sizes = sorted(
+        len(call.kwargs["Entries"]) for call in sqs.send_message_batch.call_args_list
+    )
+    assert sizes == [2, 10]
+    first = next(
+        call.kwargs["Entries"]
+        for call in sqs.send_message_batch.call_args_list
+        if len(call.kwargs["Entries"]) == 10
+    )
+    assert json.loads(first[0]["MessageBody"]) == {
+        "user_id": "test-user-id",
+        "import_id": "import-1",
+        "date": "2024-01-01",
+    }
+
+
+@patch("diary_import.diary_import.time.sleep")
+@patch("boto3.resource")
+def test_find_existing_dates(mock_boto_resource, mock_sleep, mock_env):
+    """100件ずつ読み込み、削除されていない日記の日付を返すことのテスト"""
+    dynamodb = mock_boto_resource.return_value
+    dates = ["2024-01-01", "2024-01-02"]
+    dates += [
+        f"2025-{month:02d}-{day:02d}" for month in range(1, 13) for day in range(1, 9)
+    ]
+    dates += [f"2026-{month:02d}-{day:02d}" for month in range(1, 13) for day in (1, 7)]
+
+    def batch_get_item(RequestItems):
+        keys = RequestItems["test-table"]["Keys"]
+        # 最初のチャンクの1回目だけ先頭のキーを未処理として返す
+        if dynamodb.batch_get_item.call_count == 1:
+            return {
+                "Responses": {"test-table": [{"date": "2024-01-02"}]},
+                "UnprocessedKeys": {
+                    "test-table": {**RequestItems["test-table"], "Keys": keys[:1]}
+                },
+            }
+        responses = [
+            {"date": key["date"], "is_deleted": key["date"] == "2026-12-07"}
+            for key in keys
+            if key["date"] in ("2024-01-01", "2026-12-07")
+        ]
+        return {"Responses": {"test-table": responses}, "UnprocessedKeys": {}}
+
+    dynamodb.batch_get_item.side_effect = batch_get_item
+
+    existing = find_existing_dates("test-user-id", dates)
+
+    assert existing == {"2024-01-01", "2024-01-02"}
+    sizes = [
+        len(call.kwargs["RequestItems"]["test-table"]["Keys"])
+        for call in dynamodb.batch_get_item.call_args_list
+    ]
+    assert sizes == [100, 1, 22]
+
+
+@patch("diary_import.diary_import.create_import_job")
+@patch("diary_import.diary_import.send_import_messages")
+@patch("diary_import.diary_import.batch_save_to_dynamodb")
+@patch("diary_import.diary_import.find_existing_dates")
+def test_import_diaries(mock_existing, mock_save, mock_send, mock_create_job):
+    """既存の日記を上書きせず、保存に成功した日記だけをワーカーに送信することのテスト"""
+    entries = make_entries(4)
+    mock_existing.return_value = {"2024-01-04"}
+    mock_save.return_value = (entries[:2], {"2024-01-03": "error"})
+    mock_send.return_value = {"2024-01-02": "x"}
+
+    result = import_diaries("test-user-id", entries)
+
+    mock_save.assert_called_once_with("test-user-id", entries[:3])
+    mock_send.assert_called_once_with("test-user-id", result["import_id"], entries[:2])
+    failed = [
+        {"date": "2024-01-02", "stage": "flower_queue", "error": "x"},
+        {"date": "2024-01-03", "stage": "save", "error": "error"},
+        {"date": "2024-01-04", "stage": "exists", "error": "Diary already exists"},
+    ]
+    assert result == {
+        "import_id": result["import_id"],
+        "total": 4,
+        "queued": 1,
+        "failed": failed,
+    }
+    mock_create_job.assert_called_once_with(
+        "test-user-id", result["import_id"], 4, 1, failed
+    )
+
+
+@patch("boto3.resource")
+def test_get_import_status(mock_boto_resource, mock_env):
+    """ワーカーが記録した日付から進捗を返すことのテスト"""
+    table = mock_boto_resource.return_value.Table.return_value
+    table.get_item.return_value = {
+        "Item": {
+            "total": 4,
+            "queued": 3,
+            "failed": [{"date": "2024-01-04", "stage": "save", "error": "e"}],
+            "done_dates": {"2024-01-01"},
+            "failed_dates": {"2024-01-02"},
+        }
+    }
+
+    status = get_import_status("test-user-id", "import-1")
+
+    assert status == {
+        "import_id": "import-1",
+        "status": "IN_PROGRESS",
+        "total": 4,
+        "queued": 3,
+        "succeeded": 1,
+        "failed": [
+            {
+                "date": "2024-01-02",
+                "stage": "flower_select",
+                "error": "Flower selection failed",
+            },
+            {"date": "2024-01-04", "stage": "save", "error": "e"},
+        ],
+    }
+
+    table.get_item.return_value["Item"]["done_dates"].add("2024-01-03")
+    assert get_import_status("test-user-id", "import-1")["status"] == "COMPLETED"
+
+    table.get_item.return_value = {}
+    assert get_import_status("test-user-id", "import-1") is None
+
+
+@patch("diary_import.diary_import.import_diaries")
+def test_lambda_handler_accepts_import(mock_import):
+    """インポートを受け付けて 202 を返すことのテスト"""
+    mock_import.return_value = {"import_id": "import-1"}
+    event = {
+        "httpMethod": "POST",
+        "body": json.dumps({"entries": make_entries(3)}),
+        "requestContext": {"authorizer": {"claims": {"sub": "test-user-id"}}},
+    }
+
+    response = lambda_handler(event, None)
+
+    assert response["statusCode"] == 202
+    assert json.loads(response["body"]) == {"import_id": "import-1"}
+    mock_import.assert_called_once_with("test-user-id", make_entries(3))
+
+
+@patch("diary_import.diary_import.get_import_status")
+def test_lambda_handler_returns_status(mock_status):
+    """GET で進捗を返し、存在しない場合は 404 を返すことのテスト"""
+    event = {
+        "httpMethod": "GET",
+        "queryStringParameters": {"import_id": "import-1"},
+        "requestContext": {"authorizer": {"claims": {"sub": "test-user-id"}}},
+    }
+    mock_status.return_value = {"status": "COMPLETED"}
+    assert lambda_handler(event, None)["statusCode"] == 200
+    mock_status.assert_called_once_with("test-user-id", "import-1")
+
+    mock_status.return_value = None
+    assert lambda_handler(event, None)["statusCode"] == 404
+
+    event["queryStringParameters"] = None
+    assert lambda_handler(event, None)["statusCode"] == 400
@@ -0,0 +1,160 @@
+import json
+from unittest.mock import MagicMock, patch
+
+import pytest
+from diary_import_worker.diary_import_worker import lambda_handler
+
+
+def make_record(date, receive_count=1):
+    """テスト用の SQS レコードを作成"""
+    return {
+        "messageId": f"message-{date}",
+        "body": json.dumps(
+            {"user_id": "test-user-id", "import_id": "import-1", "date": date}
+        ),
+        "attributes": {"ApproximateReceiveCount": str(receive_count)},
+    }
+
+
+def make_context(remaining_ms=180_000):
+    """テスト用の Lambda 実行コンテキストを作成"""
+    context = MagicMock()
+    context.get_remaining_time_in_millis.return_value = remaining_ms
+    return context
+
+
+def progress_updates(table):
+    """進捗テーブルに記録した (属性名, 日付) のリストを返す"""
+    return sorted(
+        (
+            call.kwargs["ExpressionAttributeNames"]["#dates"],
+            next(iter(call.kwargs["ExpressionAttributeValues"][":date"])),
+        )
+        for call in table.update_item.call_args_list
+    )
+
+
+@pytest.fixture
+def mock_env(monkeypatch):
+    monkeypatch.setenv("TABLE_NAME", "test-diary-table")
+    monkeypatch.setenv("IMAGE_PROCESSING_QUEUE_URL", "test-queue-url")
+    monkeypatch.setenv("IMPORT_JOB_TABLE_NAME", "test-job-table")
+
+
+@pytest.fixture
+def mock_table():
+    with patch("boto3.resource") as mock_boto_resource:
+        table = mock_boto_resource.return_value.Table.return_value
+        table.get_item.return_value = {"Item": {"content": "日記"}}
+        yield table
+
+
+@patch("boto3.client")
+@patch("diary_import_worker.diary_import_worker.select_and_save_flower")
+def test_lambda_handler(mock_select, mock_boto_client, mock_table, mock_env):
+    """花を選択して画像生成ジョブをまとめて送信し、失敗したレコードを再試行させることのテスト"""
+
+    def select(user_id, date, content):
+        if date == "2024-01-02" or date == "2024-01-03":
+            raise RuntimeError("Dify error")
+        return "lily1"
+
+    mock_select.side_effect = select
+    sqs = mock_boto_client.return_value
+    sqs.send_message_batch.return_value = {"Successful": [], "Failed": []}
+    event = {
+        "Records": [
+            make_record("2024-01-01"),
+            make_record("2024-01-02"),
+            make_record("2024-01-03", receive_count=3),
+            make_record("2024-01-04"),
+        ]
+    }
+
+    response = lambda_handler(event, make_context())
+
+    # 最大試行回数に達していないレコードだけを再試行させる
+    assert response == {"batchItemFailures": [{"itemIdentifier": "message-2024-01-02"}]}
+    # 日記の内容はテーブルから読み出す
+    mock_select.assert_any_call("test-user-id", "2024-01-01", "日記")
+    sqs.send_message_batch.assert_called_once_with(
+        QueueUrl="test-queue-url",
+        Entries=[
+            {
+                "Id": "0",
+                "MessageBody": json.dumps(
+                    {
+                        "user_id": "test-user-id",
+                        "date": "2024-01-01",
+                        "flower_id": "lily1",
+                    }
+                ),
+            },
+            {
+                "Id": "1",
+                "MessageBody": json.dumps(
+                    {
+                        "user_id": "test-user-id",
+                        "date": "2024-01-04",
+                        "flower_id": "lily1",
+                    }
+                ),
+            },
+        ],
+    )
+    assert progress_updates(mock_table) == [
+        ("done_dates", "2024-01-01"),
+        ("done_dates", "2024-01-04"),
+        ("failed_dates", "2024-01-03"),
+    ]
+
+
+@patch("boto3.client")
+@patch("diary_import_worker.diary_import_worker.select_and_save_flower")
+def test_lambda_handler_failed_image_job(
+    mock_select, mock_boto_client, mock_table, mock_env
+):
+    """画像生成ジョブの送信に失敗したレコードを再試行させることのテスト"""
+    mock_select.return_value = "lily1"
+    sqs = mock_boto_client.return_value
+    sqs.send_message_batch.return_value = {
+        "Successful": [{"Id": "0"}],
+        "Failed": [{"Id": "1", "Code": "InternalError", "SenderFault": False}],
+    }
+    event = {"Records": [make_record("2024-01-01"), make_record("2024-01-02")]}
+
+    response = lambda_handler(event, make_context())
+
+    assert response == {"batchItemFailures": [{"itemIdentifier": "message-2024-01-02"}]}
+    assert progress_updates(mock_table) == [("done_dates", "2024-01-01")]
+
+
+@patch("boto3.client")
+@patch("diary_import_worker.diary_import_worker.select_and_save_flower")
+def test_lambda_handler_diary_not_found(
+    mock_select, mock_boto_client, mock_table, mock_env
+):
+    """日記が削除されている場合は再試行せずに失敗として記録することのテスト"""
+    mock_table.get_item.return_value = {"Item": {"content": "日記", "is_deleted": True}}
+
+    response = lambda_handler({"Records": [make_record("2024-01-01")]}, make_context())
+
+    assert response == {"batchItemFailures": []}
+    mock_select.assert_not_called()
+    mock_boto_client.return_value.send_message_batch.assert_not_called()
+    assert progress_updates(mock_table) == [("failed_dates", "2024-01-01")]
+
+
+@patch("boto3.client")
+@patch("diary_import_worker.diary_import_worker.select_and_save_flower")
+def test_lambda_handler_not_enough_time(
+    mock_select, mock_boto_client, mock_table, mock_env
+):
+    """残り時間が足りない場合はレコードを処理せずに再試行させることのテスト"""
+    response = lambda_handler(
+        {"Records": [make_record("2024-01-01")]}, make_context(remaining_ms=10_000)
+    )
+
+    assert response == {"batchItemFailures": [{"itemIdentifier": "message-2024-01-01"}]}
+    mock_select.assert_not_called()
+    mock_table.update_item.assert_not_called()
@@ -0,0 +1,91 @@
+from unittest.mock import MagicMock, patch
+
+import boto3
+import pytest
+from common.flower_catalog import (
+    FlowerCatalog,
+    InvalidFlowerIdError,
+    normalize_flower_id,
+)
+from moto import mock_aws
+
+
+@pytest.fixture
+def s3():
+    """single_flowers/ と flowers/ に花の画像を置いた moto のバケットを返す"""
+    with mock_aws():
+        client = boto3.client("s3", region_name="ap-northeast-1")
+        client.create_bucket(
+            Bucket="original",
+            CreateBucketConfiguration={"LocationConstraint": "ap-northeast-1"},
+        )
+        for key in [
+            "single_flowers/lily1.png",
+            "single_flowers/sunflower2.png",
+            "single_flowers/rose1.png",
+            "flowers/lily1.png",
+            "flowers/sunflower2.png",
+            "flowers/readme.txt",
+        ]:
+            client.put_object(Bucket="original", Key=key, Body=b"")
+        yield client
+
+
+@pytest.fixture(autouse=True)
+def mock_metrics():
+    with patch("common.flower_catalog.put_metrics") as mock_metrics:
+        yield mock_metrics
+
+
+def test_normalize_flower_id():
+    """表記揺れを取り除くことのテスト"""
+    assert normalize_flower_id(" Lily1\n") == "lily1"
+    assert normalize_flower_id("`ｌｉｌｙ１`") == "lily1"
+    assert normalize_flower_id("single_flowers/lily1.png") == "lily1"
+
+
+def test_resolve(s3, mock_metrics):
+    """カタログの花のIDに変換し、近いIDに補正することのテスト"""
+    catalog = FlowerCatalog("original", s3_client=s3)
+
+    # 両方のプレフィックスに画像がある花だけがカタログに入る
+    assert catalog.flower_ids == ["lily1", "sunflower2"]
+    assert catalog.resolve("lily1") == "lily1"
+    assert catalog.resolve(" LILY1 \n") == "lily1"
+    assert catalog.resolve("花: sunflower2") == "sunflower2"
+    assert catalog.resolve("sunflowr2") == "sunflower2"
+    assert [call.args[0] for call in mock_metrics.call_args_list] == [
+        {"FlowerIdCorrected": 1},
+        {"FlowerIdCorrected": 1},
+    ]
+
+    with pytest.raises(InvalidFlowerIdError):
+        catalog.resolve("rose1")
+    with pytest.raises(InvalidFlowerIdError):
+        catalog.resolve("")
+
+
+def test_catalog_is_cached(s3):
+    """TTLの間はS3を呼び出さず、読み直しに失敗した場合は前回のカタログを使うことのテスト"""
+    catalog = FlowerCatalog("original", s3_client=s3, ttl_seconds=60)
+    assert catalog.resolve("lily1") == "lily1"
+
+    s3.delete_object(Bucket="original", Key="flowers/lily1.png")
+    assert catalog.resolve("lily1") == "lily1"
+
+    catalog.ttl_seconds = 0
+    catalog._s3 = MagicMock()
+    catalog._s3.get_paginator.side_effect = Exception("S3 is down")
+    assert catalog.resolve("lily1") == "lily1"
+
+
+def test_without_catalog():
+    """カタログを使えない場合は前後の空白だけを取り除くことのテスト"""
+    assert FlowerCatalog(None).resolve(" lily1\n") == "lily1"
+
+    s3 = MagicMock()
+    s3.get_paginator.side_effect = Exception("S3 is down")
+    catalog = FlowerCatalog("original", s3_client=s3)
+    assert catalog.resolve("unknown") == "unknown"
+    with pytest.raises(InvalidFlowerIdError):
+        catalog.resolve(" ")
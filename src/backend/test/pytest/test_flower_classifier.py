@@ -0,0 +1,51 @@
+import pytest
+from common.flower_classifier import FlowerClassifier, char_ngrams
+
+PAIRS = [
+    ("今日は友達と海に行って泳いだ。とても楽しかった", "sunflower1"),
+    ("夏休みに家族で海へ行き、楽しい一日だった", "sunflower1"),
+    ("仕事で失敗してしまい、悲しい気持ちになった", "lily1"),
+    ("友達と別れてさびしくて、悲しい夜だった", "lily1"),
+    ("試験に合格した！努力が報われて嬉しい", "rose1"),
+    ("昇進が決まって嬉しい。努力してよかった", "rose1"),
+]
+
+
+def test_char_ngrams():
+    """正規化した内容から文字 n-gram を数えることのテスト"""
+    grams = char_ngrams("Ａｂ a", ngram_range=(1, 2))
+
+    assert grams == {"a": 2, "b": 1, "ab": 1, "ba": 1}
+
+
+def test_train_and_predict():
+    """学習データに近い内容の日記に同じ花を選ぶことのテスト"""
+    classifier = FlowerClassifier.train(PAIRS)
+
+    assert classifier.labels == ["lily1", "rose1", "sunflower1"]
+    assert classifier.predict("海で泳いで楽しかった")[0] == "sunflower1"
+    assert classifier.predict("悲しいことがあった")[0] == "lily1"
+    assert classifier.predict("合格して嬉しい")[0] == "rose1"
+    # どの特徴量にも一致しない場合は学習データで最も多い花を返す
+    assert classifier.predict("ｘｙｚ")[1] == 0.0
+
+
+def test_save_and_load(tmp_path):
+    """保存したモデルを読み込んで同じ結果を返すことのテスト"""
+    path = tmp_path / "model.json"
+    assert not FlowerClassifier(model_path=path).enabled
+
+    trained = FlowerClassifier.train(PAIRS)
+    trained.save(path)
+    loaded = FlowerClassifier(model_path=path)
+
+    assert loaded.enabled
+    assert loaded.predict("海で泳いで楽しかった") == trained.predict(
+        "海で泳いで楽しかった"
+    )
+
+
+def test_train_without_data():
+    """学習データがない場合は例外を送出することのテスト"""
+    with pytest.raises(ValueError, match="No training data"):
+        FlowerClassifier.train([("", "rose1"), ("日記", "")])
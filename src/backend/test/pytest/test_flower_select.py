@@ -1,13 +1,9 @@
-import os
+import json
 from unittest.mock import MagicMock, patch
 
 import pytest
-from flower_select.flower_select import (
-    get_parameter_from_parameter_store,
-    save_to_dynamodb,
-    select_flower,
-    select_flower_using_api,
-)
+from common.flower_selection import FlowerSaveError
+from flower_select.flower_select import lambda_handler
 
 
 def create_mock_context():
@@ -28,86 +24,37 @@ def lambda_event():
     }
 
 
-# Test for select_flower
-def test_select_flower():
-    """select_flower関数のテスト"""
-    diary_content = "今日は楽しい一日でした"
+# Test for lambda_handler
+def test_lambda_handler(lambda_event):
+    """lambda_handler関数の正常系のテスト"""
     with patch(
-        "flower_select.flower_select.get_parameter_from_parameter_store",
-        return_value="fake-api-key",
-    ), patch(
-        "flower_select.flower_select.select_flower_using_api",
+        "flower_select.flower_select.select_and_save_flower",
         return_value="flower-id-123",
-    ) as mock_select_flower_using_api:
-        flower_id = select_flower(diary_content)
-        assert flower_id == "flower-id-123"
-        mock_select_flower_using_api.assert_called_once_with(
-            "fake-api-key", diary_content
-        )
-
+    ) as mock_select:
+        response = lambda_handler(lambda_event, create_mock_context())
 
-# Test for save_to_dynamodb
-def test_save_to_dynamodb():
-    """save_to_dynamodb関数のテスト"""
-    user_id = "test-user-id"
-    date = "2024-03-15"
-    flower_id = "flower-id-123"
-
-    with patch("boto3.resource") as mock_dynamodb_resource, patch.dict(
-        os.environ, {"GENERATIVE_AI_TABLE_NAME": "test-table"}
-    ):
-        table = mock_dynamodb_resource.return_value.Table.return_value
-        save_to_dynamodb(user_id, date, flower_id)
-
-        # DynamoDBのupdate_itemが正しく呼ばれたか確認
-        table.update_item.assert_called_once_with(
-            Key={"user_id": user_id, "date": date},
-            UpdateExpression="set flower_id = :flower",
-            ExpressionAttributeValues={":flower": flower_id},
+        assert response["statusCode"] == 200
+        assert json.loads(response["body"])["flower_id"] == "flower-id-123"
+        mock_select.assert_called_once_with(
+            "test-user-id", "2024-03-15", "今日は良い天気だった"
         )
 
 
-# Test for get_parameter_from_parameter_store
-def test_get_parameter_from_parameter_store():
-    """get_parameter_from_parameter_store関数のテスト"""
-    parameter_name = "DIFY_API_KEY"
-    expected_value = "fake-api-key"
-
-    with patch("boto3.client") as mock_ssm_client:
-        mock_ssm_client.return_value.get_parameter.return_value = {
-            "Parameter": {"Value": expected_value}
-        }
-        api_key = get_parameter_from_parameter_store(parameter_name)
-        assert api_key == expected_value
-
-
-# Test for select_flower_using_api
-def test_select_flower_using_api():
-    """select_flower_using_api関数のテスト"""
-    api_key = "fake-api-key"
-    query = "今日は楽しい一日でした"
-    expected_flower_id = "flower-id-123"
-
-    with patch("requests.post") as mock_post:
-        mock_response = MagicMock()
-        mock_response.json.return_value = {"answer": expected_flower_id}
-        mock_post.return_value = mock_response
+def test_lambda_handler_errors(lambda_event):
+    """lambda_handler関数の異常系のテスト"""
+    with patch(
+        "flower_select.flower_select.select_and_save_flower",
+        side_effect=FlowerSaveError("DynamoDB error"),
+    ):
+        response = lambda_handler(lambda_event, create_mock_context())
+        assert response["statusCode"] == 500
 
-        flower_id = select_flower_using_api(api_key, query)
-        assert flower_id == expected_flower_id
+    with patch(
+        "flower_select.flower_select.select_and_save_flower",
+        side_effect=ValueError("Flower ID is Empty"),
+    ):
+        response = lambda_handler(lambda_event, create_mock_context())
+        assert response["statusCode"] == 400
 
-        # リクエストの内容を確認
-        mock_post.assert_called_once_with(
-            "https://api.dify.ai/v1/chat-messages",
-            headers={
-                "Authorization": f"Bearer {api_key}",
-                "Content-Type": "application/json",
-            },
-            json={
-                "query": query,
-                "inputs": {},
-                "response_mode": "blocking",
-                "user": "user",
-                "auto_generate_name": True,
-            },
-        )
+    response = lambda_handler({"user_id": "test-user-id"}, create_mock_context())
+    assert response["statusCode"] == 400
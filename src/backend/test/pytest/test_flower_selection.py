@@ -0,0 +1,350 @@
+import datetime
+import json
+import os
+import time
+from unittest.mock import ANY, MagicMock, patch
+
+import pytest
+from common.circuit_breaker import CircuitOpenError
+from common.flower_catalog import InvalidFlowerIdError
+from common.flower_selection import (
+    FlowerSaveError,
+    analyze_diary,
+    get_parameter_from_parameter_store,
+    save_to_dynamodb,
+    select_and_save_flower,
+    select_flower,
+    select_flower_using_api,
+)
+from common.idempotency import request_fingerprint
+from common.rate_limiter import RateLimitExceededError
+from common.selection_cache import content_hash
+
+
+# Test for select_flower
+def test_select_flower():
+    """select_flower関数のテスト"""
+    diary_content = "今日は楽しい一日でした"
+    with patch(
+        "common.flower_selection.get_parameter_from_parameter_store",
+        return_value="fake-api-key",
+    ), patch(
+        "common.flower_selection.select_flower_using_api",
+        return_value="flower-id-123",
+    ) as mock_select_flower_using_api:
+        flower_id = select_flower(diary_content)
+        assert flower_id == "flower-id-123"
+        mock_select_flower_using_api.assert_called_once_with(
+            "fake-api-key", diary_content, rate_limit_wait=None
+        )
+
+
+def test_select_flower_uses_cache():
+    """キャッシュにある場合はAPIを呼び出さず、ない場合は選択結果を保存することのテスト"""
+    with patch("common.flower_selection.selection_cache") as mock_cache, patch(
+        "common.flower_selection.get_parameter_from_parameter_store",
+        return_value="fake-api-key",
+    ), patch(
+        "common.flower_selection.select_flower_using_api",
+        return_value="flower-id-123",
+    ) as mock_select_flower_using_api:
+        mock_cache.enabled = True
+        mock_cache.get.return_value = "flower-id-cached"
+        assert select_flower("今日は特になし") == "flower-id-cached"
+        mock_select_flower_using_api.assert_not_called()
+
+        mock_cache.get.return_value = None
+        assert select_flower("今日は特になし") == "flower-id-123"
+        mock_cache.put.assert_called_once_with("今日は特になし", "flower-id-123")
+
+
+# Test for save_to_dynamodb
+def test_save_to_dynamodb():
+    """save_to_dynamodb関数のテスト"""
+    user_id = "test-user-id"
+    date = "2024-03-15"
+    flower_id = "flower-id-123"
+
+    with patch("boto3.resource") as mock_dynamodb_resource, patch.dict(
+        os.environ, {"GENERATIVE_AI_TABLE_NAME": "test-table"}
+    ):
+        table = mock_dynamodb_resource.return_value.Table.return_value
+        save_to_dynamodb(user_id, date, flower_id)
+
+        # DynamoDBのupdate_itemが正しく呼ばれたか確認
+        table.update_item.assert_called_once_with(
+            Key={"user_id": user_id, "date": date},
+            UpdateExpression="set flower_id = :flower",
+            ExpressionAttributeValues={":flower": flower_id},
+        )
+
+        table.reset_mock()
+        save_to_dynamodb(user_id, date, flower_id, "晴れた日", "fingerprint")
+        table.update_item.assert_called_once_with(
+            Key={"user_id": user_id, "date": date},
+            UpdateExpression=(
+                "set flower_id = :flower, title = :title, content_fingerprint = :f"
+            ),
+            ExpressionAttributeValues={
+                ":flower": flower_id,
+                ":title": "晴れた日",
+                ":f": "fingerprint",
+            },
+        )
+
+
+# Test for get_parameter_from_parameter_store
+def test_get_parameter_from_parameter_store():
+    """get_parameter_from_parameter_store関数のテスト"""
+    parameter_name = "DIFY_API_KEY"
+    expected_value = "fake-api-key"
+
+    with patch("boto3.client") as mock_ssm_client:
+        mock_ssm_client.return_value.get_parameter.return_value = {
+            "Parameter": {"Value": expected_value}
+        }
+        api_key = get_parameter_from_parameter_store(parameter_name)
+        assert api_key == expected_value
+
+
+# Test for select_flower_using_api
+def test_select_flower_using_api():
+    """select_flower_using_api関数のテスト"""
+    api_key = "fake-api-key"
+    query = "今日は楽しい一日でした"
+    expected_flower_id = "flower-id-123"
+
+    with patch("common.flower_selection.dify_client.session.post") as mock_post:
+        mock_response = MagicMock()
+        mock_response.status_code = 200
+        mock_response.elapsed = datetime.timedelta(milliseconds=50)
+        mock_response.json.return_value = {"answer": expected_flower_id}
+        mock_post.return_value = mock_response
+
+        flower_id = select_flower_using_api(api_key, query)
+        assert flower_id == expected_flower_id
+
+        # リクエストの内容を確認
+        mock_post.assert_called_once_with(
+            "https://api.dify.ai/v1/chat-messages",
+            headers={
+                "Authorization": f"Bearer {api_key}",
+                "Content-Type": "application/json",
+            },
+            json={
+                "query": query,
+                "inputs": {},
+                "response_mode": "blocking",
+                "user": "user",
+                "auto_generate_name": True,
+            },
+            timeout=ANY,
+        )
+        # レスポンスを待つ時間は全体の待ち時間の上限までに短くする
+        connect_timeout, read_timeout = mock_post.call_args.kwargs["timeout"]
+        assert connect_timeout == 3.05
+        assert 19 < read_timeout <= 20
+
+
+# Test for select_and_save_flower
+def test_select_and_save_flower():
+    """select_and_save_flower関数のテスト"""
+    with patch(
+        "common.flower_selection.select_flower", return_value="flower-id-123"
+    ), patch("common.flower_selection.save_to_dynamodb") as mock_save:
+        flower_id = select_and_save_flower("test-user-id", "2024-03-15", "日記")
+
+        assert flower_id == "flower-id-123"
+        mock_save.assert_called_once_with("test-user-id", "2024-03-15", "flower-id-123")
+
+
+def make_analysis_response(title, flower_id):
+    return json.dumps(
+        {
+            "choices": [
+                {
+                    "message": {
+                        "content": json.dumps({"title": title, "flower_id": flower_id})
+                    }
+                }
+            ],
+            "usage": {"prompt_tokens": 100, "completion_tokens": 20},
+        }
+    )
+
+
+def test_analyze_diary():
+    """1回の呼び出しでタイトルと花のIDを返し、花のIDをカタログのIDに制限することのテスト"""
+    with patch(
+        "common.flower_selection.get_parameter_from_parameter_store",
+        return_value="fake-api-key",
+    ), patch("common.flower_selection.flower_catalog") as mock_catalog, patch(
+        "common.flower_selection.send_chat_request",
+        return_value=make_analysis_response(" 晴れた日 ", "Lily"),
+    ) as mock_send:
+        mock_catalog.enabled = True
+        mock_catalog.flower_ids = ["lily", "rose"]
+        mock_catalog.resolve.return_value = "lily"
+
+        assert analyze_diary("今日は晴れ") == ("晴れた日", "lily")
+
+    api_key, request_data = mock_send.call_args.args
+    assert api_key == "fake-api-key"
+    schema = request_data["response_format"]["json_schema"]["schema"]
+    assert schema["properties"]["flower_id"]["enum"] == ["lily", "rose"]
+    mock_catalog.resolve.assert_called_once_with("Lily")
+
+
+@patch.dict(os.environ, {"DIARY_ANALYSIS_MODE": "combined"})
+def test_select_and_save_flower_combined():
+    """combined の場合、タイトルと花のIDをフィンガープリントと一緒に保存することのテスト"""
+    with patch(
+        "common.flower_selection.analyze_diary", return_value=("晴れた日", "lily")
+    ), patch("common.flower_selection.select_flower") as mock_select, patch(
+        "common.flower_selection.save_to_dynamodb"
+    ) as mock_save:
+        flower_id = select_and_save_flower("test-user-id", "2024-03-15", "日記")
+
+    assert flower_id == "lily"
+    mock_select.assert_not_called()
+    mock_save.assert_called_once_with(
+        "test-user-id", "2024-03-15", "lily", "晴れた日", content_hash("日記")
+    )
+
+
+@patch.dict(os.environ, {"DIARY_ANALYSIS_MODE": "combined"})
+def test_select_and_save_flower_combined_fallback():
+    """combined の分析に失敗した場合は花だけを選んで保存することのテスト"""
+    with patch(
+        "common.flower_selection.analyze_diary", side_effect=Exception("API error")
+    ), patch("common.flower_selection.select_flower", return_value="rose"), patch(
+        "common.flower_selection.save_to_dynamodb"
+    ) as mock_save, patch("common.flower_selection.put_metrics") as mock_metrics:
+        flower_id = select_and_save_flower("test-user-id", "2024-03-15", "日記")
+
+    assert flower_id == "rose"
+    mock_save.assert_called_once_with("test-user-id", "2024-03-15", "rose")
+    mock_metrics.assert_called_once_with({"DiaryAnalysisFallback": 1})
+
+
+def test_select_and_save_flower_coalesces_same_diary():
+    """同じ日記の同じ内容の選択は、同じキーで1回にまとめて結果を保存することのテスト"""
+    with patch(
+        "common.flower_selection.flower_flight.do", return_value=["晴れた日", "lily"]
+    ) as mock_do, patch("common.flower_selection.save_to_dynamodb") as mock_save:
+        flower_id = select_and_save_flower("test-user-id", "2024-03-15", "日記")
+
+    assert flower_id == "lily"
+    mock_do.assert_called_once_with(
+        request_fingerprint("test-user-id", "2024-03-15", content_hash("日記")), ANY
+    )
+    mock_save.assert_called_once_with(
+        "test-user-id", "2024-03-15", "lily", "晴れた日", content_hash("日記")
+    )
+
+
+def test_select_and_save_flower_errors():
+    """select_and_save_flower関数の異常系のテスト"""
+    with patch("common.flower_selection.select_flower", return_value=""):
+        with pytest.raises(ValueError, match="Flower ID is Empty"):
+            select_and_save_flower("test-user-id", "2024-03-15", "日記")
+
+    with patch(
+        "common.flower_selection.select_flower", return_value="flower-id-123"
+    ), patch(
+        "common.flower_selection.save_to_dynamodb",
+        side_effect=Exception("DynamoDB error"),
+    ):
+        with pytest.raises(FlowerSaveError, match="DynamoDB error"):
+            select_and_save_flower("test-user-id", "2024-03-15", "日記")
+
+
+@pytest.fixture
+def mock_classifier():
+    with patch("common.flower_selection.local_classifier") as mock_classifier, patch(
+        "common.flower_selection.selection_cache"
+    ) as mock_cache, patch("common.flower_selection.put_metrics") as mock_metrics:
+        mock_classifier.enabled = True
+        mock_classifier.predict.return_value = ("local-flower", 0.5)
+        mock_cache.enabled = False
+        yield mock_classifier, mock_metrics
+
+
+def test_select_flower_local_mode(mock_classifier, monkeypatch):
+    """local の場合はDifyを呼び出さずにローカルの分類器で選ぶことのテスト"""
+    monkeypatch.setenv("FLOWER_SELECTION_MODE", "local")
+    with patch("common.flower_selection.select_flower_using_api") as mock_api:
+        assert select_flower("日記") == "local-flower"
+        mock_api.assert_not_called()
+
+
+def test_select_flower_without_model_uses_dify(mock_classifier, monkeypatch):
+    """学習済みモデルがない場合はDifyを使うことのテスト"""
+    classifier, _ = mock_classifier
+    classifier.enabled = False
+    monkeypatch.setenv("FLOWER_SELECTION_MODE", "local")
+    with patch(
+        "common.flower_selection.get_parameter_from_parameter_store",
+        return_value="fake-api-key",
+    ), patch(
+        "common.flower_selection.select_flower_using_api", return_value="dify-flower"
+    ):
+        assert select_flower("日記") == "dify-flower"
+    classifier.predict.assert_not_called()
+
+
+@pytest.mark.parametrize(
+    "api_side_effect, reason",
+    [
+        (lambda *args, **kwargs: time.sleep(0.5) or "dify-flower", "timeout"),
+        (Exception("Dify is down"), "error"),
+        (CircuitOpenError("dify circuit is open"), "circuit_open"),
+        (InvalidFlowerIdError("Unknown flower_id"), "invalid"),
+        (RateLimitExceededError("dify rate limit exceeded"), "rate_limited"),
+    ],
+)
+def test_select_flower_fallback_mode(
+    mock_classifier, monkeypatch, api_side_effect, reason
+):
+    """Difyが待ち時間の上限内に応答しないか失敗した場合にローカルの分類器を使うことのテスト"""
+    _, mock_metrics = mock_classifier
+    monkeypatch.setenv("FLOWER_SELECTION_MODE", "fallback")
+    monkeypatch.setenv("FLOWER_DIFY_LATENCY_BUDGET_SECONDS", "0.1")
+    with patch(
+        "common.flower_selection.get_parameter_from_parameter_store",
+        return_value="fake-api-key",
+    ), patch(
+        "common.flower_selection.select_flower_using_api", side_effect=api_side_effect
+    ):
+        assert select_flower("日記") == "local-flower"
+    mock_metrics.assert_called_once_with(
+        {"FlowerSelectionFallback": 1}, dimensions={"Reason": reason}
+    )
+
+
+def test_select_flower_fallback_mode_within_budget(mock_classifier, monkeypatch):
+    """Difyが待ち時間の上限内に応答した場合はDifyの結果を返すことのテスト"""
+    classifier, _ = mock_classifier
+    monkeypatch.setenv("FLOWER_SELECTION_MODE", "fallback")
+    with patch(
+        "common.flower_selection.get_parameter_from_parameter_store",
+        return_value="fake-api-key",
+    ), patch(
+        "common.flower_selection.select_flower_using_api", return_value="dify-flower"
+    ):
+        assert select_flower("日記") == "dify-flower"
+    classifier.predict.assert_not_called()
+
+
+def test_select_flower_shadow_mode(mock_classifier, monkeypatch):
+    """shadow の場合はDifyの結果を返し、ローカルの分類器との一致をメトリクスに出力することのテスト"""
+    _, mock_metrics = mock_classifier
+    monkeypatch.setenv("FLOWER_SELECTION_MODE", "shadow")
+    with patch(
+        "common.flower_selection.get_parameter_from_parameter_store",
+        return_value="fake-api-key",
+    ), patch(
+        "common.flower_selection.select_flower_using_api", return_value="dify-flower"
+    ):
+        assert select_flower("日記") == "dify-flower"
+    mock_metrics.assert_called_once_with({"FlowerShadowAgreement": 0})
@@ -0,0 +1,87 @@
+import threading
+import time
+from unittest.mock import patch
+
+import pytest
+from common.hedging import MIN_LATENCY_SAMPLES, Hedger, LatencyBudgetExceededError
+
+
+@pytest.fixture(autouse=True)
+def mock_metrics():
+    with patch("common.hedging.put_metrics") as mock_metrics:
+        yield mock_metrics
+
+
+def metric_names(mock_metrics):
+    return [call.args[0] for call in mock_metrics.call_args_list]
+
+
+def test_call_without_hedge(mock_metrics):
+    """上限内に応答した場合はリクエストを1つだけ送ることのテスト"""
+    calls = []
+
+    def fn(deadline):
+        calls.append(deadline)
+        return "ok"
+
+    hedger = Hedger("test", budget_seconds=1, initial_hedge_delay=0.5)
+
+    assert hedger.call(fn) == "ok"
+    assert len(calls) == 1
+    assert metric_names(mock_metrics) == []
+
+
+def test_slow_request_is_hedged(mock_metrics):
+    """最初のリクエストが遅い場合にもう1つ送り、先に返った応答を使うことのテスト"""
+    lock = threading.Lock()
+    calls = []
+
+    def fn(deadline):
+        with lock:
+            calls.append(deadline)
+            attempt = len(calls)
+        if attempt == 1:
+            time.sleep(0.5)
+            return "slow"
+        return "fast"
+
+    hedger = Hedger("test", budget_seconds=2, initial_hedge_delay=0.05)
+
+    assert hedger.call(fn) == "fast"
+    assert len(calls) == 2
+    # 2つのリクエストには同じ全体の上限の時刻を渡す
+    assert calls[0] == calls[1]
+    assert metric_names(mock_metrics) == [{"HedgedRequest": 1}, {"HedgedRequestWon": 1}]
+
+
+def test_budget_exceeded(mock_metrics):
+    """全体の上限までに応答がない場合は例外を送出することのテスト"""
+    hedger = Hedger("test", budget_seconds=0.1, max_hedges=0)
+
+    with pytest.raises(LatencyBudgetExceededError):
+        hedger.call(lambda deadline: time.sleep(0.3))
+    assert metric_names(mock_metrics) == [{"LatencyBudgetExceeded": 1}]
+
+
+def test_error_is_raised():
+    """リクエストが失敗した場合はヘッジせずに例外を送出することのテスト"""
+
+    def fn(deadline):
+        raise ValueError("bad request")
+
+    with pytest.raises(ValueError, match="bad request"):
+        Hedger("test", budget_seconds=1).call(fn)
+
+
+def test_hedge_delay_uses_percentile():
+    """直近の応答時間のパーセンタイルを待ち時間に使うことのテスト"""
+    hedger = Hedger(
+        "test", hedge_percentile=90, initial_hedge_delay=8, min_hedge_delay=0.5
+    )
+    assert hedger.hedge_delay() == 8
+
+    hedger._latencies.extend([1.0] * (MIN_LATENCY_SAMPLES - 2) + [3.0, 4.0])
+    assert hedger.hedge_delay() == 3.0
+
+    hedger._latencies.extend([0.1] * 200)
+    assert hedger.hedge_delay() == 0.5
@@ -0,0 +1,187 @@
+import datetime
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from unittest.mock import MagicMock, patch
+
+import pytest
+import requests
+from common.http_client import HttpClient
+from urllib3.exceptions import MaxRetryError, NewConnectionError, ProtocolError
+
+
+def response(status_code):
+    """指定したステータスコードのレスポンスを返す"""
+    mock_response = MagicMock()
+    mock_response.status_code = status_code
+    mock_response.elapsed = datetime.timedelta(milliseconds=50)
+    return mock_response
+
+
+@pytest.fixture
+def client():
+    return HttpClient("test", connect_timeout=1, read_timeout=5, max_retries=2)
+
+
+@patch("common.http_client.time.sleep")
+def test_post_passes_timeouts(mock_sleep, client):
+    """接続とレスポンスのタイムアウトを指定して送信することのテスト"""
+    with patch.object(client.session, "post", return_value=response(200)) as post:
+        result = client.post("https://example.com", json={"a": 1})
+
+    assert result.status_code == 200
+    post.assert_called_once_with("https://example.com", timeout=(1, 5), json={"a": 1})
+    mock_sleep.assert_not_called()
+
+
+def connection_error(reason):
+    """urllib3 の例外を requests と同じ形で包んだ ConnectionError を返す"""
+    return requests.exceptions.ConnectionError(
+        MaxRetryError(None, "https://example.com", reason)
+    )
+
+
+@patch("common.http_client.time.sleep")
+def test_post_retries_transient_errors(mock_sleep, client):
+    """接続を確立できなかった場合と一時的なエラーは再試行することのテスト"""
+    responses = [
+        requests.exceptions.ConnectTimeout(),
+        connection_error(NewConnectionError(None, "refused")),
+        response(503),
+        response(200),
+    ]
+    client.max_retries = 3
+    with patch.object(client.session, "post", side_effect=responses) as post:
+        result = client.post("https://example.com")
+
+    assert result.status_code == 200
+    assert post.call_count == 4
+    assert mock_sleep.call_count == 3
+
+
+@patch("common.http_client.time.sleep")
+def test_post_gives_up_after_max_retries(mock_sleep, client):
+    """再試行の上限に達した場合は最後の結果を返すことのテスト"""
+    with patch.object(client.session, "post", return_value=response(429)) as post:
+        assert client.post("https://example.com").status_code == 429
+    assert post.call_count == 3
+
+    error = connection_error(NewConnectionError(None, "refused"))
+    with patch.object(client.session, "post", side_effect=error) as post:
+        with pytest.raises(requests.exceptions.ConnectionError):
+            client.post("https://example.com")
+    assert post.call_count == 3
+
+
+@patch("common.http_client.time.sleep")
+def test_post_respects_deadline(mock_sleep, client):
+    """全体の上限の時刻までの残り時間でレスポンスを待ち、上限を過ぎたら再試行しないことのテスト"""
+    with patch("common.http_client.time.monotonic", return_value=100.0), patch.object(
+        client.session, "post", return_value=response(503)
+    ) as post:
+        assert client.post("https://example.com", deadline=102.0).status_code == 503
+        assert post.call_args.kwargs["timeout"] == (1, 2.0)
+        assert post.call_count == 3
+
+        post.reset_mock()
+        client.post("https://example.com", deadline=100.0)
+        assert post.call_count == 1
+
+
+@pytest.mark.parametrize(
+    "headers, expected",
+    [
+        ({"Retry-After": "3"}, 3.0),
+        ({"retry-after-ms": "1500"}, 1.5),
+        ({"Retry-After": "Wed, 21 Oct 2015 07:28:00 GMT"}, 0.0),
+    ],
+)
+@patch("common.http_client.time.sleep")
+def test_post_honors_retry_after(mock_sleep, headers, expected, client):
+    """Retry-After で指示された時間は少なくとも待ってから再試行することのテスト"""
+    rate_limited = response(429)
+    rate_limited.headers = headers
+    with patch.object(
+        client.session, "post", side_effect=[rate_limited, response(200)]
+    ) as post:
+        assert client.post("https://example.com").status_code == 200
+
+    assert post.call_count == 2
+    assert mock_sleep.call_args.args[0] >= expected
+
+
+@patch("common.http_client.time.sleep")
+def test_post_does_not_wait_past_deadline(mock_sleep, client):
+    """Retry-After が全体の上限の時刻を超える場合は待たずに返すことのテスト"""
+    rate_limited = response(429)
+    rate_limited.headers = {"Retry-After": "5"}
+    with patch("common.http_client.time.monotonic", return_value=100.0), patch.object(
+        client.session, "post", return_value=rate_limited
+    ) as post:
+        assert client.post("https://example.com", deadline=103.0).status_code == 429
+
+    assert post.call_count == 1
+    mock_sleep.assert_not_called()
+
+
+@pytest.mark.parametrize(
+    "error",
+    [
+        requests.exceptions.ReadTimeout(),
+        connection_error(ProtocolError("Connection aborted.")),
+    ],
+)
+@patch("common.http_client.time.sleep")
+def test_post_does_not_retry_after_request_sent(mock_sleep, error, client):
+    """送信後のタイムアウトや切断は、処理済みの可能性があるため再試行しないことのテスト"""
+    with patch.object(client.session, "post", side_effect=error) as post:
+        with pytest.raises(type(error)):
+            client.post("https://example.com")
+
+    post.assert_called_once()
+    mock_sleep.assert_not_called()
+
+
+def test_timing_log_failure_does_not_fail_request(client):
+    """計測結果の出力に失敗してもレスポンスを返すことのテスト"""
+    broken = MagicMock()
+    broken.status_code = 200
+    with patch.object(client.session, "post", return_value=broken):
+        assert client.post("https://example.com") is broken
+
+
+def test_connection_is_reused():
+    """keep-alive により同じ接続でリクエストを送信することのテスト"""
+    ports = []
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            ports.append(self.client_address[1])
+            self.rfile.read(int(self.headers["Content-Length"]))
+            self.send_response(200)
+            self.send_header("Content-Length", "2")
+            self.end_headers()
+            self.wfile.write(b"ok")
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    client = HttpClient("test")
+    try:
+        # テスト用サーバーはHTTPのため、HTTPSと同じアダプターを割り当てる
+        client.session.mount("http://", client.session.get_adapter("https://"))
+        url = f"http://127.0.0.1:{server.server_port}/"
+        for _ in range(3):
+            assert client.post(url, json={}).status_code == 200
+    finally:
+        # 接続を閉じないとサーバーが keep-alive の接続を待ち続ける
+        client.session.close()
+        server.shutdown()
+        server.server_close()
+
+    assert len(ports) == 3
+    assert len(set(ports)) == 1
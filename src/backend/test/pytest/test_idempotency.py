@@ -0,0 +1,81 @@
+import boto3
+import pytest
+from common.idempotency import (
+    IdempotencyConflictError,
+    IdempotencyStore,
+    request_fingerprint,
+)
+from moto import mock_aws
+
+
+@pytest.fixture
+def store():
+    """moto のテーブルを使う IdempotencyStore を返す"""
+    with mock_aws():
+        dynamodb = boto3.resource("dynamodb", region_name="ap-northeast-1")
+        dynamodb.create_table(
+            TableName="idempotency",
+            KeySchema=[
+                {"AttributeName": "user_id", "KeyType": "HASH"},
+                {"AttributeName": "date", "KeyType": "RANGE"},
+            ],
+            AttributeDefinitions=[
+                {"AttributeName": "user_id", "AttributeType": "S"},
+                {"AttributeName": "date", "AttributeType": "S"},
+            ],
+            BillingMode="PAY_PER_REQUEST",
+        )
+        yield IdempotencyStore("idempotency", dynamodb=dynamodb, lock_seconds=60)
+
+
+def test_replay_completed_request(store):
+    """同じ冪等キーの再送には保存済みの結果を返すことのテスト"""
+    fingerprint = request_fingerprint("2024-03-15", "今日は散歩をしました。")
+
+    assert store.begin("user", "2024-03-15", "key-1", fingerprint) is None
+    store.complete("user", "2024-03-15", "key-1", {"flower_id": "lily1"})
+
+    assert store.begin("user", "2024-03-15", "key-1", fingerprint) == {
+        "flower_id": "lily1"
+    }
+
+
+def test_conflicts(store):
+    """処理中のリクエストと冪等キーの使い回しが拒否されることのテスト"""
+    store.begin("user", "2024-03-15", "key-1", "fp-1")
+
+    with pytest.raises(IdempotencyConflictError, match="in progress"):
+        store.begin("user", "2024-03-15", "key-1", "fp-1")
+    with pytest.raises(IdempotencyConflictError, match="this date is in progress"):
+        store.begin("user", "2024-03-15", "key-2", "fp-2")
+
+    store.complete("user", "2024-03-15", "key-1", {"flower_id": "lily1"})
+    with pytest.raises(IdempotencyConflictError, match="different request"):
+        store.begin("user", "2024-03-15", "key-1", "fp-other")
+
+    # 完了後は別の冪等キーで同じ日付の日記を作り直せる
+    assert store.begin("user", "2024-03-15", "key-2", "fp-2") is None
+
+
+def test_release_and_expired_lock(store):
+    """失敗したリクエストとロックの切れたリクエストは再実行できることのテスト"""
+    store.begin("user", "2024-03-15", "key-1", "fp-1")
+    store.release("user", "2024-03-15", "key-1")
+    assert store.begin("user", "2024-03-15", "key-1", "fp-1") is None
+
+    store.lock_seconds = -1
+    store.begin("user", "2024-03-16", "key-1", "fp-1")
+    assert store.begin("user", "2024-03-16", "key-2", "fp-2") is None
+
+
+def test_invalidate_completed_request(store):
+    """無効にした完了済みのレコードは同じ冪等キーで再実行できることのテスト"""
+    store.begin("user", "2024-03-15", "key-1", "fp-1")
+    # 処理中のレコードは削除しない
+    store.invalidate("user", "2024-03-15", "key-1")
+    with pytest.raises(IdempotencyConflictError):
+        store.begin("user", "2024-03-15", "key-1", "fp-1")
+
+    store.complete("user", "2024-03-15", "key-1", {"flower_id": "lily1"})
+    store.invalidate("user", "2024-03-15", "key-1")
+    assert store.begin("user", "2024-03-15", "key-1", "fp-1") is None
@@ -0,0 +1,59 @@
+from io import BytesIO
+
+import pytest
+from common.image_encoder import ENCODER_PROFILES, encode_image, resolve_profile
+from PIL import Image
+
+
+@pytest.fixture
+def rgba_image():
+    """透明部分を含むテスト用の画像"""
+    image = Image.new("RGBA", (64, 64), (0, 0, 0, 0))
+    image.paste((255, 0, 0, 255), (16, 16, 48, 48))
+    return image
+
+
+@pytest.mark.parametrize("profile", list(ENCODER_PROFILES))
+def test_encode_image(rgba_image, profile):
+    """各プロファイルでエンコードした画像が透過を保ったまま復元できることのテスト"""
+    body, content_type = encode_image(rgba_image, profile)
+
+    decoded = Image.open(BytesIO(body))
+    assert decoded.format == ENCODER_PROFILES[profile]["format"]
+    assert content_type == f"image/{decoded.format.lower()}"
+
+    decoded = decoded.convert("RGBA")
+    assert decoded.size == rgba_image.size
+    assert decoded.getpixel((0, 0))[3] == 0
+    assert decoded.getpixel((32, 32)) == (255, 0, 0, 255)
+
+
+@pytest.mark.parametrize(
+    "profile", ["png", "png_fast", "png_optimized", "webp_lossless"]
+)
+def test_lossless_profiles(rgba_image, profile):
+    """可逆プロファイルでは画素が完全に一致することのテスト"""
+    body, _ = encode_image(rgba_image, profile)
+
+    decoded = Image.open(BytesIO(body)).convert("RGBA")
+    assert decoded.tobytes() == rgba_image.tobytes()
+
+
+def test_resolve_profile_from_env(monkeypatch):
+    """環境変数からプロファイルを解決するテスト"""
+    monkeypatch.setenv("IMAGE_ENCODER_PROFILE", "png_fast")
+    assert resolve_profile() == "png_fast"
+
+    monkeypatch.delenv("IMAGE_ENCODER_PROFILE")
+    assert resolve_profile() == "png"
+
+    with pytest.raises(ValueError, match="Unknown image encoder profile"):
+        resolve_profile("gif")
+
+
+def test_resolve_profile_restricted_formats():
+    """使用できる形式を制限した場合は他の形式のプロファイルを拒否するテスト"""
+    assert resolve_profile("png_fast", formats=("PNG",)) == "png_fast"
+
+    with pytest.raises(ValueError, match="not supported here"):
+        resolve_profile("webp_lossless", formats=("PNG",))
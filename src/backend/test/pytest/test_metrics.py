@@ -0,0 +1,19 @@
+import json
+from unittest.mock import patch
+
+from common.metrics import put_metrics
+
+
+@patch("common.metrics._metrics_logger")
+def test_put_metrics_writes_emf(mock_logger):
+    """Embedded Metric Format のJSONを出力することのテスト"""
+    put_metrics({"FlowerCacheHit": 1}, dimensions={"Function": "diary_create"})
+
+    payload = json.loads(mock_logger.info.call_args.args[0])
+    assert payload["FlowerCacheHit"] == 1
+    assert payload["Function"] == "diary_create"
+    assert payload["_aws"]["CloudWatchMetrics"][0] == {
+        "Namespace": "DiaryApp",
+        "Dimensions": [["Function"]],
+        "Metrics": [{"Name": "FlowerCacheHit", "Unit": "Count"}],
+    }
@@ -0,0 +1,45 @@
+import datetime
+from unittest.mock import MagicMock, patch
+
+import pytest
+import requests
+from common.openai_chat import OPENAI_CHAT_COMPLETIONS_URL, send_chat_request
+
+
+def response(status_code, text=""):
+    """指定したステータスコードのレスポンスを返す"""
+    mock_response = requests.models.Response()
+    mock_response.status_code = status_code
+    mock_response._content = text.encode()
+    mock_response.elapsed = datetime.timedelta(milliseconds=50)
+    return mock_response
+
+
+@patch("common.openai_chat.openai_rate_limiter")
+def test_send_chat_request(mock_rate_limiter):
+    """レート制限のトークンを取得してから送信し、レスポンスの本文を返すことのテスト"""
+    with patch(
+        "common.openai_chat.openai_client.session.post",
+        return_value=response(200, '{"choices": []}'),
+    ) as mock_post:
+        result = send_chat_request("fake-api-key", {"model": "gpt-4o-mini"})
+
+    assert result == '{"choices": []}'
+    mock_rate_limiter.acquire.assert_called_once()
+    assert mock_post.call_args.args == (OPENAI_CHAT_COMPLETIONS_URL,)
+    assert mock_post.call_args.kwargs["headers"]["Authorization"] == (
+        "Bearer fake-api-key"
+    )
+    assert mock_post.call_args.kwargs["json"] == {"model": "gpt-4o-mini"}
+
+
+@patch("common.openai_chat.openai_rate_limiter", MagicMock())
+def test_send_chat_request_http_error():
+    """再試行しないエラーのレスポンスは HTTPError を送出することのテスト"""
+    with patch(
+        "common.openai_chat.openai_client.session.post", return_value=response(400)
+    ) as mock_post:
+        with pytest.raises(requests.exceptions.HTTPError):
+            send_chat_request("fake-api-key", {})
+
+    mock_post.assert_called_once()
@@ -0,0 +1,93 @@
+import os
+from unittest.mock import patch
+
+from common.prompt_input import (
+    estimate_tokens,
+    get_token_budget,
+    get_token_counter,
+    prepare_input,
+    record_usage,
+    register_token_counter,
+    split_sentences,
+    summarize,
+    truncate,
+)
+
+
+def test_estimate_tokens():
+    """英語は4文字ごと、日本語と記号は1文字ごとに数えることのテスト"""
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("hello world") == 4
+    assert estimate_tokens("今日は晴れ。") == 6
+
+
+def test_split_sentences_keeps_text():
+    """文に分けてつなげると元の文字列に戻ることのテスト"""
+    text = "朝は雨だった。昼は晴れた！\n夜は星が見えた。 Good night. end"
+    sentences = split_sentences(text)
+    assert "".join(sentences) == text
+    assert sentences[0] == "朝は雨だった。"
+    assert sentences[-2:] == ["Good night. ", "end"]
+
+
+def test_prepare_input_short_text_unchanged():
+    """上限以下の入力はそのまま返すことのテスト"""
+    with patch("common.prompt_input.put_metrics") as mock_put_metrics:
+        assert prepare_input("今日は晴れ。", "title", budget=100) == "今日は晴れ。"
+    mock_put_metrics.assert_called_once_with(
+        {"InputTokens": 6, "PreparedInputTokens": 6, "InputTrimmed": 0},
+        dimensions={"UseCase": "title"},
+    )
+
+
+def test_prepare_input_summarizes_long_text():
+    """長い入力は上限内に収まる文を元の順に選ぶことのテスト"""
+    text = (
+        "今日は公園で桜を見た。"
+        + "".join(f"メモ{i}。" for i in range(50))
+        + "桜がとてもきれいで、また公園に桜を見に行きたい。"
+    )
+    with patch("common.prompt_input.put_metrics") as mock_put_metrics:
+        prepared = prepare_input(text, "title", budget=40)
+
+    assert estimate_tokens(prepared) <= 40
+    assert prepared.startswith("今日は公園で桜を見た。")
+    assert prepared.endswith("また公園に桜を見に行きたい。")
+    metrics = mock_put_metrics.call_args.args[0]
+    assert metrics["InputTokens"] == estimate_tokens(text)
+    assert metrics["InputTrimmed"] == 1
+
+
+def test_summarize_truncates_single_long_sentence():
+    """1文も収まらない場合は先頭から切り詰めることのテスト"""
+    text = "あ" * 100
+    assert summarize(text, 10) == "あ" * 10
+    assert truncate("hello world", 2) == "hello "
+
+
+def test_get_token_budget_per_use_case():
+    """用途ごとの上限と環境変数による上書きのテスト"""
+    assert get_token_budget("title") < get_token_budget("flower")
+    with patch.dict(os.environ, {"TITLE_INPUT_TOKEN_BUDGET": "64"}):
+        assert get_token_budget("title") == 64
+
+
+def test_get_token_counter_registered_and_fallback():
+    """登録した数え方を使い、読み込めない場合は見積もりを使うことのテスト"""
+    register_token_counter("chars", len)
+    assert get_token_counter("chars")("abc") == 3
+    assert get_token_counter("unknown") is estimate_tokens
+    with patch.dict(os.environ, {"TOKEN_COUNTER": "chars"}):
+        assert get_token_counter() is len
+
+
+def test_record_usage():
+    """応答の実際のトークン数をメトリクスとして出力することのテスト"""
+    with patch("common.prompt_input.put_metrics") as mock_put_metrics:
+        record_usage("title", {"prompt_tokens": 120, "completion_tokens": 8})
+        record_usage("title", None)
+
+    mock_put_metrics.assert_called_once_with(
+        {"PromptTokens": 120, "CompletionTokens": 8},
+        dimensions={"UseCase": "title"},
+    )
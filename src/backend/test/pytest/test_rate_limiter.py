@@ -0,0 +1,128 @@
+from unittest.mock import MagicMock, patch
+
+import boto3
+import pytest
+from botocore.exceptions import ClientError
+from common.rate_limiter import RateLimiter, RateLimitExceededError
+from moto import mock_aws
+
+
+@pytest.fixture
+def dynamodb():
+    """moto の外部APIの状態テーブルを返す"""
+    with mock_aws():
+        resource = boto3.resource("dynamodb", region_name="ap-northeast-1")
+        resource.create_table(
+            TableName="external-api-state",
+            KeySchema=[{"AttributeName": "name", "KeyType": "HASH"}],
+            AttributeDefinitions=[{"AttributeName": "name", "AttributeType": "S"}],
+            BillingMode="PAY_PER_REQUEST",
+        )
+        yield resource
+
+
+@pytest.fixture(autouse=True)
+def mock_metrics():
+    with patch("common.rate_limiter.put_metrics") as mock_metrics:
+        yield mock_metrics
+
+
+def make_limiter(dynamodb, rate=1, capacity=4, block_size=2):
+    return RateLimiter(
+        "dify",
+        "external-api-state",
+        rate=rate,
+        capacity=capacity,
+        block_size=block_size,
+        dynamodb=dynamodb,
+    )
+
+
+def stored_tokens(dynamodb):
+    item = dynamodb.Table("external-api-state").get_item(
+        Key={"name": "ratelimit#dify"}
+    )["Item"]
+    return float(item["tokens"])
+
+
+def test_reserves_tokens_in_blocks(dynamodb):
+    """トークンをまとめて予約し、予約の残りはDynamoDBを読み書きせずに使うことのテスト"""
+    limiter = make_limiter(dynamodb)
+
+    with patch.object(limiter, "_write", wraps=limiter._write) as write:
+        for _ in range(4):
+            assert limiter.try_acquire() == 0
+
+    assert write.call_count == 2
+    assert stored_tokens(dynamodb) == pytest.approx(0, abs=0.1)
+
+
+def test_degrades_without_deadline(dynamodb, mock_metrics):
+    """トークンが足りない場合、上限の時刻がなければすぐに失敗することのテスト"""
+    limiter = make_limiter(dynamodb, capacity=1, block_size=1)
+    limiter.acquire()
+
+    with pytest.raises(RateLimitExceededError):
+        limiter.acquire()
+    mock_metrics.assert_called_once_with(
+        {"RateLimited": 1}, dimensions={"Client": "dify"}
+    )
+
+
+@patch("common.rate_limiter.time.sleep")
+def test_waits_until_deadline(mock_sleep, dynamodb):
+    """トークンが足りない場合、補充されるまでの見込み時間だけ上限の時刻まで待つことのテスト"""
+    limiter = make_limiter(dynamodb, capacity=1, block_size=1)
+    limiter.acquire()
+
+    with patch.object(limiter, "try_acquire", side_effect=[0.5, 0]):
+        limiter.acquire(deadline=float("inf"))
+    mock_sleep.assert_called_once_with(0.5)
+
+    with patch("common.rate_limiter.time.monotonic", return_value=100.0):
+        with pytest.raises(RateLimitExceededError):
+            limiter.acquire(deadline=100.0)
+
+
+def test_containers_share_the_bucket(dynamodb):
+    """複数のコンテナの取り出しが交互に競合しても、合計がバケットのトークン数を超えないことのテスト"""
+    # moto の条件付き書き込みはスレッド間で不可分ではないため、コンテナを順番に交互に実行する
+    limiters = [make_limiter(dynamodb, rate=0.001, capacity=10) for _ in range(4)]
+    acquired = 0
+    for _ in range(10):
+        for limiter in limiters:
+            if limiter.try_acquire() == 0:
+                acquired += 1
+
+    assert acquired == 10
+    assert stored_tokens(dynamodb) == pytest.approx(0, abs=0.1)
+
+
+def test_conflict_rereads_state(dynamodb):
+    """他のコンテナが先に書き込んだ場合は状態を読み直して取り出すことのテスト"""
+    first = make_limiter(dynamodb, block_size=1)
+    second = make_limiter(dynamodb, block_size=1)
+    assert first.try_acquire() == 0
+    assert second.try_acquire() == 0
+    # first の知っている状態は second の書き込みで古くなっている
+    assert first.try_acquire() == 0
+
+    assert stored_tokens(dynamodb) == pytest.approx(1, abs=0.1)
+
+
+def test_fails_open_on_dynamodb_error():
+    """DynamoDBにアクセスできない場合は呼び出しを止めないことのテスト"""
+    dynamodb = MagicMock()
+    dynamodb.Table.return_value.get_item.side_effect = ClientError(
+        {"Error": {"Code": "ResourceNotFoundException"}}, "GetItem"
+    )
+    limiter = make_limiter(dynamodb)
+
+    limiter.acquire()
+
+
+def test_disabled_without_table():
+    """テーブル名が未設定か rate が0の場合は無効となることのテスト"""
+    assert not RateLimiter("dify", None, rate=1).enabled
+    assert not RateLimiter("dify", "external-api-state", rate=0).enabled
+    RateLimiter("dify", None, rate=1).acquire()
@@ -0,0 +1,80 @@
+from unittest.mock import MagicMock, patch
+
+import pytest
+from botocore.exceptions import ClientError
+from common.secrets import SecretsProvider
+
+
+def parameter(value):
+    """get_parameter のレスポンスを返す"""
+    return {"Parameter": {"Value": value}}
+
+
+def client_error(code):
+    return ClientError({"Error": {"Code": code, "Message": code}}, "GetParameter")
+
+
+@pytest.fixture
+def ssm():
+    client = MagicMock()
+    client.get_parameter.return_value = parameter("secret-1")
+    return client
+
+
+@patch("common.secrets.time.monotonic")
+def test_value_is_cached_until_refresh_window(mock_monotonic, ssm):
+    """有効期間中はSSMを呼び出さずに保持した値を返すことのテスト"""
+    provider = SecretsProvider(ssm_client=ssm, ttl=300, refresh_ahead=60)
+
+    mock_monotonic.return_value = 0
+    assert provider.get("DIFY_API_KEY") == "secret-1"
+    mock_monotonic.return_value = 200
+    assert provider.get("DIFY_API_KEY") == "secret-1"
+
+    ssm.get_parameter.assert_called_once_with(Name="DIFY_API_KEY", WithDecryption=True)
+
+
+@patch("common.secrets.threading.Thread")
+@patch("common.secrets.time.monotonic")
+def test_refresh_in_background_near_expiry(mock_monotonic, mock_thread, ssm):
+    """有効期限が近い場合は現在の値を返し、バックグラウンドで更新することのテスト"""
+    provider = SecretsProvider(ssm_client=ssm, ttl=300, refresh_ahead=60)
+    mock_monotonic.return_value = 0
+    provider.get("DIFY_API_KEY")
+
+    ssm.get_parameter.return_value = parameter("secret-2")
+    mock_monotonic.return_value = 250
+    assert provider.get("DIFY_API_KEY") == "secret-1"
+    assert provider.get("DIFY_API_KEY") == "secret-1"
+    # 更新中は新たなスレッドを開始しない
+    mock_thread.assert_called_once()
+
+    # スレッドの処理を実行すると新しい値に置き換わる
+    provider._refresh(*mock_thread.call_args.kwargs["args"])
+    assert provider.get("DIFY_API_KEY") == "secret-2"
+
+
+@patch("common.secrets.time.monotonic")
+def test_fallback_to_cached_value_when_throttled(mock_monotonic, ssm):
+    """スロットリング時は前回の値を返し、それ以外のエラーは送出することのテスト"""
+    provider = SecretsProvider(ssm_client=ssm, ttl=300, refresh_ahead=60)
+    ssm.get_parameter.side_effect = client_error("ThrottlingException")
+
+    mock_monotonic.return_value = 0
+    with pytest.raises(ClientError):
+        provider.get("DIFY_API_KEY")
+
+    ssm.get_parameter.side_effect = None
+    provider.get("DIFY_API_KEY")
+
+    ssm.get_parameter.side_effect = client_error("ThrottlingException")
+    mock_monotonic.return_value = 400
+    assert provider.get("DIFY_API_KEY") == "secret-1"
+    # 直後の呼び出しではSSMを再び呼び出さない
+    assert provider.get("DIFY_API_KEY") == "secret-1"
+    assert ssm.get_parameter.call_count == 3
+
+    ssm.get_parameter.side_effect = client_error("ParameterNotFound")
+    mock_monotonic.return_value = 1000
+    with pytest.raises(ClientError):
+        provider.get("DIFY_API_KEY")
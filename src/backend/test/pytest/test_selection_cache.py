@@ -0,0 +1,67 @@
+from unittest.mock import patch
+
+import boto3
+import pytest
+from common.selection_cache import SelectionCache, content_hash
+from moto import mock_aws
+
+
+@pytest.fixture
+def dynamodb():
+    """moto の選択結果キャッシュテーブルを返す"""
+    with mock_aws():
+        resource = boto3.resource("dynamodb", region_name="ap-northeast-1")
+        resource.create_table(
+            TableName="flower-cache",
+            KeySchema=[{"AttributeName": "content_hash", "KeyType": "HASH"}],
+            AttributeDefinitions=[
+                {"AttributeName": "content_hash", "AttributeType": "S"}
+            ],
+            BillingMode="PAY_PER_REQUEST",
+        )
+        yield resource
+
+
+def test_content_hash_normalizes_content():
+    """全角・半角や空白の違いを同一視することのテスト"""
+    assert content_hash("  今日は　特になし\n") == content_hash("今日は 特になし")
+    assert content_hash("ＡＢＣ") == content_hash("abc")
+    assert content_hash("今日は特になし") != content_hash("今日は晴れ")
+
+
+@patch("common.selection_cache.put_metrics")
+def test_hit_and_miss(mock_metrics, dynamodb):
+    """保存した選択結果をテーブルから返し、ヒット・ミスを数えることのテスト"""
+    cache = SelectionCache("flower-cache", dynamodb=dynamodb, lru_size=0)
+
+    assert cache.get("今日は特になし") is None
+    cache.put("今日は特になし", "lily1")
+    assert cache.get("今日は 特になし") == "lily1"
+
+    assert cache.stats == {"lru_hits": 0, "hits": 1, "misses": 1}
+    names = [list(call.args[0])[0] for call in mock_metrics.call_args_list]
+    assert names == ["FlowerCacheMiss", "FlowerCacheHit"]
+
+
+@patch("common.selection_cache.put_metrics")
+def test_lru_in_front_of_table(mock_metrics, dynamodb):
+    """コンテナ内のLRUにある結果はテーブルを読まずに返し、上限を超えたら破棄することのテスト"""
+    cache = SelectionCache("flower-cache", dynamodb=dynamodb, lru_size=1)
+    cache.put("日記1", "lily1")
+    cache.put("日記2", "rose1")
+
+    with patch.object(SelectionCache, "table") as table:
+        table.get_item.return_value = {}
+        assert cache.get("日記2") == "rose1"
+        assert cache.get("日記1") is None
+
+    assert cache.stats == {"lru_hits": 1, "hits": 0, "misses": 1}
+
+
+@patch("common.selection_cache.put_metrics")
+def test_expired_item_is_a_miss(mock_metrics, dynamodb):
+    """TTLを過ぎたアイテムは削除前でもミスとすることのテスト"""
+    cache = SelectionCache("flower-cache", dynamodb=dynamodb, ttl_seconds=0, lru_size=0)
+    cache.put("今日は特になし", "lily1")
+
+    assert cache.get("今日は特になし") is None
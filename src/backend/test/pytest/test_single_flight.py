@@ -0,0 +1,242 @@
+import threading
+import time
+from unittest.mock import MagicMock, patch
+
+import boto3
+import pytest
+from botocore.exceptions import ClientError
+from common.single_flight import SingleFlight, _Call
+from moto import mock_aws
+
+
+@pytest.fixture
+def dynamodb():
+    """moto の外部APIの状態テーブルを返す"""
+    with mock_aws():
+        resource = boto3.resource("dynamodb", region_name="ap-northeast-1")
+        resource.create_table(
+            TableName="external-api-state",
+            KeySchema=[{"AttributeName": "name", "KeyType": "HASH"}],
+            AttributeDefinitions=[{"AttributeName": "name", "AttributeType": "S"}],
+            BillingMode="PAY_PER_REQUEST",
+        )
+        yield resource
+
+
+@pytest.fixture(autouse=True)
+def mock_metrics():
+    with patch("common.single_flight.put_metrics") as mock_metrics:
+        yield mock_metrics
+
+
+def make_flight(dynamodb, wait_seconds=5):
+    flight = SingleFlight(
+        "title",
+        "external-api-state",
+        lease_seconds=30,
+        wait_seconds=wait_seconds,
+        result_seconds=60,
+        dynamodb=dynamodb,
+    )
+    flight.poll_seconds = 0.01
+    return flight
+
+
+class CountingEvent(threading.Event):
+    """wait を呼び出したスレッドの数を数えるイベント"""
+
+    def __init__(self):
+        super().__init__()
+        self.waiters = 0
+
+    def wait(self, timeout=None):
+        self.waiters += 1
+        return super().wait(timeout)
+
+
+class CountingCall(_Call):
+    def __init__(self):
+        super().__init__()
+        self.done = CountingEvent()
+
+
+@pytest.fixture(autouse=True)
+def counting_call():
+    with patch("common.single_flight._Call", CountingCall):
+        yield
+
+
+def wait_for_followers(flight, key, count):
+    """実行中の呼び出しを count 個の呼び出しが待つまで待つ"""
+    event = flight._calls[key].done
+    while event.waiters < count:
+        time.sleep(0.001)
+
+
+def metric_totals(mock_metrics):
+    totals = {}
+    for call in mock_metrics.call_args_list:
+        for name, value in call.args[0].items():
+            totals[name] = totals.get(name, 0) + value
+    return totals
+
+
+def stored_item(dynamodb, key):
+    return (
+        dynamodb.Table("external-api-state")
+        .get_item(Key={"name": f"singleflight#title#{key}"})
+        .get("Item")
+    )
+
+
+def test_coalesces_calls_in_container(mock_metrics):
+    """コンテナ内の同じキーの同時の呼び出しは1回にまとめ、結果を使い回すことのテスト"""
+    flight = SingleFlight("title", None)
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def fn():
+        calls.append(1)
+        started.set()
+        release.wait()
+        return "晴れた日"
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(flight.do("key", fn)))
+    leader.start()
+    started.wait()
+    followers = [
+        threading.Thread(target=lambda: results.append(flight.do("key", fn)))
+        for _ in range(3)
+    ]
+    for thread in followers:
+        thread.start()
+    wait_for_followers(flight, "key", 3)
+    release.set()
+    for thread in [leader, *followers]:
+        thread.join()
+
+    assert len(calls) == 1
+    assert results == ["晴れた日"] * 4
+    totals = metric_totals(mock_metrics)
+    assert totals["SingleFlightCalls"] == 4
+    assert totals["SingleFlightCoalescedInContainer"] == 3
+
+
+def test_shares_error_in_container():
+    """実行中の呼び出しが失敗した場合は、待っていた呼び出しにも同じ例外を送出することのテスト"""
+    flight = SingleFlight("title", None)
+    started = threading.Event()
+    release = threading.Event()
+
+    def fn():
+        started.set()
+        release.wait()
+        raise ValueError("API error")
+
+    errors = []
+
+    def run():
+        try:
+            flight.do("key", fn)
+        except ValueError as e:
+            errors.append(e)
+
+    leader = threading.Thread(target=run)
+    leader.start()
+    started.wait()
+    follower = threading.Thread(target=run)
+    follower.start()
+    wait_for_followers(flight, "key", 1)
+    release.set()
+    leader.join()
+    follower.join()
+
+    assert len(errors) == 2
+    # 完了した呼び出しは次の呼び出しに使い回さない
+    assert flight.do("key", lambda: "retry") == "retry"
+
+
+def test_reuses_result_from_another_container(dynamodb, mock_metrics):
+    """他のコンテナがリースを持っている場合は、保存された結果を待って使い回すことのテスト"""
+    other = make_flight(dynamodb)
+    flight = make_flight(dynamodb)
+    assert other._acquire("key", "other-owner")
+
+    def complete():
+        time.sleep(0.05)
+        other._complete("key", "other-owner", ["晴れた日", "lily"])
+
+    thread = threading.Thread(target=complete)
+    thread.start()
+    fn = MagicMock()
+    result = flight.do("key", fn)
+    thread.join()
+
+    assert result == ["晴れた日", "lily"]
+    fn.assert_not_called()
+    mock_metrics.assert_called_once_with(
+        {
+            "SingleFlightCalls": 1,
+            "SingleFlightCoalescedInContainer": 0,
+            "SingleFlightCoalescedByLease": 1,
+            "SingleFlightLeaseTimeout": 0,
+        },
+        dimensions={"Operation": "title"},
+    )
+
+
+def test_saves_result_for_other_containers(dynamodb):
+    """リースを取得したコンテナは結果を保存し、他のコンテナが使い回せることのテスト"""
+    flight = make_flight(dynamodb)
+    assert flight.do("key", lambda: "晴れた日") == "晴れた日"
+
+    item = stored_item(dynamodb, "key")
+    assert item["result"] == '"晴れた日"'
+    assert "lease_expires_at" not in item
+    fn = MagicMock()
+    assert make_flight(dynamodb).do("key", fn) == "晴れた日"
+    fn.assert_not_called()
+
+
+def test_failure_releases_lease(dynamodb):
+    """呼び出しが失敗した場合はリースを削除し、他のコンテナが呼び出せるようにすることのテスト"""
+    flight = make_flight(dynamodb)
+    with pytest.raises(ValueError):
+        flight.do("key", MagicMock(side_effect=ValueError("API error")))
+
+    assert stored_item(dynamodb, "key") is None
+
+
+def test_takes_over_expired_lease(dynamodb):
+    """結果が保存されないままリースが切れた場合は引き継いで呼び出すことのテスト"""
+    dynamodb.Table("external-api-state").put_item(
+        Item={
+            "name": "singleflight#title#key",
+            "owner": "crashed-owner",
+            "lease_expires_at": int(time.time()) - 1,
+            "expires_at": int(time.time()) + 60,
+        }
+    )
+
+    assert make_flight(dynamodb).do("key", lambda: "晴れた日") == "晴れた日"
+    assert stored_item(dynamodb, "key")["result"] == '"晴れた日"'
+
+
+def test_calls_after_wait_timeout(dynamodb, mock_metrics):
+    """待つ上限までに他のコンテナの結果が保存されない場合は自分で呼び出すことのテスト"""
+    assert make_flight(dynamodb)._acquire("key", "other-owner")
+
+    assert make_flight(dynamodb, wait_seconds=0).do("key", lambda: "雨") == "雨"
+    assert metric_totals(mock_metrics)["SingleFlightLeaseTimeout"] == 1
+
+
+def test_fails_open_on_dynamodb_error():
+    """DynamoDBにアクセスできない場合は自分で呼び出すことのテスト"""
+    dynamodb = MagicMock()
+    dynamodb.Table.return_value.put_item.side_effect = ClientError(
+        {"Error": {"Code": "ResourceNotFoundException"}}, "PutItem"
+    )
+
+    assert make_flight(dynamodb).do("key", lambda: "晴れた日") == "晴れた日"
@@ -1,11 +1,14 @@
 import json
 import os
-from unittest.mock import patch
+from unittest.mock import ANY, MagicMock, patch
 
 import pytest
+from common.idempotency import request_fingerprint
 from title_generate.title_generate import (
+    content_fingerprint,
     generate_title_from_content,
     get_parameter_from_parameter_store,
+    lambda_handler,
     save_title_to_dynamodb,
     send_request_to_openai_api,
 )
@@ -61,6 +64,26 @@ def test_save_title_to_dynamodb(dynamodb_record):
         )
 
 
+def test_save_title_to_dynamodb_with_fingerprint(dynamodb_record):
+    """タイトルと一緒に日記の内容のフィンガープリントを保存するテスト"""
+    with patch("boto3.resource") as mock_dynamodb_resource, patch.dict(
+        os.environ, {"TABLE_NAME": "test-table"}
+    ):
+        table = mock_dynamodb_resource.return_value.Table.return_value
+        save_title_to_dynamodb("A joyful day", dynamodb_record, "abc")
+        table.update_item.assert_called_once_with(
+            Key={"user_id": "test-user-id", "date": "2024-03-15"},
+            UpdateExpression="set title = :t, content_fingerprint = :f",
+            ExpressionAttributeValues={":t": "A joyful day", ":f": "abc"},
+        )
+
+
+def test_content_fingerprint():
+    """表記の違いではフィンガープリントが変わらず、内容が変わると変わることのテスト"""
+    assert content_fingerprint(" 今日は晴れ\n") == content_fingerprint("今日は晴れ")
+    assert content_fingerprint("今日は晴れ") != content_fingerprint("今日は雨")
+
+
 # Test for get_parameter_from_parameter_store
 def test_get_parameter_from_parameter_store():
     """パラメータストアからAPIキーを取得するテスト"""
@@ -92,11 +115,189 @@ def test_send_request_to_openai_api():
         "temperature": 0.7,
     }
 
-    with patch("urllib.request.urlopen") as mock_urlopen:
-        mock_urlopen.return_value.read.return_value = json.dumps(
+    with patch("common.openai_chat.openai_client.session.post") as mock_post:
+        mock_post.return_value.status_code = 200
+        mock_post.return_value.text = json.dumps(
             {"choices": [{"message": {"content": "A joyful day"}}]}
-        ).encode("utf-8")
+        )
         response = send_request_to_openai_api(api_endpoint, api_key, request_data)
         assert (
             json.loads(response)["choices"][0]["message"]["content"] == "A joyful day"
         )
+    assert mock_post.call_args.kwargs["json"] == request_data
+    assert (
+        mock_post.call_args.kwargs["headers"]["Authorization"] == "Bearer fake-api-key"
+    )
+
+
+@patch("common.http_client.time.sleep")
+def test_send_request_to_openai_api_retries_rate_limit(mock_sleep):
+    """429 は Retry-After の時間を待ってから再試行することのテスト"""
+    rate_limited = MagicMock(status_code=429, headers={"Retry-After": "2"})
+    succeeded = MagicMock(status_code=200, text='{"choices": []}', headers={})
+
+    with patch(
+        "common.openai_chat.openai_client.session.post",
+        side_effect=[rate_limited, succeeded],
+    ) as mock_post:
+        response = send_request_to_openai_api("https://example.com", "key", {})
+
+    assert response == '{"choices": []}'
+    assert mock_post.call_count == 2
+    assert mock_sleep.call_args.args[0] >= 2
+
+
+def make_stream_record(date, event_name="INSERT", content="日記", old_content=None):
+    """テスト用の DynamoDB ストリームのレコードを作成"""
+    record = {
+        "eventName": event_name,
+        "dynamodb": {
+            "Keys": {"user_id": {"S": "test-user-id"}, "date": {"S": date}},
+            "NewImage": {
+                "user_id": {"S": "test-user-id"},
+                "date": {"S": date},
+                "content": {"S": content},
+            },
+            "SequenceNumber": f"seq-{date}",
+        },
+    }
+    if old_content is not None:
+        record["dynamodb"]["OldImage"] = {
+            "user_id": {"S": "test-user-id"},
+            "date": {"S": date},
+            "content": {"S": old_content},
+        }
+    return record
+
+
+def make_context(remaining_ms=60_000):
+    """テスト用の Lambda 実行コンテキストを作成"""
+    context = MagicMock()
+    context.get_remaining_time_in_millis.return_value = remaining_ms
+    return context
+
+
+@patch("title_generate.title_generate.get_saved_fingerprint", return_value=None)
+@patch("title_generate.title_generate.save_title_to_dynamodb")
+@patch("title_generate.title_generate.generate_title_from_content")
+def test_lambda_handler_processes_all_records(mock_generate, mock_save, _):
+    """バッチ内のすべてのレコードを処理し、失敗したレコードだけを返すことのテスト"""
+
+    def generate(content):
+        if content == "失敗":
+            raise RuntimeError("OpenAI error")
+        return f"title: {content}"
+
+    mock_generate.side_effect = generate
+    event = {
+        "Records": [
+            make_stream_record("2024-03-15", content="晴れ"),
+            make_stream_record("2024-03-16", content="失敗"),
+            make_stream_record("2024-03-17", event_name="REMOVE"),
+            make_stream_record("2024-03-18", content="雨"),
+        ]
+    }
+
+    response = lambda_handler(event, make_context())
+
+    assert response == {"batchItemFailures": [{"itemIdentifier": "seq-2024-03-16"}]}
+    saved = sorted(call.args[0] for call in mock_save.call_args_list)
+    assert saved == ["title: 晴れ", "title: 雨"]
+
+
+@patch("title_generate.title_generate.get_saved_fingerprint", return_value=None)
+@patch("title_generate.title_generate.generate_title_from_content")
+def test_lambda_handler_not_enough_time(mock_generate, _):
+    """残り時間が足りない場合はレコードを処理せずに再試行させることのテスト"""
+    event = {"Records": [make_stream_record("2024-03-15")]}
+
+    response = lambda_handler(event, make_context(remaining_ms=1_000))
+
+    assert response == {"batchItemFailures": [{"itemIdentifier": "seq-2024-03-15"}]}
+    mock_generate.assert_not_called()
+
+
+@patch("title_generate.title_generate.save_title_to_dynamodb")
+@patch("title_generate.title_generate.generate_title_from_content")
+def test_lambda_handler_skips_unchanged_content(mock_generate, mock_save):
+    """内容が変わっていない更新ではタイトルを生成しないことのテスト"""
+    saved = content_fingerprint("晴れ")
+    event = {
+        "Records": [
+            # 削除フラグだけの更新など、内容が変わっていない
+            make_stream_record("2024-03-15", "MODIFY", "曇り", old_content="曇り"),
+            # 前回タイトルを生成したときと同じ内容
+            make_stream_record("2024-03-16", "INSERT", "晴れ"),
+            # 内容が編集された
+            make_stream_record("2024-03-17", "MODIFY", "雨", old_content="晴れ"),
+        ]
+    }
+    mock_generate.return_value = "rainy day"
+
+    with patch(
+        "title_generate.title_generate.get_saved_fingerprint",
+        side_effect=lambda record: saved,
+    ) as mock_get_saved:
+        response = lambda_handler(event, make_context())
+
+    assert response == {"batchItemFailures": []}
+    assert mock_get_saved.call_count == 2
+    mock_generate.assert_called_once_with("雨")
+    mock_save.assert_called_once_with(
+        "rainy day", event["Records"][2], content_fingerprint("雨")
+    )
+
+
+@patch.dict(os.environ, {"DIARY_ANALYSIS_MODE": "combined"})
+@patch("title_generate.title_generate.time.sleep")
+@patch("title_generate.title_generate.save_title_to_dynamodb")
+@patch("title_generate.title_generate.generate_title_from_content")
+def test_lambda_handler_waits_for_combined_title(mock_generate, mock_save, _):
+    """combined の場合、花の選択と一緒に保存されるタイトルを待ってから生成することのテスト"""
+    fingerprint = content_fingerprint("晴れ")
+    event = {"Records": [make_stream_record("2024-03-15", "INSERT", "晴れ")]}
+
+    with patch(
+        "title_generate.title_generate.get_saved_fingerprint",
+        side_effect=[None, None, fingerprint],
+    ):
+        response = lambda_handler(event, make_context())
+
+    assert response == {"batchItemFailures": []}
+    mock_generate.assert_not_called()
+
+    # 上限まで保存されない場合は自分で生成する
+    mock_generate.return_value = "sunny day"
+    with patch(
+        "title_generate.title_generate.get_saved_fingerprint", return_value=None
+    ), patch.dict(os.environ, {"COMBINED_TITLE_WAIT_SECONDS": "0"}):
+        response = lambda_handler(event, make_context())
+
+    assert response == {"batchItemFailures": []}
+    mock_save.assert_called_once_with("sunny day", event["Records"][0], fingerprint)
+
+
+@patch("title_generate.title_generate.get_saved_fingerprint", return_value=None)
+@patch("title_generate.title_generate.save_title_to_dynamodb")
+@patch("title_generate.title_generate.generate_title_from_content")
+def test_lambda_handler_coalesces_same_content(mock_generate, mock_save, _):
+    """同じ日記の同じ内容のタイトル生成は、同じキーで1回にまとめることのテスト"""
+    event = {
+        "Records": [
+            make_stream_record("2024-03-15", "INSERT", "晴れ"),
+            make_stream_record("2024-03-15", "MODIFY", "晴れ", old_content="曇り"),
+        ]
+    }
+
+    with patch(
+        "title_generate.title_generate.title_flight.do", return_value="sunny day"
+    ) as mock_do:
+        response = lambda_handler(event, make_context())
+
+    assert response == {"batchItemFailures": []}
+    keys = {call.args[0] for call in mock_do.call_args_list}
+    assert keys == {
+        request_fingerprint("test-user-id", "2024-03-15", content_fingerprint("晴れ"))
+    }
+    assert mock_save.call_count == 2
+    mock_save.assert_called_with("sunny day", ANY, content_fingerprint("晴れ"))
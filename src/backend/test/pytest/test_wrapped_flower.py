@@ -0,0 +1,121 @@
+import json
+from io import BytesIO
+from unittest.mock import MagicMock
+
+from botocore.exceptions import ClientError
+from common.wrapped_flower import (
+    MANIFEST_KEY,
+    WrappedFlowerStore,
+    compose_wrapped_flower,
+    prerender_wrapped_flowers,
+    variant_key,
+)
+from PIL import Image
+
+
+def png_bytes(size, color):
+    """テスト用のPNG画像のバイト列を返す"""
+    buffer = BytesIO()
+    Image.new("RGBA", size, color).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def test_compose_wrapped_flower():
+    """包装紙と花を700x700のパレットに合成するテスト"""
+    flower = Image.new("RGBA", (50, 100), (0, 0, 255, 255))
+    wraper_front = Image.new("RGBA", (100, 20), (255, 0, 0, 255))
+    wraper_back = Image.new("RGBA", (100, 200), (0, 255, 0, 255))
+
+    result = compose_wrapped_flower(flower, wraper_front, wraper_back)
+
+    assert result.size == (700, 700)
+    assert result.getpixel((0, 0)) == (0, 0, 0, 0)
+    # 花は上端に中央揃えで配置される
+    assert result.getpixel((350, 10)) == (0, 0, 255, 255)
+    # 前面の包装紙が最前面に来る
+    assert result.getpixel((350, 80)) == (255, 0, 0, 255)
+    # 背面の包装紙は花の下に隠れていない部分だけ見える
+    assert result.getpixel((310, 150)) == (0, 255, 0, 255)
+
+
+def test_variant_key():
+    """事前レンダリング画像のキーのテスト"""
+    key = variant_key("lily1", "wrapers_front/front1.png", "wrapers_back/back2.png")
+    assert key == "wrapped_flowers/lily1/front1__back2.png"
+
+
+def test_prerender_wrapped_flowers():
+    """全組み合わせの画像とマニフェストを保存するテスト"""
+    s3 = MagicMock()
+    listings = {
+        "single_flowers/": ["single_flowers/lily1.png", "single_flowers/tulip1.png"],
+        "wrapers_front/": ["wrapers_front/front1.png"],
+        "wrapers_back/": ["wrapers_back/back1.png", "wrapers_back/back2.png"],
+    }
+    s3.list_objects_v2.side_effect = lambda Bucket, Prefix: {
+        "Contents": [{"Key": key} for key in listings[Prefix]]
+    }
+    s3.get_object.side_effect = lambda Bucket, Key: {
+        "Body": BytesIO(png_bytes((10, 10), (255, 0, 0, 255)))
+    }
+
+    variants = prerender_wrapped_flowers("source-bucket", "cache-bucket", s3_client=s3)
+
+    assert variants == {
+        "lily1": [
+            "wrapped_flowers/lily1/front1__back1.png",
+            "wrapped_flowers/lily1/front1__back2.png",
+        ],
+        "tulip1": [
+            "wrapped_flowers/tulip1/front1__back1.png",
+            "wrapped_flowers/tulip1/front1__back2.png",
+        ],
+    }
+    # 元画像は1回ずつしか取得しない
+    assert s3.get_object.call_count == 5
+    put_keys = [call.kwargs["Key"] for call in s3.put_object.call_args_list]
+    assert put_keys[-1] == MANIFEST_KEY
+    assert len(put_keys) == 5
+    manifest = json.loads(s3.put_object.call_args_list[-1].kwargs["Body"])
+    assert manifest["variants"] == variants
+
+
+def test_store_get_variant():
+    """マニフェストに登録された画像を取得するテスト"""
+    s3 = MagicMock()
+    image = png_bytes((10, 10), (0, 0, 255, 255))
+    manifest = {"variants": {"lily1": ["wrapped_flowers/lily1/front1__back1.png"]}}
+    objects = {
+        MANIFEST_KEY: json.dumps(manifest).encode("utf-8"),
+        "wrapped_flowers/lily1/front1__back1.png": image,
+    }
+    s3.get_object.side_effect = lambda Bucket, Key: {"Body": BytesIO(objects[Key])}
+    store = WrappedFlowerStore("cache-bucket", s3_client=s3, manifest_ttl=300)
+
+    assert store.get_variant("lily1") == image
+    assert store.get_variant("lily1") == image
+    assert store.get_variant("tulip1") is None
+
+    # マニフェストはTTLの間は再取得しない
+    keys = [call.kwargs["Key"] for call in s3.get_object.call_args_list]
+    assert keys.count(MANIFEST_KEY) == 1
+
+
+def test_store_without_manifest():
+    """マニフェストが無い場合はNoneを返すテスト"""
+    s3 = MagicMock()
+    s3.get_object.side_effect = ClientError(
+        {"Error": {"Code": "NoSuchKey", "Message": "Not Found"}}, "GetObject"
+    )
+    store = WrappedFlowerStore("cache-bucket", s3_client=s3)
+
+    assert store.get_variant("lily1") is None
+
+
+def test_store_disabled():
+    """バケット名が未設定の場合はS3を呼び出さないテスト"""
+    s3 = MagicMock()
+    store = WrappedFlowerStore(None, s3_client=s3)
+
+    assert store.get_variant("lily1") is None
+    s3.get_object.assert_not_called()
@@ -17,6 +17,14 @@ test('Snapshot test', () => {
 
   const template = Template.fromStack(stack)
 
+  // API Gateway のデプロイは API 定義のハッシュが論理IDに付くため、ダミー値に置き換える
+  const normalized = JSON.parse(
+    JSON.stringify(template.toJSON()).replace(
+      /(Deployment[A-F0-9]{8})[a-f0-9]{32}/g,
+      '$1HASH_REPLACED',
+    ),
+  )
+
   expect.addSnapshotSerializer(serializer) // シリアライザーを追加
-  expect(template).toMatchSnapshot()
+  expect(normalized).toMatchSnapshot()
 })